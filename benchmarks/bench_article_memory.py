@@ -0,0 +1,128 @@
+"""
+
+    ***Article memory benchmark***
+    Measures the peak memory (RSS) of holding a run's worth of fetched and parsed articles, as
+    urls_to_parsed_articles() does before check_articles() stores them, comparing:
+        legacy  - the response decoded to a string first, a __dict__ per Article and the soup
+                  kept alive on every article
+        current - the response bytes parsed directly, __slots__ and the soup freed after parsing
+
+    Each mode runs in its own fresh process so one can't affect the other's peak. Linux/macOS
+    only (uses the resource module).
+
+    Usage (from the benchmarks folder):
+        python bench_article_memory.py [--articles N] [--paragraphs N] [--json out.json]
+
+"""
+
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+import bs4
+
+from fixtures import make_rng, make_article_html
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'news_updates_monitor')
+    )
+# Disabling Pylint as it cannot detect the system path hacked local module
+# pylint: disable-next=import-error,wrong-import-position
+from article import Article
+
+MODES = ('legacy', 'current')
+
+
+class LegacyArticle(Article):
+    """ Article as it was before __slots__: subclassing without __slots__ gives every object a
+        __dict__ again, and parse_all() keeps the soup
+    """
+
+    def parse_all(self, encoding='utf-8'):
+        """ The original parse_all(), on a string and keeping the soup """
+        self.soup = bs4.BeautifulSoup(self.raw_html, 'lxml')
+        self.parse_headline()
+        self.parse_body()
+        self.parse_byline()
+        self.parse_timestamp()
+
+
+def peak_rss_bytes():
+    """ Returns this process's peak resident set size so far in bytes """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def measure(mode, articles, paragraphs):
+    """ Runs in a fresh process: builds the pages (standing in for the responses, which the
+        monitor also holds until the run finishes), then parses them all the given way and keeps
+        the Article objects
+        Returns (peak RSS increase in bytes, seconds spent parsing, total page bytes)
+    """
+    rng = make_rng(0)
+    pages = [
+        (f'https://www.bbc.co.uk/news/articles/c{i:010d}', make_article_html(rng, '', paragraphs))
+        for i in range(articles)
+        ]
+    gc.collect()
+    before = peak_rss_bytes()
+    start = time.perf_counter()
+    parsed = []
+    for url, content in pages:
+        if mode == 'legacy':
+            article = LegacyArticle(url=url)
+            article.raw_html = content.decode('utf-8')
+        else:
+            article = Article(url=url)
+            article.raw_html = content
+        article.parse_all(encoding='utf-8')
+        parsed.append(article)
+    elapsed = time.perf_counter() - start
+    # Sanity check both ways give the same result
+    assert parsed[0].parsed['headline'] and not parsed[0].parsed['parse_errors']
+    return peak_rss_bytes() - before, elapsed, sum(len(content) for _, content in pages)
+
+def main():
+    """ Measures each mode in its own process and prints the results per 1,000 articles """
+    parser = argparse.ArgumentParser(description='Benchmark the memory use of parsed articles')
+    parser.add_argument('--articles', type=int, default=1000)
+    parser.add_argument('--paragraphs', type=int, default=40)
+    parser.add_argument('--json', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = {}
+    context = multiprocessing.get_context('spawn')
+    for mode in MODES:
+        with context.Pool(1) as pool:
+            rss, elapsed, page_bytes = pool.apply(measure, (mode, args.articles, args.paragraphs))
+        results[mode] = {
+            'peak_rss_mb_per_1000': rss / args.articles * 1000 / 2**20,
+            'parse_ms_per_article': elapsed / args.articles * 1000,
+            }
+
+    print(f'{args.articles} articles, {page_bytes / args.articles / 1024:.0f} KB of HTML each')
+    for mode in MODES:
+        print(f'{mode:>8}: {results[mode]["peak_rss_mb_per_1000"]:8.1f} MB peak RSS per 1,000 ' +
+              f'articles, {results[mode]["parse_ms_per_article"]:6.2f} ms to parse each')
+    legacy_rss = results['legacy']['peak_rss_mb_per_1000']
+    current_rss = results['current']['peak_rss_mb_per_1000']
+    print(f'Saving: {legacy_rss - current_rss:.1f} MB per 1,000 articles ' +
+          f'({(1 - current_rss / legacy_rss) * 100:.0f}% less)')
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'benchmark': 'article_memory',
+                'articles': args.articles,
+                'paragraphs': args.paragraphs,
+                'page_bytes': page_bytes / args.articles,
+                'results': results,
+                }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
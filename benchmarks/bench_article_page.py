@@ -0,0 +1,119 @@
+"""
+
+    ***Article page benchmark***
+    Compares the original five-query /article data access with the single-query
+    get_article_details() on a synthetic database with thousands of versions and fetches per URL
+
+    Usage (from the benchmarks folder):
+        python bench_article_page.py [--versions N] [--fetches N] [--repeat N] [--json out.json]
+
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import sqlite3
+
+from synthetic_db import build_database
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, '..', 'news_updates_monitor'))
+sys.path.append(os.path.join(HERE, '..', 'news_updates_monitor', 'web_interface'))
+# Disabling Pylint as it cannot detect the system path hacked local modules
+# pylint: disable-next=import-error,wrong-import-position
+from article import table_row_to_article, dict_factory
+# pylint: disable-next=import-error,wrong-import-position
+from web_interface import get_article_details
+
+
+def legacy_article_details(path, url):
+    """ The article() data access before it was consolidated: two connections, SELECT * for the
+        latest row (including raw_html and body) and four more queries
+    """
+    con = sqlite3.connect(path)
+    con.execute('PRAGMA foreign_keys = ON')
+    con.row_factory = dict_factory
+    row = con.execute(
+        'SELECT * FROM article WHERE url = ? ORDER BY article_id DESC LIMIT 1', (url,)
+        ).fetchone()
+    latest_article = table_row_to_article(row)
+    con.close()
+    con = sqlite3.connect(path)
+    con.execute('PRAGMA foreign_keys = ON')
+    snapshots, = con.execute('SELECT COUNT(*) FROM article WHERE url = ?', (url,)).fetchone()
+    fetches, = con.execute('SELECT COUNT(*) FROM fetch WHERE url = ?', (url,)).fetchone()
+    article_ids = []
+    for row in con.execute('SELECT article_id FROM article WHERE url = ?', (url,)):
+        article_ids += row
+    compare_ids = []
+    for i in range(len(article_ids) - 1):
+        compare_ids.append(((i + 1, i + 2), article_ids[i], article_ids[i+1]))
+    schedule_level, = con.execute(
+        'SELECT schedule_level FROM tracking WHERE url = ?', (url,)
+        ).fetchone()
+    con.close()
+    return latest_article, snapshots, fetches, schedule_level, compare_ids
+
+def consolidated_article_details(path, url):
+    """ The current article() data access (one connection, one query) """
+    con = sqlite3.connect(path)
+    con.execute('PRAGMA foreign_keys = ON')
+    details = get_article_details(con, url)
+    con.close()
+    return details
+
+def time_per_call(func, path, urls, repeat):
+    """ Returns the best average seconds per call over repeat passes through every URL """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for url in urls:
+            func(path, url)
+        elapsed = (time.perf_counter() - start) / len(urls)
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    """ Builds the database, checks both give the same answer, then times them """
+    parser = argparse.ArgumentParser(description='Benchmark the /article data access')
+    parser.add_argument('--urls', type=int, default=10)
+    parser.add_argument('--versions', type=int, default=2000)
+    parser.add_argument('--fetches', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.sqlite3')
+        print(f'Building database: {args.urls} URLs x {args.versions} versions x ' +
+              f'{args.fetches} fetches...')
+        urls = build_database(path, args.urls, args.versions, args.fetches, paragraphs=10)
+
+        legacy = legacy_article_details(path, urls[0])
+        details = consolidated_article_details(path, urls[0])
+        assert legacy[1:] == (details['snapshots'], details['fetches'],
+                              details['schedule_level'], details['compare_ids'])
+
+        legacy_time = time_per_call(legacy_article_details, path, urls, args.repeat)
+        new_time = time_per_call(consolidated_article_details, path, urls, args.repeat)
+
+    print(f'Legacy (5 queries):       {legacy_time * 1000:8.2f} ms per page')
+    print(f'Consolidated (1 query):   {new_time * 1000:8.2f} ms per page')
+    print(f'Speedup:                  {legacy_time / new_time:8.1f}x')
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'benchmark': 'article_page',
+                'urls': args.urls,
+                'versions': args.versions,
+                'fetches': args.fetches,
+                'legacy_seconds': legacy_time,
+                'consolidated_seconds': new_time,
+                }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
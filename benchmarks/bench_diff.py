@@ -0,0 +1,102 @@
+"""
+
+    ***Diff engine benchmark***
+    Times difflib.HtmlDiff against article_diff on synthetic article bodies of realistic sizes
+
+    Usage (from the benchmarks folder):
+        python bench_diff.py [--repeat N] [--json results.json]
+
+"""
+
+import argparse
+import difflib
+import json
+import os
+import sys
+import time
+
+from fixtures import make_rng, make_body, mutate_body, reword_sentence
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'news_updates_monitor')
+    )
+# Disabling Pylint as it cannot detect the system path hacked local module
+# pylint: disable-next=import-error,wrong-import-position
+import article_diff
+
+
+# Typical BBC articles are 15-40 paragraphs, long reads and explainers can go well over 100
+SIZES = (20, 80, 300)
+
+# Name: (change_rate, insert_rate, delete_rate) - None means a single reworded sentence
+SCENARIOS = {
+    'one_sentence': None,
+    'light_edit': (0.1, 0.05, 0.02),
+    'heavy_rewrite': (0.5, 0.2, 0.2),
+    }
+
+
+def make_pair(paragraphs, scenario, seed=0):
+    """ Returns (body_a, body_b) for the given size and scenario """
+    rng = make_rng(seed)
+    body_a = make_body(rng, paragraphs)
+    rates = SCENARIOS[scenario]
+    if rates is None:
+        lines = body_a.splitlines()
+        i = rng.randrange(len(lines))
+        lines[i] = reword_sentence(rng, lines[i])
+        return body_a, '\n'.join(lines)
+    change_rate, insert_rate, delete_rate = rates
+    return body_a, mutate_body(rng, body_a, change_rate, insert_rate, delete_rate)
+
+def run_difflib(body_a, body_b):
+    """ The original /compare code path """
+    return difflib.HtmlDiff(wrapcolumn=71).make_table(
+        body_a.splitlines(), body_b.splitlines(), fromdesc='A', todesc='B'
+        )
+
+def run_article_diff(body_a, body_b):
+    """ The word-level engine """
+    return article_diff.make_table(body_a, body_b, fromdesc='A', todesc='B')
+
+def best_time(func, args, repeat):
+    """ Returns the fastest of repeat runs in seconds (the least affected by other processes) """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    """ Runs every size/scenario combination and prints (and optionally saves) the results """
+    parser = argparse.ArgumentParser(description='Benchmark difflib.HtmlDiff vs article_diff')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per measurement (best kept)')
+    parser.add_argument('--json', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = []
+    print(f'{"paragraphs":>10} {"scenario":>14} {"difflib ms":>11} {"words ms":>9} {"speedup":>8}')
+    for size in SIZES:
+        for scenario in SCENARIOS:
+            body_a, body_b = make_pair(size, scenario)
+            difflib_time = best_time(run_difflib, (body_a, body_b), args.repeat)
+            words_time = best_time(run_article_diff, (body_a, body_b), args.repeat)
+            results.append({
+                'paragraphs': size,
+                'scenario': scenario,
+                'chars': len(body_a),
+                'difflib_seconds': difflib_time,
+                'article_diff_seconds': words_time,
+                })
+            print(
+                f'{size:>10} {scenario:>14} {difflib_time * 1000:>11.2f} ' +
+                f'{words_time * 1000:>9.2f} {difflib_time / words_time:>7.1f}x'
+                )
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'benchmark': 'diff', 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
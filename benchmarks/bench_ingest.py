@@ -0,0 +1,181 @@
+"""
+
+    ***Bulk ingestion benchmark***
+    Times ingest.py loading a synthetic WARC file of article captures into an empty database,
+    and checks it stored the right versions
+
+    The WARC file is written the way crawlers write them: one gzip member per record, a warcinfo
+    record first, and responses recorded as received - some gzip encoded, some chunked - mixed in
+    with image and homepage captures that ingest.py should skip over. Each article is captured
+    several times in no particular order, and now and then it has been edited between captures.
+
+    Usage (from the benchmarks folder):
+        python bench_ingest.py [--articles N] [--captures N] [--workers N] [--json results.json]
+
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from fixtures import make_rng, make_article_html, make_headline, make_paragraph, reword_sentence
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'news_updates_monitor')
+    )
+# Disabling Pylint as it cannot detect the system path hacked local module
+# pylint: disable-next=import-error,wrong-import-position
+import ingest
+# pylint: disable-next=import-error,wrong-import-position
+from database import apply_schema
+# pylint: disable-next=import-error,wrong-import-position
+from counters import ensure_counters
+
+
+BASE_URL = 'https://www.bbc.co.uk'
+
+
+def warc_record(record_type, url, moment, block, content_type):
+    """ Returns one WARC record as its own gzip member """
+    headers = (
+        'WARC/1.0\r\n' +
+        f'WARC-Type: {record_type}\r\n' +
+        f'WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>\r\n' +
+        f'WARC-Date: {moment:%Y-%m-%dT%H:%M:%SZ}\r\n' +
+        (f'WARC-Target-URI: {url}\r\n' if url else '') +
+        f'Content-Type: {content_type}\r\n' +
+        f'Content-Length: {len(block)}\r\n\r\n'
+        )
+    return gzip.compress(headers.encode('utf-8') + block + b'\r\n\r\n')
+
+def http_response(body, rng, content_type='text/html; charset=utf-8'):
+    """ Returns an HTTP response as a crawler would record it, randomly gzipped or chunked """
+    headers = ['HTTP/1.1 200 OK', f'Content-Type: {content_type}']
+    roll = rng.random()
+    if roll < 0.3:
+        body = gzip.compress(body)
+        headers.append('Content-Encoding: gzip')
+    elif roll < 0.5:
+        size = 8192
+        chunks = [body[i:i + size] for i in range(0, len(body), size)]
+        body = b''.join(f'{len(chunk):x}\r\n'.encode() + chunk + b'\r\n' for chunk in chunks)
+        body += b'0\r\n\r\n'
+        headers.append('Transfer-Encoding: chunked')
+    else:
+        headers.append(f'Content-Length: {len(body)}')
+    return ('\r\n'.join(headers) + '\r\n\r\n').encode('utf-8') + body
+
+def write_warc(path, rng, articles, captures, edit_rate=0.2):
+    """ Writes the synthetic WARC file
+        Returns (article pages written, versions they should be stored as)
+    """
+    start = datetime(2023, 1, 1, tzinfo=timezone.utc)
+    records = []
+    versions = 0
+    for i in range(articles):
+        url = f'{BASE_URL}/news/articles/c{i:011d}o'
+        headline = make_headline(rng)
+        body = [make_paragraph(rng) for _ in range(rng.randint(15, 40))]
+        moment = start + timedelta(minutes=rng.randrange(60 * 24 * 365))
+        versions += 1
+        for capture in range(captures):
+            if capture and rng.random() < edit_rate:
+                line = rng.randrange(len(body))
+                body[line] = reword_sentence(rng, body[line])
+                versions += 1
+            page = make_article_html(rng, url, links=150, headline=headline, body=body)
+            records.append((moment, 'response', url, http_response(page, rng)))
+            moment += timedelta(minutes=rng.randint(10, 600))
+        image = rng.randbytes(20_000)
+        records.append((moment, 'response', url.replace('/news/articles/', '/news/images/'),
+                        http_response(image, rng, 'image/jpeg')))
+    # Crawls visit pages in any order, not article by article
+    rng.shuffle(records)
+    with open(path, 'wb') as f:
+        f.write(warc_record('warcinfo', None, start, b'software: bench_ingest.py\r\n',
+                            'application/warc-fields'))
+        for moment, record_type, url, block in records:
+            f.write(warc_record(record_type, url, moment, block,
+                                'application/http; msgtype=response'))
+    return articles * captures, versions
+
+def run(args, temp_dir):
+    """ Writes the WARC file, ingests it twice (the second time should find nothing new) and
+        returns the results dict
+    """
+    rng = make_rng(args.seed)
+    warc_path = os.path.join(temp_dir, 'captures.warc.gz')
+    pages, versions = write_warc(warc_path, rng, args.articles, args.captures)
+    database = os.path.join(temp_dir, 'ingest.sqlite3')
+    con = sqlite3.connect(database)
+    con.execute('PRAGMA foreign_keys = ON')
+    apply_schema(con)
+    ensure_counters(con)
+
+    start = time.perf_counter()
+    stats = ingest.stage_paths(con, [warc_path], BASE_URL, args.workers, args.batch_size)
+    staged = time.perf_counter()
+    applied = ingest.apply_staged(con, args.batch_size * 5)
+    finished = time.perf_counter()
+    # Ingesting the same file again shouldn't add anything, or even parse anything
+    ingest.stage_paths(con, [warc_path], BASE_URL, args.workers, args.batch_size)
+    again = ingest.apply_staged(con)
+
+    stored, = con.execute('SELECT COUNT(*) FROM article').fetchone()
+    fetches, = con.execute('SELECT COUNT(*) FROM fetch').fetchone()
+    con.close()
+    return {
+        'pages': pages,
+        'warc_mb': os.path.getsize(warc_path) / 2**20,
+        'workers': args.workers or os.cpu_count(),
+        'stage_seconds': staged - start,
+        'apply_seconds': finished - staged,
+        'pages_per_minute': pages / (finished - start) * 60,
+        'parsed': stats['parsed'],
+        'copied': stats['reused'],
+        'results': dict(applied),
+        'versions_expected': versions,
+        'versions_stored': stored,
+        'fetches': fetches,
+        'second_run': dict(again),
+        }
+
+
+if __name__ == '__main__':
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s: %(message)s')
+
+    parser = argparse.ArgumentParser(description='Benchmark bulk ingestion of a WARC file')
+    parser.add_argument('--articles', type=int, default=200)
+    parser.add_argument('--captures', type=int, default=10, help='captures of each article')
+    parser.add_argument('--workers', type=int, default=None, help='default: one per CPU')
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        results = run(args, temp_dir)
+
+    print(
+        f"{results['pages']} pages ({results['warc_mb']:.1f} MB of WARC) with " +
+        f"{results['workers']} workers: staged in {results['stage_seconds']:.1f}s, applied in " +
+        f"{results['apply_seconds']:.1f}s - {results['pages_per_minute']:.0f} pages per minute"
+        )
+    print(f"Parsed {results['parsed']}, copied the parse of {results['copied']}")
+    print(
+        f"Applied: {results['results']}, {results['versions_stored']} versions stored " +
+        f"({results['versions_expected']} expected), {results['fetches']} fetches"
+        )
+    print(f"Second run of the same file: {results['second_run'] or 'nothing to apply'}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'benchmark': 'ingest', 'results': results}, f, indent=2)
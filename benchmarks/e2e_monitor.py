@@ -0,0 +1,277 @@
+"""
+
+    ***End-to-end monitor test***
+    Runs the monitor's real main_loop() against the fake news server (fake_news_server.py) for a
+    number of cycles, then reports throughput, how accurately it detected the edits the server
+    made, and the resources it used
+
+    Everything runs in a temporary folder with its own database and config.ini (Telegram
+    disabled), so it's safe to run alongside a real monitor. Only the monitor's pauses for
+    reading the console are skipped - the requests go through requests_throttler with the
+    configured fetch delay like a real run. The server runs in its own process so its CPU and
+    memory aren't counted as the monitor's.
+
+    --soak turns on the monitor's soak mode (see soak.py), checking memory after every cycle and
+    warning about growth - run a few hundred cycles to look for leaks in hours rather than weeks.
+
+    Usage (from the benchmarks folder):
+        python e2e_monitor.py [--cycles N] [--articles N] [--change-rate R] [--error-rate R]
+                              [--latency SECONDS] [--fetch-delay SECONDS] [--json out.json]
+                              [--soak] [--soak-threshold-mb MB]
+                              [--discovery homepage|feeds|both]
+
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import types
+from urllib.parse import urlsplit
+from urllib.request import urlopen
+
+from fake_news_server import FakeNews, start_server, SECTIONS
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, '..', 'news_updates_monitor'))
+sys.path.append(os.path.join(HERE, '..', 'news_updates_monitor', 'monitor'))
+# Disabling Pylint as it cannot detect the system path hacked local modules
+# pylint: disable-next=import-error,wrong-import-position
+from database import apply_schema
+# pylint: disable-next=import-error,wrong-import-position
+from counters import ensure_counters
+# pylint: disable-next=import-error,wrong-import-position
+import monitor
+# pylint: disable-next=import-error,wrong-import-position
+from soak import MemoryWatch
+# pylint: disable-next=import-error,wrong-import-position
+import metrics
+
+
+def serve_site(site_settings, port_queue):
+    """ Runs the fake server in a child process until it's terminated """
+    server = start_server(FakeNews(**site_settings))
+    port_queue.put(server.server_port)
+    threading.Event().wait()
+
+def start_site_process(site_settings):
+    """ Starts the fake server in a child process
+        Returns (the process, the server's base URL)
+    """
+    port_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=serve_site, args=(site_settings, port_queue), name='fake-news-server', daemon=True
+        )
+    process.start()
+    return process, f'http://127.0.0.1:{port_queue.get(timeout=60)}'
+
+def get_site_stats(base_url):
+    """ Returns the server's /__stats """
+    with urlopen(base_url + '/__stats', timeout=30) as response:
+        return json.load(response)
+
+def write_config(path, base_url, fetch_delay, sources='homepage'):
+    """ Writes a config.ini pointing the monitor at the fake server, with Telegram disabled
+        sources = string; the [discovery] sources, which read the server's main and section feeds
+    """
+    feeds = ''.join(f'\n    /news/{section}/rss.xml' for section in SECTIONS)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(
+            '[telegram_bot]\nenabled = False\ntoken = none\nchat_id = none\n\n' +
+            f'[monitor]\nbase_url = {base_url}\nfetch_delay = {fetch_delay}\n\n' +
+            f'[discovery]\nsources = {sources}\nfeeds =\n    /news/rss.xml{feeds}\n'
+            )
+
+def get_stored_versions(path):
+    """ Returns {URL path: versions stored} from the monitor's database """
+    con = sqlite3.connect(path)
+    rows = con.execute('SELECT url, COUNT(*) FROM article GROUP BY url').fetchall()
+    con.close()
+    return {urlsplit(url).path: versions for url, versions in rows}
+
+def score_detection(served, stored):
+    """ Compares the versions the server served with the versions the monitor stored
+        served, stored = dicts of {URL path: number of versions}
+        Returns a dict: the edits served (after each article's first version), the edits stored,
+        how many were missed or stored when nothing had changed, and precision/recall
+    """
+    true_edits = detected = missed = spurious = 0
+    for path in set(served) | set(stored):
+        actual = max(served.get(path, 0) - 1, 0)
+        found = max(stored.get(path, 0) - 1, 0)
+        true_edits += actual
+        detected += min(actual, found)
+        missed += max(actual - found, 0)
+        spurious += max(found - actual, 0)
+    return {
+        'edits_served': true_edits,
+        'edits_detected': detected,
+        'edits_missed': missed,
+        'spurious_versions': spurious,
+        'articles_served': len(served),
+        'articles_stored': len(stored),
+        'recall': detected / true_edits if true_edits else 1.0,
+        'precision': detected / (detected + spurious) if detected + spurious else 1.0,
+        }
+
+def run(args, work_dir):
+    """ Runs the monitor against a fresh fake site for args.cycles cycles
+        Returns the results dict
+    """
+    server, base_url = start_site_process({
+        'articles': args.articles, 'new_per_homepage': args.new_per_cycle,
+        'change_rate': args.change_rate, 'error_rate': args.error_rate,
+        'timeout_rate': args.timeout_rate, 'latency': args.latency, 'seed': args.seed,
+        })
+
+    os.makedirs(os.path.join(work_dir, 'test_db'), exist_ok=True)
+    os.chdir(work_dir)
+    write_config('config.ini', base_url, args.fetch_delay,
+                 'homepage, feeds' if args.discovery == 'both' else args.discovery)
+    monitor.DATABASE = os.path.join(work_dir, 'test_db', 'news_updates_monitor.sqlite3')
+    con = sqlite3.connect(monitor.DATABASE)
+    apply_schema(con)
+    ensure_counters(con)
+    con.close()
+    monitor.load_config('config.ini')
+    # Skip the pauses that give a person time to read the console
+    monitor.time = types.SimpleNamespace(sleep=lambda seconds: None)
+
+    watch = None
+    if args.soak:
+        watch = MemoryWatch(threshold_mb=args.soak_threshold_mb)
+        watch.start()
+    cycles = []
+    metrics_before = metrics.REGISTRY.snapshot()
+    cpu_start = resource.getrusage(resource.RUSAGE_SELF)
+    try:
+        for cycle in range(args.cycles):
+            con = sqlite3.connect(monitor.DATABASE)
+            fetches_before, = con.execute('SELECT COUNT(*) FROM fetch').fetchone()
+            cycle_start = time.perf_counter()
+            monitor.main_loop()
+            elapsed = time.perf_counter() - cycle_start
+            fetches_after, = con.execute('SELECT COUNT(*) FROM fetch').fetchone()
+            con.close()
+            cycles.append({'cycle': cycle + 1, 'seconds': elapsed,
+                           'urls_fetched': fetches_after - fetches_before})
+            if watch is not None:
+                # Not counted in the cycle's time, as it isn't part of a normal run
+                cycles[-1]['memory'] = watch.check()
+            print(f'Cycle {cycle + 1}: {fetches_after - fetches_before} URLs in {elapsed:.1f}s')
+        total = sum(cycle['seconds'] for cycle in cycles)
+        stats = get_site_stats(base_url)
+    finally:
+        server.terminate()
+        if watch is not None:
+            watch.stop()
+    cpu_end = resource.getrusage(resource.RUSAGE_SELF)
+
+    urls_fetched = sum(cycle['urls_fetched'] for cycle in cycles)
+    served = stats.pop('versions_served')
+    # The discovery stage's (count, total seconds) from the monitor's own metrics
+    stage = metrics.STAGE_SECONDS.name
+    runs_before, seconds_before = metrics_before[stage].get(('discovery',), (0, 0.0))
+    runs_after, seconds_after = metrics.REGISTRY.snapshot()[stage].get(('discovery',), (0, 0.0))
+    discovery_runs = runs_after - runs_before
+    discovery_seconds = seconds_after - seconds_before
+    con = sqlite3.connect(monitor.DATABASE)
+    tracked, = con.execute('SELECT COUNT(*) FROM tracking').fetchone()
+    # Every link on every homepage read, against the rows homepage.py stored them as
+    links_seen, = con.execute('SELECT TOTAL(links) FROM homepage_check').fetchone()
+    homepage_runs, = con.execute('SELECT COUNT(*) FROM homepage_run').fetchone()
+    con.close()
+    # Linux reports KB, macOS reports bytes
+    max_rss = cpu_end.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    return {
+        'cycles': cycles,
+        'seconds': total,
+        'urls_fetched': urls_fetched,
+        'urls_per_minute': urls_fetched / total * 60 if total else 0,
+        # The throttle delay alone caps throughput, so this is the speed without it
+        'urls_per_minute_excluding_delay':
+            urls_fetched / max(total - urls_fetched * args.fetch_delay, 1e-9) * 60,
+        'detection': score_detection(served, get_stored_versions(monitor.DATABASE)),
+        'discovery': {
+            'sources': args.discovery,
+            'seconds_per_cycle': discovery_seconds / discovery_runs if discovery_runs else 0,
+            'articles_published': stats['articles_published'],
+            'articles_tracked': tracked,
+            'homepage_links_seen': int(links_seen),
+            'homepage_runs': homepage_runs,
+            },
+        'server': stats,
+        'resources': {
+            'cpu_seconds': (cpu_end.ru_utime - cpu_start.ru_utime) +
+                           (cpu_end.ru_stime - cpu_start.ru_stime),
+            'max_rss_mb': max_rss / 2**20,
+            'database_mb': os.path.getsize(monitor.DATABASE) / 2**20,
+            },
+        }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Run the monitor end to end against a fake site')
+    parser.add_argument('--cycles', type=int, default=5)
+    parser.add_argument('--articles', type=int, default=50, help='articles to start with')
+    parser.add_argument('--new-per-cycle', type=int, default=5,
+                        help='new articles published each time the homepage is read')
+    parser.add_argument('--change-rate', type=float, default=0.2,
+                        help='chance an article is edited before each fetch')
+    parser.add_argument('--error-rate', type=float, default=0.02,
+                        help='chance of a 404/500/503 response')
+    parser.add_argument('--timeout-rate', type=float, default=0.0,
+                        help='chance of a response slower than the 10 second timeout')
+    parser.add_argument('--latency', type=float, default=0.01, help='seconds added per response')
+    parser.add_argument('--fetch-delay', type=float, default=0.05,
+                        help='the monitor\'s seconds between requests')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--discovery', choices=('homepage', 'feeds', 'both'), default='homepage',
+                        help='where the monitor finds new articles')
+    parser.add_argument('--json', help='also write the results to this JSON file')
+    parser.add_argument('--soak', action='store_true',
+                        help='check memory after every cycle and warn if it keeps growing')
+    parser.add_argument('--soak-threshold-mb', type=float, default=20,
+                        help='memory growth that gets a warning in --soak mode')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s: %(message)s')
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        results = run(args, temp_dir)
+        os.chdir(HERE)
+
+    detection = results['detection']
+    print(f'\n{results["urls_fetched"]} URLs fetched in {results["seconds"]:.1f}s: ' +
+          f'{results["urls_per_minute"]:.0f} per minute ' +
+          f'({results["urls_per_minute_excluding_delay"]:.0f} excluding the fetch delay)')
+    print(f'Edits: {detection["edits_served"]} served, {detection["edits_detected"]} detected, ' +
+          f'{detection["edits_missed"]} missed, {detection["spurious_versions"]} spurious ' +
+          f'(precision {detection["precision"]:.3f}, recall {detection["recall"]:.3f})')
+    print(f'Discovery ({args.discovery}): {results["discovery"]["seconds_per_cycle"] * 1000:.0f} ' +
+          f'ms per cycle, {results["discovery"]["articles_tracked"]} of ' +
+          f'{results["discovery"]["articles_published"]} published articles tracked')
+    if results['discovery']['homepage_links_seen']:
+        print(f'Homepage positions: {results["discovery"]["homepage_links_seen"]} links seen, ' +
+              f'stored as {results["discovery"]["homepage_runs"]} runs')
+    print(f'Faults served: {results["server"]["errors"]} errors, ' +
+          f'{results["server"]["timeouts"]} timeouts')
+    print(f'CPU: {results["resources"]["cpu_seconds"]:.1f}s, peak RSS: ' +
+          f'{results["resources"]["max_rss_mb"]:.0f} MB, database: ' +
+          f'{results["resources"]["database_mb"]:.1f} MB')
+    if args.soak:
+        last = results['cycles'][-1]['memory']
+        print(f'Memory growth since cycle 1: RSS {last["rss_growth"] / 2**20:+.1f} MB, ' +
+              f'traced {last["traced_growth"] / 2**20:+.1f} MB')
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
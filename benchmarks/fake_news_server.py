@@ -0,0 +1,304 @@
+"""
+
+    ***Fake news server***
+    A local stand-in for the BBC News site, so the monitor can be run end to end (see
+    e2e_monitor.py) without going anywhere near the real thing
+
+    Serves:
+        /                       a placeholder page (what is_online() checks)
+        /news                   a homepage linking to the newest articles, adding new ones as it
+                                goes, among '#comments' links and links to other sections
+        /news/rss.xml           an RSS feed of the newest articles, publishing new ones like the
+                                homepage
+        /news/<section>/rss.xml an RSS feed of the newest articles in one of SECTIONS
+        /news/articles/<id>     article pages in the layout Article.parse_all() expects, with
+                                navigation links that are different on every request (like the
+                                real promos), and headlines/bodies that are edited at random
+        /__stats                JSON of everything served so far, including the versions of
+                                each article that were actually served - the ground truth for
+                                checking the monitor's change detection
+
+    Faults (404s, 500/503s and responses slower than the monitor's 10 second timeout) and extra
+    latency can be injected at configurable rates. Article pages and feeds have an ETag for their
+    current version and answer If-None-Match with 304 Not Modified.
+
+    Usage (from the benchmarks folder):
+        python fake_news_server.py [--port 8080] [--articles N] [--change-rate R] ...
+    then set base_url = http://127.0.0.1:8080 in the [monitor] section of the monitor's
+    config.ini
+
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from fixtures import (make_rng, make_headline, make_paragraph, mutate_body, make_article_html,
+                      make_homepage_html, make_feed_xml)
+
+
+ARTICLE_PATH_RE = re.compile(r'^/news/articles/(c[0-9a-z]+)$')
+FEED_PATH_RE = re.compile(r'^/news/(?:([a-z_]+)/)?rss\.xml$')
+SECTIONS = ('world', 'uk', 'business', 'politics', 'technology', 'science_and_environment')
+FAULT_STATUSES = (404, 500, 503)
+
+
+class FakeNews():
+    """ The fake site's state: its articles and their current versions, the fault settings and
+        the counts of everything served. Thread safe, as the server handles requests on many
+        threads.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, **kwargs):
+        """
+        articles = integer; articles on the site to start with (default 50)
+        new_per_homepage = integer; new articles added each time the homepage is requested
+                           (default 2)
+        homepage_size = integer; newest articles linked from the homepage and the main feed
+                        (default 100)
+        feed_size = integer; newest articles in each section feed (default 40)
+        paragraphs = integer; body length of new articles (default 25)
+        change_rate = float; chance an article is edited before each request for it (default 0.1)
+        headline_rate = float; chance an edit also changes the headline (default 0.3)
+        error_rate = float; chance of a 404/500/503 response (default 0)
+        timeout_rate = float; chance of a response that takes timeout_seconds (default 0)
+        timeout_seconds = float; how long a timeout fault takes (default 12, over the monitor's
+                          10 second timeout)
+        latency = float; seconds added to every response (default 0)
+        seed = integer; for the random number generator (default 0)
+        """
+        self.new_per_homepage = kwargs.get('new_per_homepage', 2)
+        self.homepage_size = kwargs.get('homepage_size', 100)
+        self.feed_size = kwargs.get('feed_size', 40)
+        self.paragraphs = kwargs.get('paragraphs', 25)
+        self.change_rate = kwargs.get('change_rate', 0.1)
+        self.headline_rate = kwargs.get('headline_rate', 0.3)
+        self.error_rate = kwargs.get('error_rate', 0.0)
+        self.timeout_rate = kwargs.get('timeout_rate', 0.0)
+        self.timeout_seconds = kwargs.get('timeout_seconds', 12.0)
+        self.latency = kwargs.get('latency', 0.0)
+        self.rng = make_rng(kwargs.get('seed', 0))
+        self.lock = threading.Lock()
+        # article ID -> {'headline', 'body' (list of paragraphs), 'version', 'served' (set of
+        # versions served with a 200)}
+        self.articles = {}
+        self.order = []
+        self.stats = {'requests': 0, 'homepage': 0, 'feeds': 0, 'articles': 0, 'not_modified': 0,
+                      'errors': 0, 'timeouts': 0}
+        for _ in range(kwargs.get('articles', 50)):
+            self.add_article()
+
+    def add_article(self):
+        """ Publishes a new article (call with the lock held, or before serving) """
+        article_id = f'c{len(self.order):010d}'
+        self.articles[article_id] = {
+            'headline': make_headline(self.rng),
+            'body': [make_paragraph(self.rng) for _ in range(self.paragraphs)],
+            'version': 1,
+            'served': set(),
+            'section': self.rng.choice(SECTIONS),
+            }
+        self.order.append(article_id)
+
+    def edit_article(self, article):
+        """ Edits an article's body (and sometimes its headline), making a new version """
+        old_body = article['body']
+        body = mutate_body(self.rng, '\n'.join(old_body), 0.1, 0.03, 0.02).splitlines()
+        if body == old_body:
+            # mutate_body() can leave a short body alone, but an edit has to change something
+            body.append(make_paragraph(self.rng))
+        article['body'] = body
+        if self.rng.random() < self.headline_rate:
+            article['headline'] = make_headline(self.rng)
+        article['version'] += 1
+
+    def pick_fault(self):
+        """ Returns 'timeout', an HTTP error status or None for a normal response """
+        with self.lock:
+            roll = self.rng.random()
+        if roll < self.timeout_rate:
+            return 'timeout'
+        if roll < self.timeout_rate + self.error_rate:
+            return FAULT_STATUSES[int(roll * 1000) % len(FAULT_STATUSES)]
+        return None
+
+    def homepage(self):
+        """ Returns the homepage HTML, publishing new articles first """
+        with self.lock:
+            for _ in range(self.new_per_homepage):
+                self.add_article()
+            newest = self.order[-self.homepage_size:]
+            # Built as BBC URLs, which make_homepage_html() makes relative like the real homepage
+            urls = [f'https://www.bbc.co.uk/news/articles/{article_id}' for article_id in newest]
+            self.stats['homepage'] += 1
+            return make_homepage_html(self.rng, urls, other_links=100)
+
+    def feed(self, section, if_none_match):
+        """ Returns (status, etag, xml) for the main feed (section None, which publishes new
+            articles first, like the homepage) or a section's feed
+            xml is None for a 304 or 404
+        """
+        with self.lock:
+            if section is None:
+                for _ in range(self.new_per_homepage):
+                    self.add_article()
+                newest = self.order[-self.homepage_size:]
+            elif section in SECTIONS:
+                newest = [article_id for article_id in self.order
+                          if self.articles[article_id]['section'] == section][-self.feed_size:]
+            else:
+                return 404, None, None
+            # The feed only changes when an article is added to it
+            etag = f'"feed-{section or "news"}-{newest[-1] if newest else "empty"}"'
+            if if_none_match == etag:
+                self.stats['not_modified'] += 1
+                return 304, etag, None
+            self.stats['feeds'] += 1
+            urls = [f'https://www.bbc.co.uk/news/articles/{article_id}'
+                    for article_id in reversed(newest)]
+            return 200, etag, make_feed_xml(self.rng, urls, title=f'BBC News - {section or "Home"}')
+
+    def article(self, article_id, if_none_match):
+        """ Returns (status, etag, html) for an article page, possibly editing it first
+            html is None for a 304 or 404
+        """
+        with self.lock:
+            article = self.articles.get(article_id)
+            if article is None:
+                return 404, None, None
+            if self.rng.random() < self.change_rate:
+                self.edit_article(article)
+            etag = f'"{article_id}-{article["version"]}"'
+            if if_none_match == etag:
+                self.stats['not_modified'] += 1
+                return 304, etag, None
+            article['served'].add(article['version'])
+            self.stats['articles'] += 1
+            html = make_article_html(
+                self.rng, f'https://www.bbc.co.uk/news/articles/{article_id}',
+                links=150, headline=article['headline'], body=article['body']
+                )
+        return 200, etag, html
+
+    def get_stats(self):
+        """ Returns the counts of what was served and, per article path, how many of its
+            versions were served (the number of versions the monitor should have stored)
+        """
+        with self.lock:
+            return dict(
+                self.stats,
+                articles_published=len(self.order),
+                versions_served={
+                    f'/news/articles/{article_id}': len(article['served'])
+                    for article_id, article in self.articles.items() if article['served']
+                    },
+                )
+
+
+def make_handler(site):
+    """ Returns a request handler class serving the given FakeNews site """
+
+    class FakeNewsHandler(BaseHTTPRequestHandler):
+        """ Serves one request for the fake site """
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            """ Routes the request, applying any latency and faults first """
+            # pylint: disable=invalid-name
+            with site.lock:
+                site.stats['requests'] += 1
+            if site.latency:
+                time.sleep(site.latency)
+            if self.path == '/__stats':
+                self.send_body(200, json.dumps(site.get_stats()).encode(), 'application/json')
+                return
+            if self.path == '/':
+                self.send_body(200, b'<html><body>Fake News</body></html>')
+                return
+            fault = site.pick_fault()
+            if fault == 'timeout':
+                with site.lock:
+                    site.stats['timeouts'] += 1
+                time.sleep(site.timeout_seconds)
+            elif fault is not None:
+                with site.lock:
+                    site.stats['errors'] += 1
+                self.send_body(fault, b'<html><body>Error</body></html>')
+                return
+            if self.path == '/news':
+                self.send_body(200, site.homepage())
+                return
+            match = FEED_PATH_RE.match(self.path)
+            if match is not None:
+                status, etag, xml = site.feed(match.group(1), self.headers.get('If-None-Match'))
+                self.send_body(status, xml or b'', 'application/rss+xml', etag=etag)
+                return
+            match = ARTICLE_PATH_RE.match(self.path)
+            if match is None:
+                self.send_body(404, b'<html><body>Not Found</body></html>')
+                return
+            status, etag, html = site.article(match.group(1), self.headers.get('If-None-Match'))
+            self.send_body(status, html or b'', etag=etag)
+
+        def send_body(self, status, body, content_type='text/html; charset=utf-8', etag=None):
+            """ Sends a complete response """
+            # pylint: disable=too-many-arguments
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            if etag is not None:
+                self.send_header('ETag', etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            """ Keeps the console quiet - there's /__stats instead """
+
+    return FakeNewsHandler
+
+def start_server(site, port=0):
+    """ Serves the site from a background thread
+        port = integer; 0 picks a free one
+        Returns the ThreadingHTTPServer (server.server_port is the port, server.shutdown() stops
+        it)
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(site))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-news-server', daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Serve a fake BBC News site locally')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--articles', type=int, default=50)
+    parser.add_argument('--new-per-homepage', type=int, default=2)
+    parser.add_argument('--feed-size', type=int, default=40)
+    parser.add_argument('--paragraphs', type=int, default=25)
+    parser.add_argument('--change-rate', type=float, default=0.1)
+    parser.add_argument('--headline-rate', type=float, default=0.3)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--timeout-rate', type=float, default=0.0)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    fake_site = FakeNews(
+        articles=args.articles, new_per_homepage=args.new_per_homepage,
+        feed_size=args.feed_size, paragraphs=args.paragraphs, change_rate=args.change_rate,
+        headline_rate=args.headline_rate, error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate, latency=args.latency, seed=args.seed
+        )
+    http_server = start_server(fake_site, args.port)
+    print(f'Serving a fake news site at http://127.0.0.1:{http_server.server_port} ' +
+          '(Ctrl+C to stop)')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        http_server.shutdown()
@@ -0,0 +1,212 @@
+"""
+
+    ***Synthetic fixtures***
+    Generates realistic-looking (but entirely made up) BBC News article content for benchmarks,
+    so nothing has to be fetched from the live site
+
+    Everything is driven by a random.Random instance, so the same seed always gives the same
+    fixtures and results can be compared between runs.
+
+"""
+
+import json
+import random
+from xml.sax.saxutils import escape, quoteattr
+
+
+WORDS = (
+    'the of and to a in that is was he for it with as his on be at by had are but from or have '
+    'an they which one you were her all she there would their we him been has when who will more '
+    'no if out so said what up its about into than them can only other new some could time these '
+    'two may then do first any my now such like our over man me even most made after also did '
+    'many before must through back years where much your way well down should because each just '
+    'those people minister government police council report health school hospital election '
+    'party spokesperson announced confirmed statement investigation officials residents week '
+    'yesterday morning evening thousands millions pounds increase decrease plans changes warned '
+    'according figures published following decision support community local national public'
+    ).split()
+
+
+def make_sentence(rng, min_words=8, max_words=25):
+    """ Returns a single sentence of random words, capitalised and full-stopped """
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    return ' '.join(words).capitalize() + '.'
+
+def make_paragraph(rng, sentences=None):
+    """ Returns one body paragraph in the same form Article.parse_body() stores it: a <p> with no
+        class attributes, sometimes containing a link or bold text
+    """
+    if sentences is None:
+        sentences = rng.randint(1, 4)
+    text = ' '.join(make_sentence(rng) for _ in range(sentences))
+    roll = rng.random()
+    if roll < 0.15:
+        words = text.split(' ')
+        i = rng.randrange(len(words))
+        words[i] = f'<a href="https://www.bbc.co.uk/news/articles/c{rng.randrange(10**9):09d}">' + \
+            words[i] + '</a>'
+        text = ' '.join(words)
+    elif roll < 0.2:
+        text = '<b>' + text + '</b>'
+    return '<p>' + text + '</p>'
+
+def make_body(rng, paragraphs=40):
+    """ Returns an article body: one <p> per line, as stored in article.body """
+    return '\n'.join(make_paragraph(rng) for _ in range(paragraphs))
+
+def reword_sentence(rng, paragraph):
+    """ Changes a couple of words in the middle of a paragraph, like a typo fix or a small edit """
+    words = paragraph.split(' ')
+    for _ in range(2):
+        i = rng.randrange(1, max(len(words) - 1, 2))
+        if i < len(words) and '<' not in words[i] and '>' not in words[i]:
+            words[i] = rng.choice(WORDS)
+    return ' '.join(words)
+
+def mutate_body(rng, body, change_rate=0.1, insert_rate=0.05, delete_rate=0.02):
+    """ Returns a new version of body with a proportion of its paragraphs reworded, and some new
+        paragraphs inserted and old ones deleted - roughly what an editor updating a story does
+        change_rate, insert_rate, delete_rate = float; probability per paragraph
+    """
+    new_paragraphs = []
+    for paragraph in body.splitlines():
+        roll = rng.random()
+        if roll < delete_rate:
+            continue
+        if roll < delete_rate + change_rate:
+            paragraph = reword_sentence(rng, paragraph)
+        new_paragraphs.append(paragraph)
+        if rng.random() < insert_rate:
+            new_paragraphs.append(make_paragraph(rng))
+    return '\n'.join(new_paragraphs)
+
+def make_headline(rng):
+    """ Returns a headline, with curly quotes like the real pages use (which also means the page
+        doesn't decode to a compact 1 byte per character string)
+    """
+    return make_sentence(rng, 6, 12).rstrip('.').replace(' ', ' \u2018', 1) + '\u2019'
+
+def make_article_html(rng, url, paragraphs=40, links=300, headline=None, body=None):
+    """ Returns a whole article page as UTF-8 bytes, laid out the way Article.parse_all() expects
+        (h1 headline, text-block divs, byline-block div and <time> tags) and padded with the kind
+        of navigation links and embedded page data that make up most of a real page's size
+        links = integer; number of navigation/related links, the main thing driving page size
+        headline = string; made up if not given
+        body = list of <p> paragraph strings; made up (with the given number of paragraphs) if
+               not given
+        The navigation links are different every call, like the promos on the real pages
+    """
+    if body is None:
+        body = [make_paragraph(rng) for _ in range(paragraphs)]
+    if headline is None:
+        headline = make_headline(rng)
+    text_blocks = '\n'.join(
+        '<div data-component="text-block" class="ssrcss-1q0x1qg-Paragraph">' +
+        paragraph.replace('<p>', '<p class="ssrcss-83cqas-RichTextContainer">') +
+        '</div>'
+        for paragraph in body
+        )
+    nav = '\n'.join(
+        '<li class="ssrcss-1yh9qs5-ListItem"><a class="ssrcss-ok3ce3-Link" ' +
+        f'href="https://www.bbc.co.uk/news/articles/c{rng.randrange(10**9):09d}">' +
+        f'<span>{make_sentence(rng, 4, 10)}</span></a></li>'
+        for _ in range(links)
+        )
+    page_data = json.dumps({'url': url, 'headline': headline, 'blocks': body})
+    html = (
+        '<!DOCTYPE html><html lang="en-GB"><head><meta charset="utf-8">' +
+        f'<title>{headline} - BBC News</title></head><body>' +
+        f'<nav><ul>{nav}</ul></nav><main><article>' +
+        f'<h1 id="main-heading" class="ssrcss-1s9pby4-Heading">{headline}</h1>' +
+        '<div data-component="byline-block"><span>By Someone Reporter</span>' +
+        '<span>BBC News</span></div>' +
+        '<time data-testid="timestamp" datetime="2024-07-01T10:00:00.000Z">1 July 2024</time>' +
+        f'{text_blocks}</article></main>' +
+        f'<script id="__NEXT_DATA__" type="application/json">{page_data}</script>' +
+        '</body></html>'
+        )
+    return html.encode('utf-8')
+
+def make_homepage_html(rng, article_urls, other_links=200):
+    """ Returns a news homepage as UTF-8 bytes, with a link to each of the article URLs (plus the
+        '#comments' links and duplicates the real one has) among other links that
+        get_news_urls() should ignore
+        article_urls = list of strings; full https://www.bbc.co.uk/news/articles/... URLs
+        other_links = integer; links to live pages, videos, other sections etc
+    """
+    links = []
+    for url in article_urls:
+        path = url.replace('https://www.bbc.co.uk', '')
+        links.append(f'<a href="{path}" class="ssrcss-zmz0hi-PromoLink">' +
+                     f'<span>{make_sentence(rng, 5, 10)}</span></a>')
+        roll = rng.random()
+        if roll < 0.3:
+            links.append(f'<a href="{path}#comments">Comments</a>')
+        elif roll < 0.5:
+            # The same story promoted again further down the page
+            links.append(f'<a href="{path}"><img src="x.jpg" alt=""></a>')
+    for _ in range(other_links):
+        section = rng.choice(('live/uk-', 'videos/c', 'sport/football/', 'news/uk-'))
+        links.append(f'<a href="/{section}{rng.randrange(10**8)}">{make_sentence(rng, 3, 6)}</a>')
+    rng.shuffle(links)
+    items = '\n'.join(f'<li class="ssrcss-1ki8ie3-PromoItem">{link}</li>' for link in links)
+    return (
+        '<!DOCTYPE html><html lang="en-GB"><head><meta charset="utf-8">' +
+        f'<title>Home - BBC News</title></head><body><main><ul>{items}</ul></main></body></html>'
+        ).encode('utf-8')
+
+def make_feed_xml(rng, article_urls, title='BBC News', atom=False, other_items=5):
+    """ Returns a news feed as UTF-8 bytes, with an item for each article URL (linking to it on
+        bbc.com with the tracking parameters the real feeds add) among items for live pages and
+        videos that discovery should ignore
+        article_urls = list of strings; full https://www.bbc.co.uk/news/articles/... URLs
+        atom = boolean; an Atom feed rather than RSS 2.0
+        other_items = integer; non-article items mixed in
+    """
+    links = [
+        url.replace('https://www.bbc.co.uk', 'https://www.bbc.com') +
+        '?at_medium=RSS&at_campaign=rss'
+        for url in article_urls
+        ]
+    for _ in range(other_items):
+        section = rng.choice(('live/uk-', 'videos/c', 'sport/football/'))
+        links.insert(rng.randrange(len(links) + 1),
+                     f'https://www.bbc.com/{section}{rng.randrange(10**8)}')
+    items = []
+    for link in links:
+        headline = escape(make_headline(rng))
+        summary = escape(make_sentence(rng))
+        if atom:
+            items.append(
+                f'<entry><title>{headline}</title><link rel="alternate" href={quoteattr(link)}/>' +
+                f'<id>{escape(link)}</id><updated>2024-07-01T10:00:00Z</updated>' +
+                f'<summary>{summary}</summary></entry>'
+                )
+        else:
+            items.append(
+                f'<item><title><![CDATA[{headline}]]></title>' +
+                f'<description><![CDATA[{summary}]]></description>' +
+                f'<link>{escape(link)}</link><guid isPermaLink="false">{escape(link)}#0</guid>' +
+                '<pubDate>Mon, 01 Jul 2024 10:00:00 GMT</pubDate>' +
+                '<media:thumbnail width="240" height="135" ' +
+                'url="https://ichef.bbci.co.uk/ace/standard/240/x.jpg"/></item>'
+                )
+    if atom:
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>' +
+            '<feed xmlns="http://www.w3.org/2005/Atom">' +
+            f'<title>{escape(title)}</title><id>urn:fake-news</id>' +
+            '<link rel="self" href="https://feeds.bbci.co.uk/news/atom.xml"/>' +
+            '<updated>2024-07-01T10:00:00Z</updated>' + ''.join(items) + '</feed>'
+            ).encode('utf-8')
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>' +
+        '<rss xmlns:dc="http://purl.org/dc/elements/1.1/" ' +
+        'xmlns:media="http://search.yahoo.com/mrss/" version="2.0"><channel>' +
+        f'<title><![CDATA[{title}]]></title><link>https://www.bbc.co.uk/news</link>' +
+        '<language>en-gb</language><ttl>15</ttl>' + ''.join(items) + '</channel></rss>'
+        ).encode('utf-8')
+
+def make_rng(seed=0):
+    """ Returns a seeded random.Random so fixtures are the same on every run """
+    return random.Random(seed)
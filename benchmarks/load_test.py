@@ -0,0 +1,201 @@
+"""
+
+    ***Load test***
+    Serves the web interface with gunicorn (via wsgi.py) against a synthetic database and measures
+    throughput with 1, 2, 4... worker processes, to check requests per second scales with the
+    number of workers
+
+    Each run starts a fresh gunicorn, waits for it to answer, then has a number of client
+    processes request a mix of pages (home, article, fetch history and JSON API) as fast as they
+    can for a fixed time, each over its own keep-alive connection. The clients run in separate
+    processes so they don't share a GIL and end up being the bottleneck themselves.
+
+    Usage (from the benchmarks folder, needs gunicorn - Linux/macOS only):
+        python load_test.py [--workers 1 2 4] [--threads N] [--clients N] [--duration SECONDS]
+                            [--urls N] [--json out.json]
+
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import quote
+
+from synthetic_db import build_database
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WEB_DIR = os.path.join(HERE, '..', 'news_updates_monitor', 'web_interface')
+
+
+def get_free_port():
+    """ Returns a TCP port nothing is listening on """
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def make_paths(urls):
+    """ Returns the request mix: a list of paths, picked from at random by the clients """
+    paths = ['/', '/most_edited', '/api/articles?limit=100']
+    for url in urls:
+        quoted = quote(url, safe='')
+        paths += [
+            f'/article?url={quoted}',
+            f'/fetch_history?url={quoted}',
+            f'/api/article?url={quoted}',
+            ]
+    return paths
+
+def start_server(port, workers, threads, database, work_dir):
+    """ Starts gunicorn serving wsgi:app and waits until it answers
+        Returns the subprocess.Popen object
+    """
+    # pylint: disable=too-many-arguments
+    env = dict(os.environ)
+    env.update({
+        'WEB_INTERFACE_DATABASE': database,
+        'WEB_INTERFACE_DIFF_CACHE_PATH': os.path.join(work_dir, 'diff_cache.sqlite3'),
+        'WEB_INTERFACE_LOG_DIR': os.path.join(work_dir, 'log'),
+        })
+    server = subprocess.Popen(
+        [
+            sys.executable, '-m', 'gunicorn', '--chdir', WEB_DIR,
+            '-w', str(workers), '--threads', str(threads),
+            '-b', f'127.0.0.1:{port}', '--log-level', 'warning', 'wsgi:app'
+            ],
+        env=env
+        )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with code {server.returncode}')
+        try:
+            con = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            con.request('GET', '/api/articles?limit=1')
+            con.getresponse().read()
+            con.close()
+            # Give every worker time to finish booting, not just the first
+            time.sleep(1)
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('gunicorn did not start within 30 seconds')
+
+def stop_server(server):
+    """ Shuts gunicorn down gracefully """
+    server.terminate()
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+def run_client(args):
+    """ One client process: requests random paths until the duration is up
+        Returns (requests completed, errors, total seconds spent waiting for responses)
+    """
+    port, paths, duration, seed = args
+    rng = random.Random(seed)
+    con = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    completed = errors = 0
+    waiting = 0.0
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        path = rng.choice(paths)
+        start = time.perf_counter()
+        try:
+            con.request('GET', path, headers={'Accept-Encoding': 'gzip'})
+            response = con.getresponse()
+            response.read()
+            if response.status == 200:
+                completed += 1
+            else:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            con.close()
+            con = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        waiting += time.perf_counter() - start
+    con.close()
+    return completed, errors, waiting
+
+def load_test(workers, threads, clients, duration, database, paths):
+    """ Runs the load test against one gunicorn configuration
+        Returns a dict of the results
+    """
+    # pylint: disable=too-many-arguments
+    port = get_free_port()
+    with tempfile.TemporaryDirectory() as work_dir:
+        server = start_server(port, workers, threads, database, work_dir)
+        try:
+            with multiprocessing.Pool(clients) as pool:
+                results = pool.map(
+                    run_client, [(port, paths, duration, seed) for seed in range(clients)]
+                    )
+        finally:
+            stop_server(server)
+    completed = sum(result[0] for result in results)
+    errors = sum(result[1] for result in results)
+    waiting = sum(result[2] for result in results)
+    return {
+        'workers': workers,
+        'threads': threads,
+        'clients': clients,
+        'duration': duration,
+        'requests': completed,
+        'errors': errors,
+        'requests_per_second': completed / duration,
+        'mean_latency_ms': waiting / max(completed + errors, 1) * 1000,
+        }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description='Measure web interface throughput under gunicorn with different worker counts'
+        )
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4],
+                        help='worker process counts to test')
+    parser.add_argument('--threads', type=int, default=4, help='threads per worker')
+    parser.add_argument('--clients', type=int, default=16,
+                        help='concurrent client processes generating load')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per run')
+    parser.add_argument('--urls', type=int, default=500, help='URLs in the synthetic database')
+    parser.add_argument('--versions', type=int, default=5)
+    parser.add_argument('--fetches', type=int, default=50)
+    parser.add_argument('--json', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = os.path.join(temp_dir, 'load_test.sqlite3')
+        print(f'Building a database with {args.urls} URLs...')
+        article_urls = build_database(db_path, args.urls, args.versions, args.fetches)
+        request_paths = make_paths(article_urls)
+
+        all_results = []
+        baseline = None
+        print(f'{"workers":>8} {"req/s":>10} {"speed-up":>9} {"latency":>10} {"errors":>7}')
+        for worker_count in args.workers:
+            result = load_test(
+                worker_count, args.threads, args.clients, args.duration, db_path, request_paths
+                )
+            baseline = baseline or result['requests_per_second']
+            result['speed_up'] = result['requests_per_second'] / baseline if baseline else None
+            all_results.append(result)
+            print(
+                f'{worker_count:>8} {result["requests_per_second"]:>10.1f} ' +
+                f'{result["speed_up"] or 0:>8.2f}x {result["mean_latency_ms"]:>8.1f}ms ' +
+                f'{result["errors"]:>7}'
+                )
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'cpu_count': os.cpu_count(), 'results': all_results}, f, indent=2)
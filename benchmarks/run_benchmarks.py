@@ -0,0 +1,367 @@
+"""
+
+    ***Benchmark suite***
+    Times the monitor's hot paths and every web interface page against synthetic fixtures and
+    synthetic databases at different scales, entirely offline, and writes the results as JSON so
+    they can be compared between commits
+
+    Timed:
+        article     Article.parse_all(), is_copy() and the near-duplicate signature on synthetic
+                    article pages, and get_news_urls() on a synthetic homepage against
+                    discovery.parse_feed() on section feeds linking to the same articles
+        monitor     update_schedule_levels(), calculate_scheduled_urls() and check_articles()
+                    against a copy of each scale's database
+        web         each Flask route through the test client, against each scale's database
+
+    Scales are sized by the number of fetch rows: 10k, 100k and 1m (the last takes a while to
+    build, so it's only run when asked for). Built databases are kept in --cache-dir and reused
+    on later runs.
+
+    Usage (from the benchmarks folder):
+        python run_benchmarks.py [--scales 10k 100k] [--only article monitor web]
+                                 [--repeat N] [--json results.json] [--compare baseline.json]
+
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from datetime import datetime, timezone, timedelta
+from urllib.parse import quote
+
+from fixtures import make_rng, make_article_html, make_homepage_html, make_feed_xml
+from synthetic_db import build_database
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, '..', 'news_updates_monitor'))
+sys.path.append(os.path.join(HERE, '..', 'news_updates_monitor', 'monitor'))
+sys.path.append(os.path.join(HERE, '..', 'news_updates_monitor', 'web_interface'))
+# Disabling Pylint as it cannot detect the system path hacked local modules
+# pylint: disable=import-error,wrong-import-position
+from article import Article, table_row_to_article, dict_factory
+import search
+import validity
+import change_stats
+import discovery
+import minhash
+import monitor
+import web_interface
+# pylint: enable=import-error,wrong-import-position
+
+
+# Fetch rows = urls x fetches per URL
+SCALES = {
+    '10k': {'urls': 500, 'versions': 3, 'fetches': 20},
+    '100k': {'urls': 5000, 'versions': 3, 'fetches': 20},
+    '1m': {'urls': 50000, 'versions': 3, 'fetches': 20},
+    }
+GROUPS = ('article', 'monitor', 'web')
+# Articles passed to each check_articles() call, as found in a busy run: mostly unchanged, some
+# updated and a few brand new
+CHECK_BATCH = {'unchanged': 160, 'changed': 30, 'new': 10}
+# A benchmark this much slower than the baseline is reported as a regression by --compare
+REGRESSION_THRESHOLD = 1.2
+
+
+def time_call(func, repeat, setup=None):
+    """ Calls func repeat times and returns a dict of timings in seconds
+        setup = function called (untimed) before each call, whose return value is passed to func
+    """
+    times = []
+    for _ in range(repeat):
+        args = () if setup is None else (setup(),)
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return {'median': statistics.median(times), 'min': min(times), 'repeat': repeat}
+
+def prepare_database(scale, cache_dir):
+    """ Builds the database for a scale (or reuses the one built by an earlier run), with the
+        search index, validity intervals and change statistics filled in as the monitor would
+        have, and the URLs spread across every schedule level
+        Returns the path to the database
+    """
+    path = os.path.join(cache_dir, f'synthetic_{scale}.sqlite3')
+    if os.path.exists(path):
+        return path
+    size = SCALES[scale]
+    print(f'Building the {scale} database ({size["urls"]} URLs x {size["fetches"]} fetches)...')
+    building = path + '.building'
+    # Fetches an hour apart, so the URLs are old enough for the schedule to matter
+    build_database(
+        building, size['urls'], size['versions'], size['fetches'], paragraphs=15,
+        interval=timedelta(hours=1)
+        )
+    con = sqlite3.connect(building)
+    search.backfill(con)
+    validity.backfill(con)
+    change_stats.backfill(con)
+    with con:
+        con.execute('UPDATE tracking SET schedule_level = 1 + rowid % 6')
+    con.close()
+    os.replace(building, path)
+    return path
+
+def copy_database(path, work_dir):
+    """ Returns a fresh copy of a database for a benchmark that writes to it """
+    copy = os.path.join(work_dir, 'copy.sqlite3')
+    shutil.copyfile(path, copy)
+    return copy
+
+def make_check_batch(path, rng):
+    """ Builds a list of parsed Articles for check_articles() from a database: copies of the
+        latest versions of some URLs, edited versions of others and some new URLs. Adds the
+        tracking and fetch rows urls_to_parsed_articles() would have added for them.
+    """
+    con = sqlite3.connect(path)
+    con.row_factory = dict_factory
+    wanted = CHECK_BATCH['unchanged'] + CHECK_BATCH['changed']
+    rows = con.execute(
+        """
+        SELECT * FROM article
+        WHERE article_id IN (SELECT MAX(article_id) FROM article GROUP BY url)
+        ORDER BY article_id DESC
+        LIMIT ?
+        """, (wanted,)
+        ).fetchall()
+    articles = [table_row_to_article(row) for row in rows]
+    for article in articles[CHECK_BATCH['unchanged']:]:
+        article.parsed['body'] += '\n<p>This story has been updated.</p>'
+    for i in range(CHECK_BATCH['new']):
+        url = f'https://www.bbc.co.uk/news/articles/cbench{i:06d}'
+        article = Article(url=url)
+        article.raw_html = make_article_html(rng, url, 25)
+        article.parse_all()
+        con.execute('INSERT INTO tracking VALUES(?, 1)', (url,))
+        articles.append(article)
+    now = datetime.now(timezone.utc)
+    for i, article in enumerate(articles):
+        article.fetched_timestamp = (now + timedelta(microseconds=i)).isoformat()
+        con.execute(
+            """
+            INSERT INTO fetch(url, schedule_level, fetched_timestamp, status)
+            VALUES(?, 1, ?, '200')
+            """, (article.url, article.fetched_timestamp)
+            )
+    con.commit()
+    con.close()
+    return articles
+
+def bench_article(repeat):
+    """ Times parsing, comparing and homepage link extraction on synthetic pages """
+    rng = make_rng(0)
+    results = {}
+    for paragraphs in (10, 40, 150):
+        page = make_article_html(rng, 'https://www.bbc.co.uk/news/articles/c0000000001', paragraphs)
+
+        def parse(page=page):
+            article = Article(url='https://www.bbc.co.uk/news/articles/c0000000001')
+            article.raw_html = page
+            article.parse_all()
+            return article
+
+        results[f'article.parse_all[{paragraphs}p]'] = time_call(parse, repeat * 4)
+        first, second = parse(), parse()
+        results[f'article.is_copy[{paragraphs}p]'] = time_call(
+            lambda a=first, b=second: [a.is_copy(b) for _ in range(1000)], repeat
+            )
+        results[f'article.is_copy[{paragraphs}p]']['calls_per_run'] = 1000
+        # Worked out for every new version as it's stored
+        results[f'minhash.compute_signature[{paragraphs}p]'] = time_call(
+            lambda body=first.parsed['body']: minhash.compute_signature(body), repeat * 4
+            )
+
+    article_urls = [f'https://www.bbc.co.uk/news/articles/c{i:010d}' for i in range(300)]
+    homepage = make_homepage_html(rng, article_urls, other_links=300).decode('utf-8')
+    monitor.request_html = lambda url: homepage
+    found = monitor.get_news_urls()
+    assert sorted(found) == sorted(article_urls), 'get_news_urls() missed homepage links'
+    results['monitor.get_news_urls'] = time_call(monitor.get_news_urls, repeat * 4)
+    # The same articles spread over 7 section feeds of up to 40 items each
+    feeds = [make_feed_xml(rng, article_urls[i::7][:40]) for i in range(7)]
+
+    def read_feeds():
+        return {url for feed in feeds
+                for url in discovery.parse_feed(io.BytesIO(feed), 'https://www.bbc.co.uk')}
+
+    assert read_feeds() <= set(article_urls), 'parse_feed() found links that aren\'t articles'
+    results['discovery.parse_feed[7 feeds]'] = time_call(read_feeds, repeat * 4)
+    return results
+
+def bench_monitor(path, scale, repeat, work_dir):
+    """ Times the monitor functions that read and write the database """
+    results = {}
+
+    def use_copy():
+        monitor.DATABASE = copy_database(path, work_dir)
+
+    results[f'monitor.update_schedule_levels[{scale}]'] = time_call(
+        lambda _: monitor.update_schedule_levels(), repeat, use_copy
+        )
+    monitor.DATABASE = path
+    results[f'monitor.calculate_scheduled_urls[{scale}]'] = time_call(
+        monitor.calculate_scheduled_urls, repeat
+        )
+
+    def check_setup():
+        use_copy()
+        return make_check_batch(monitor.DATABASE, make_rng(1))
+
+    results[f'monitor.check_articles[{scale}]'] = time_call(
+        monitor.check_articles, repeat, check_setup
+        )
+    results[f'monitor.check_articles[{scale}]']['articles_per_call'] = sum(CHECK_BATCH.values())
+    return results
+
+def get_route_paths(path):
+    """ Returns {benchmark name: path} for each page, using real URLs and IDs from the database """
+    con = sqlite3.connect(path)
+    # The URL with the most versions makes for the heaviest article pages
+    url, id_a, id_b = con.execute(
+        """
+        SELECT url, MIN(article_id), MAX(article_id) FROM article
+        GROUP BY url ORDER BY COUNT(*) DESC, url LIMIT 1
+        """
+        ).fetchone()
+    at, = con.execute(
+        'SELECT fetched_timestamp FROM fetch ORDER BY fetch_id DESC LIMIT 1'
+        ).fetchone()
+    con.close()
+    quoted = quote(url, safe='')
+    quoted_at = quote(at, safe='')
+    return {
+        'home': '/',
+        'article': f'/article?url={quoted}',
+        'fetch_history': f'/fetch_history?url={quoted}',
+        'compare': f'/compare?id_a={id_a}&id_b={id_b}',
+        'most_edited': '/most_edited',
+        'headline_changes': '/headline_changes',
+        'search': '/search?q=government+minister',
+        'search_all': '/search?q=government+minister&mode=all',
+        'as_of': f'/as_of?at={quoted_at}',
+        'article_as_of': f'/article/as_of?url={quoted}&at={quoted_at}',
+        'api_articles': '/api/articles?limit=500',
+        'api_article': f'/api/article?url={quoted}',
+        'api_versions': f'/api/versions?url={quoted}',
+        'api_fetches': f'/api/fetches?url={quoted}',
+        }
+
+def bench_web(path, scale, repeat, work_dir):
+    """ Times every page through the Flask test client. /compare is served from the diff cache
+        after the first call, so it's timed warm.
+    """
+    app = web_interface.configure_app()
+    app.config['DATABASE'] = path
+    app.config['DIFF_CACHE_PATH'] = os.path.join(work_dir, f'diff_cache_{scale}.sqlite3')
+    # A new diff cache for each database, as the cache keys are article IDs
+    app.extensions.pop('diff_cache', None)
+    client = app.test_client()
+    results = {}
+    for name, route in get_route_paths(path).items():
+
+        def fetch(route=route):
+            response = client.get(route)
+            response.get_data()
+            response.close()
+            assert response.status_code == 200, f'{route} returned {response.status_code}'
+
+        fetch()
+        results[f'web.{name}[{scale}]'] = time_call(fetch, repeat)
+    return results
+
+def get_commit():
+    """ Returns the current git commit hash, or None if it's not a git checkout """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=HERE, capture_output=True, text=True, check=True
+            ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_results(results, baseline_path):
+    """ Prints each benchmark's change against a previous run's JSON file
+        Returns the number of regressions (slower by REGRESSION_THRESHOLD or more)
+    """
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f'\nCompared with {baseline_path} (commit {baseline.get("commit")}):')
+    regressions = 0
+    for name, timing in results.items():
+        old = baseline['results'].get(name)
+        if old is None:
+            print(f'{name:<48} {"new":>10}')
+            continue
+        ratio = timing['median'] / old['median'] if old['median'] else float('inf')
+        flag = ''
+        if ratio >= REGRESSION_THRESHOLD:
+            flag = '  REGRESSION'
+            regressions += 1
+        elif ratio <= 1 / REGRESSION_THRESHOLD:
+            flag = '  faster'
+        print(f'{name:<48} {ratio:>9.2f}x{flag}')
+    return regressions
+
+def main():
+    """ Runs the chosen benchmark groups at each scale, prints and saves the results """
+    parser = argparse.ArgumentParser(description='Run the offline benchmark suite')
+    parser.add_argument('--scales', nargs='+', choices=SCALES, default=['10k', '100k'])
+    parser.add_argument('--only', nargs='+', choices=GROUPS, default=list(GROUPS),
+                        help='benchmark groups to run')
+    parser.add_argument('--repeat', type=int, default=5, help='timed calls per benchmark')
+    parser.add_argument('--cache-dir', default=os.path.join(HERE, 'cache'),
+                        help='where the synthetic databases are kept between runs')
+    parser.add_argument('--json', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='a previous --json file to compare the results with')
+    args = parser.parse_args()
+
+    # Only warnings and errors from the code being timed
+    logging.basicConfig(level=logging.WARNING)
+    # The monitor pauses so its progress can be read in the console, which isn't wanted here
+    monitor.time = types.SimpleNamespace(sleep=lambda seconds: None)
+    os.makedirs(args.cache_dir, exist_ok=True)
+
+    results = {}
+    if 'article' in args.only:
+        results.update(bench_article(args.repeat))
+    with tempfile.TemporaryDirectory() as work_dir:
+        for scale in args.scales:
+            if 'monitor' not in args.only and 'web' not in args.only:
+                break
+            path = prepare_database(scale, args.cache_dir)
+            if 'monitor' in args.only:
+                results.update(bench_monitor(path, scale, args.repeat, work_dir))
+            if 'web' in args.only:
+                results.update(bench_web(path, scale, args.repeat, work_dir))
+
+    for name, timing in results.items():
+        print(f'{name:<48} {timing["median"] * 1000:>10.2f} ms  (min {timing["min"] * 1000:.2f})')
+
+    output = {
+        'benchmark': 'suite',
+        'commit': get_commit(),
+        'created': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scales': {scale: SCALES[scale] for scale in args.scales},
+        'results': results,
+        }
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2)
+    if args.compare and compare_results(results, args.compare):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+
+    ***Synthetic database***
+    Builds a news_updates_monitor database full of made-up articles, versions and fetches, with
+    the same schema and counters as the real thing, for benchmarking the monitor and web interface
+
+    Usage (from the benchmarks folder):
+        python synthetic_db.py path/to/output.sqlite3 [--urls N] [--versions N] [--fetches N]
+
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+from datetime import datetime, timezone, timedelta
+
+from fixtures import make_rng, make_body, make_sentence, mutate_body
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'news_updates_monitor')
+    )
+# Disabling Pylint as it cannot detect the system path hacked local module
+# pylint: disable-next=import-error,wrong-import-position
+from database import apply_schema
+# pylint: disable-next=import-error,wrong-import-position
+from counters import rebuild_counters
+
+
+BASE_URL = 'https://www.bbc.co.uk/news/articles/'
+
+
+def build_database(path, urls=100, versions=3, fetches=20, paragraphs=25, seed=0,
+                   start=None, interval=timedelta(minutes=15)):
+    """ Creates (or replaces) a database at path
+        urls = integer; number of tracked article URLs
+        versions = integer; snapshots stored per URL (the first plus versions - 1 changes)
+        fetches = integer; fetch rows per URL (at least versions, the rest are unchanged fetches)
+        paragraphs = integer; body length of the first version of each article
+        start = datetime of the first fetch (default: enough time before now for every fetch)
+        interval = timedelta between a URL's fetches
+        The versions are spread evenly through each URL's fetches, and the URLs are interleaved
+        the same way the monitor would write them, so the row order is realistic
+    """
+    # pylint: disable=too-many-arguments,too-many-locals
+    if os.path.exists(path):
+        os.remove(path)
+    if start is None:
+        start = datetime.now(timezone.utc) - interval * (fetches + 1)
+    fetches = max(fetches, versions)
+    rng = make_rng(seed)
+    con = sqlite3.connect(path)
+    apply_schema(con)
+    rebuild_counters(con)
+
+    states = []
+    for i in range(urls):
+        url = f'{BASE_URL}c{i:010d}'
+        con.execute('INSERT INTO tracking VALUES(?, 1)', (url,))
+        states.append({
+            'url': url,
+            'headline': make_sentence(rng, 5, 12).rstrip('.'),
+            'body': make_body(rng, paragraphs),
+            # The fetch numbers where a new version was found
+            'changes': set(rng.sample(range(1, fetches), versions - 1)) | {0},
+            })
+
+    for n in range(fetches):
+        timestamp = (start + interval * n).isoformat()
+        for state in states:
+            article_id = None
+            if n in state['changes']:
+                if n:
+                    # Equal insert/delete rates so bodies don't keep growing over many versions
+                    state['body'] = mutate_body(rng, state['body'], 0.1, 0.02, 0.02)
+                    if rng.random() < 0.2:
+                        state['headline'] = make_sentence(rng, 5, 12).rstrip('.')
+                cursor = con.execute(
+                    """
+                    INSERT INTO article(url, raw_html, fetched_timestamp, headline, body, byline,
+                                        _timestamp, parse_errors)
+                    VALUES(?, NULL, ?, ?, ?, ?, ?, 0)
+                    """,
+                    (state['url'], timestamp, state['headline'], state['body'],
+                     'By A Reporter, BBC News', start.isoformat())
+                    )
+                article_id = cursor.lastrowid
+            con.execute(
+                """
+                INSERT INTO fetch(url, schedule_level, fetched_timestamp, status, changed,
+                                  article_id)
+                VALUES(?, 1, ?, '200', ?, ?)
+                """,
+                (state['url'], timestamp, article_id is not None and n > 0, article_id)
+                )
+        # Committing every round would spend most of the time waiting on the disk
+        if n % 100 == 99:
+            con.commit()
+    con.commit()
+    con.close()
+    return [state['url'] for state in states]
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Build a synthetic news_updates_monitor database')
+    parser.add_argument('path', help='database file to create (replaced if it exists)')
+    parser.add_argument('--urls', type=int, default=100)
+    parser.add_argument('--versions', type=int, default=3)
+    parser.add_argument('--fetches', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    build_database(args.path, args.urls, args.versions, args.fetches, seed=args.seed)
@@ -1,4 +1,7 @@
-CREATE TABLE article (
+-- Every statement uses IF NOT EXISTS so the whole file can be re-run against an existing database
+-- (see database.apply_schema) to add any tables, indexes or triggers introduced since it was made
+
+CREATE TABLE IF NOT EXISTS article (
   article_id INTEGER PRIMARY KEY,
   url TEXT,
   raw_html TEXT,
@@ -10,12 +13,12 @@ CREATE TABLE article (
   parse_errors INTEGER -- Boolean as INT
 );
 
-CREATE TABLE tracking (
+CREATE TABLE IF NOT EXISTS tracking (
   url TEXT NOT NULL PRIMARY KEY,
   schedule_level INTEGER
 );
 
-CREATE TABLE fetch (
+CREATE TABLE IF NOT EXISTS fetch (
   fetch_id INTEGER PRIMARY KEY,
   url TEXT,
   schedule_level INTEGER,
@@ -26,3 +29,245 @@ CREATE TABLE fetch (
   FOREIGN KEY(url) REFERENCES tracking(url),
   FOREIGN KEY(article_id) REFERENCES article(article_id)
 );
+
+-- Most lookups of the article table are for the versions of a single URL
+CREATE INDEX IF NOT EXISTS article_url ON article(url, article_id);
+-- and the fetch history of a single URL, in order (see /fetch_history)
+CREATE INDEX IF NOT EXISTS fetch_url ON fetch(url, fetch_id);
+
+-- Summary counters: maintained by the triggers below so the web interface and weekly report never
+-- need to COUNT(*) the big tables. Only ever has the one row (id = 1), which is created by
+-- counters.rebuild_counters() - the triggers do nothing until that row exists.
+CREATE TABLE IF NOT EXISTS summary (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  total_urls INTEGER NOT NULL,
+  total_snapshots INTEGER NOT NULL,
+  total_fetches INTEGER NOT NULL
+);
+
+-- Per-URL counters (no foreign key as article.url is the post-redirect URL)
+CREATE TABLE IF NOT EXISTS url_summary (
+  url TEXT NOT NULL PRIMARY KEY,
+  snapshots INTEGER NOT NULL DEFAULT 0,
+  fetches INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TRIGGER IF NOT EXISTS tracking_insert_counters AFTER INSERT ON tracking
+BEGIN
+  UPDATE summary SET total_urls = total_urls + 1;
+  INSERT OR IGNORE INTO url_summary(url) VALUES (NEW.url);
+END;
+
+CREATE TRIGGER IF NOT EXISTS tracking_delete_counters AFTER DELETE ON tracking
+BEGIN
+  UPDATE summary SET total_urls = total_urls - 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS article_insert_counters AFTER INSERT ON article
+BEGIN
+  UPDATE summary SET total_snapshots = total_snapshots + 1;
+  INSERT INTO url_summary(url, snapshots) VALUES (NEW.url, 1)
+    ON CONFLICT(url) DO UPDATE SET snapshots = snapshots + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS article_delete_counters AFTER DELETE ON article
+BEGIN
+  UPDATE summary SET total_snapshots = total_snapshots - 1;
+  UPDATE url_summary SET snapshots = snapshots - 1 WHERE url = OLD.url;
+END;
+
+CREATE TRIGGER IF NOT EXISTS fetch_insert_counters AFTER INSERT ON fetch
+BEGIN
+  UPDATE summary SET total_fetches = total_fetches + 1;
+  INSERT INTO url_summary(url, fetches) VALUES (NEW.url, 1)
+    ON CONFLICT(url) DO UPDATE SET fetches = fetches + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS fetch_delete_counters AFTER DELETE ON fetch
+BEGIN
+  UPDATE summary SET total_fetches = total_fetches - 1;
+  UPDATE url_summary SET fetches = fetches - 1 WHERE url = OLD.url;
+END;
+
+-- What changed in each new version of an article, worked out by the monitor when it stores the
+-- version (see change_stats.py) so listings never need to diff anything on demand
+CREATE TABLE IF NOT EXISTS article_change (
+  article_id INTEGER PRIMARY KEY, -- the new version
+  previous_article_id INTEGER,
+  url TEXT,
+  version INTEGER, -- version number of the new snapshot (the first snapshot is version 1)
+  changed_timestamp TEXT, -- fetched_timestamp of the new version
+  headline_changed INTEGER, -- Boolean as INT
+  body_changed INTEGER, -- Boolean as INT
+  byline_changed INTEGER, -- Boolean as INT
+  timestamp_changed INTEGER, -- Boolean as INT
+  previous_headline TEXT, -- only set when headline_changed
+  headline TEXT, -- only set when headline_changed
+  chars_added INTEGER,
+  chars_removed INTEGER,
+  paragraphs_added INTEGER,
+  paragraphs_removed INTEGER,
+  paragraphs_edited INTEGER,
+  FOREIGN KEY(article_id) REFERENCES article(article_id),
+  FOREIGN KEY(previous_article_id) REFERENCES article(article_id)
+);
+
+CREATE INDEX IF NOT EXISTS article_change_timestamp ON article_change(changed_timestamp);
+CREATE INDEX IF NOT EXISTS article_change_headline ON article_change(headline_changed, article_id);
+CREATE INDEX IF NOT EXISTS article_change_url ON article_change(url, article_id);
+
+-- Full-text search index of every version's headline and body (with the HTML stripped out), the
+-- rowid is the article_id. Filled in by Article.store() via search.index_article().
+CREATE VIRTUAL TABLE IF NOT EXISTS article_fts USING fts5(
+  headline,
+  body,
+  tokenize = 'porter unicode61 remove_diacritics 2'
+);
+
+-- The same again for only the latest version of each URL, so searching current versions never
+-- has to look at older ones. search.index_article() replaces a URL's version when a newer one is
+-- stored.
+CREATE VIRTUAL TABLE IF NOT EXISTS article_fts_current USING fts5(
+  headline,
+  body,
+  tokenize = 'porter unicode61 remove_diacritics 2'
+);
+
+-- When each version was the live one: valid_from is when it was first fetched, valid_to when the
+-- next version was first fetched (NULL while it's the latest) and last_seen the latest fetch that
+-- found it unchanged. Maintained by the monitor (see validity.py).
+CREATE TABLE IF NOT EXISTS article_validity (
+  article_id INTEGER PRIMARY KEY,
+  url TEXT NOT NULL,
+  valid_from TEXT NOT NULL,
+  valid_to TEXT,
+  last_seen TEXT,
+  FOREIGN KEY(article_id) REFERENCES article(article_id)
+);
+
+-- Covers every column so point-in-time lookups never need to read the table itself
+CREATE INDEX IF NOT EXISTS article_validity_url
+  ON article_validity(url, valid_from, valid_to, last_seen);
+
+-- One row per stored version, in the order they were stored, for the web interface's /events
+-- feed. AUTOINCREMENT so a change_id is never reused, as clients resume from the last one seen.
+CREATE TABLE IF NOT EXISTS change_log (
+  change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  article_id INTEGER NOT NULL,
+  url TEXT NOT NULL,
+  kind TEXT NOT NULL, -- 'new' (first version of a URL) or 'changed'
+  headline TEXT,
+  fetched_timestamp TEXT
+);
+
+CREATE TRIGGER IF NOT EXISTS article_insert_change_log AFTER INSERT ON article
+BEGIN
+  INSERT INTO change_log(article_id, url, kind, headline, fetched_timestamp)
+  VALUES (
+    NEW.article_id,
+    NEW.url,
+    CASE WHEN EXISTS (
+      SELECT 1 FROM article WHERE url = NEW.url AND article_id < NEW.article_id
+      ) THEN 'changed' ELSE 'new' END,
+    NEW.headline,
+    NEW.fetched_timestamp
+    );
+END;
+
+-- Fingerprint of the article region of the last fully parsed page for each URL, and the version
+-- it parsed to. A fetch with the same fingerprint can skip parsing (see fingerprint.py).
+CREATE TABLE IF NOT EXISTS region_fingerprint (
+  url TEXT PRIMARY KEY,
+  article_id INTEGER NOT NULL,
+  fingerprint TEXT NOT NULL,
+  FOREIGN KEY(article_id) REFERENCES article(article_id)
+);
+
+-- Conditional GET state for each discovery feed (see discovery.py): the ETag and Last-Modified of
+-- the last successful read, so an unchanged feed costs a 304 rather than a download
+CREATE TABLE IF NOT EXISTS feed_state (
+  feed_url TEXT PRIMARY KEY,
+  etag TEXT,
+  last_modified TEXT,
+  last_checked TEXT,
+  last_status TEXT,
+  items INTEGER -- article links in the feed when it was last read
+);
+
+-- Bulk ingestion of archived pages (see ingest.py). Each capture is parsed and staged here first,
+-- then applied to the article/fetch tables in time order per URL. Applied captures keep their
+-- key (so re-reading an archive doesn't add them again) but their parsed fields are cleared.
+CREATE TABLE IF NOT EXISTS ingest_capture (
+  capture_id INTEGER PRIMARY KEY,
+  url TEXT NOT NULL,
+  fetched_timestamp TEXT NOT NULL,
+  source TEXT, -- the WARC or HTML file it came from
+  fingerprint TEXT,
+  headline TEXT,
+  body TEXT,
+  byline TEXT,
+  _timestamp TEXT,
+  parse_errors INTEGER, -- Boolean as INT
+  result TEXT, -- NULL until applied, then 'new', 'changed', 'unchanged' or 'older'
+  article_id INTEGER, -- the version it was stored as or matched
+  UNIQUE(url, fetched_timestamp)
+);
+
+CREATE INDEX IF NOT EXISTS ingest_capture_pending
+  ON ingest_capture(url, fetched_timestamp) WHERE result IS NULL;
+CREATE INDEX IF NOT EXISTS ingest_capture_fingerprint
+  ON ingest_capture(url, fingerprint) WHERE result IS NULL;
+
+-- How far through each WARC file ingest.py has got: offset is the position in the uncompressed
+-- file after the last record whose captures have been staged
+CREATE TABLE IF NOT EXISTS ingest_source (
+  path TEXT PRIMARY KEY,
+  size INTEGER,
+  offset INTEGER NOT NULL DEFAULT 0,
+  complete INTEGER NOT NULL DEFAULT 0, -- Boolean as INT
+  captures INTEGER NOT NULL DEFAULT 0
+);
+
+-- MinHash signature of each version's body (NUM_HASHES 32 bit ints) for finding the same story
+-- published under different URLs (see minhash.py). Filled in by Article.store() via
+-- minhash.index_minhash(); bodies too short to compare meaningfully aren't included.
+CREATE TABLE IF NOT EXISTS article_minhash (
+  article_id INTEGER PRIMARY KEY,
+  url TEXT NOT NULL,
+  signature BLOB NOT NULL,
+  FOREIGN KEY(article_id) REFERENCES article(article_id)
+);
+
+CREATE INDEX IF NOT EXISTS article_minhash_url ON article_minhash(url, article_id);
+
+-- Locality-sensitive hashing index: one row per band of each signature, the bucket being a hash of
+-- the band's values (and its number). Versions sharing a bucket are near-duplicate candidates.
+CREATE TABLE IF NOT EXISTS minhash_band (
+  bucket INTEGER NOT NULL,
+  article_id INTEGER NOT NULL,
+  PRIMARY KEY(bucket, article_id)
+) WITHOUT ROWID;
+
+-- Each continuous stretch of homepage reads a URL was on the homepage for (see homepage.py), so a
+-- link that stays on it for days is one row rather than one per read. positions is the URL's
+-- position on each of those reads, run-length encoded as "position*reads" pairs, e.g. "1*4 3*2".
+CREATE TABLE IF NOT EXISTS homepage_run (
+  run_id INTEGER PRIMARY KEY,
+  url TEXT NOT NULL,
+  first_seen TEXT NOT NULL,
+  last_seen TEXT NOT NULL,
+  reads INTEGER NOT NULL,
+  best_position INTEGER NOT NULL,
+  last_position INTEGER NOT NULL,
+  positions TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS homepage_run_url ON homepage_run(url, first_seen);
+CREATE INDEX IF NOT EXISTS homepage_run_last_seen ON homepage_run(last_seen, last_position);
+
+-- Every successful homepage read, and how many article links it had. Runs whose last_seen is the
+-- latest of these are still on the homepage.
+CREATE TABLE IF NOT EXISTS homepage_check (
+  checked_timestamp TEXT PRIMARY KEY,
+  links INTEGER NOT NULL
+);
@@ -9,6 +9,9 @@ import logging
 
 import bs4
 
+from search import index_article
+from minhash import index_minhash
+
 
 logger = logging.getLogger(__name__)
 
@@ -16,14 +19,22 @@ class Article():
     """ An Article object represents a snapshot in time of one individual BBC News article
         It can be used to scrape and parse a news article given any valid BBC news URL
         Only designed to work with '/news/...' URLs - does NOT work with Live or Video posts etc.
+        Uses __slots__ rather than a __dict__ per object, as a whole run's worth of fetched
+        articles are held in memory at once before they're checked and stored
     """
 
+    __slots__ = ('url', 'raw_html', 'fetched_timestamp', 'soup', 'parsed', 'fingerprint')
+
+    # The article table's columns other than the parsed ones, in the order they're stored
+    ROW_FIELDS = ('url', 'raw_html', 'fetched_timestamp')
+
     def __init__(self, **kwargs):
         """
         url = string
-        raw_html = string (default: None)
+        raw_html = string, or bytes straight from the response (default: None)
         fetched_timestamp = ISO8601 datetime as string (default: None)
         soup = bs4.BeautifulSoup.Soup object (default: None)
+        fingerprint = string; hash of the page's article region, see fingerprint.py (default: None)
         parsed = dict {
             'headline': string (default: empty string)
             'body': string (default: empty string)
@@ -46,6 +57,7 @@ class Article():
         self.fetched_timestamp = kwargs.get('fetched_timestamp')
         self.soup = None
         self.parsed = parsed
+        self.fingerprint = kwargs.get('fingerprint')
 
     def __str__(self):
         """ This may change for now but I need to pick something... 
@@ -60,13 +72,26 @@ class Article():
         """
         self.raw_html = request_html(self.url)
 
-    def parse_all(self):
-        """ Creates the soup and calls all the individual parse methods """
-        self.soup = bs4.BeautifulSoup(self.raw_html, 'lxml')
-        self.parse_headline()
-        self.parse_body()
-        self.parse_byline()
-        self.parse_timestamp()
+    def parse_all(self, encoding='utf-8'):
+        """ Creates the soup and calls all the individual parse methods
+            The soup is thrown away afterwards as it's many times the size of the HTML and nothing
+            needs it once the parsed dict is filled in
+            encoding = string; used when raw_html is bytes, so lxml decodes it directly rather
+                       than having the response decoded to a string first (and bs4 guessing)
+        """
+        if isinstance(self.raw_html, bytes):
+            self.soup = bs4.BeautifulSoup(self.raw_html, 'lxml', from_encoding=encoding)
+        else:
+            self.soup = bs4.BeautifulSoup(self.raw_html, 'lxml')
+        try:
+            self.parse_headline()
+            self.parse_body()
+            self.parse_byline()
+            self.parse_timestamp()
+        finally:
+            # Breaks up the tree's reference cycles so it's freed now, not by a later GC pass
+            self.soup.decompose()
+            self.soup = None
 
     def parse_headline(self):
         """ Parses the article headline and logs a parse error if it fails """
@@ -166,10 +191,12 @@ class Article():
             self.parsed['body'], self.parsed['byline'], self.parsed['_timestamp']
             )
 
-    def store(self, con):
+    def store(self, con, commit=True):
         """ Stores the Article object in persistent storage using sqlite
             Is now used to store both brand new articles and updates to existing articles
             con = sqlite3.Connection object (currenlty open DB connection from main_loop() )
+            commit = boolean; False leaves the transaction open for the caller to commit, e.g.
+                     ingest.py storing a batch of versions at a time
         """
         self.soup = None
         # Remove next line for debugging raw_html if required
@@ -180,20 +207,25 @@ class Article():
         # Format values string for SQL query based on named parameter binding syntax
         values = ':' + ', :'.join(row_dict.keys())
         cursor = con.execute(f"INSERT INTO article({columns}) VALUES({values})", row_dict)
-        con.commit()
         article_id = cursor.lastrowid
+        # Indexed in the same transaction so the search index never misses a version
+        index_article(con, article_id, self.url, row_dict['headline'], row_dict['body'])
+        index_minhash(con, article_id, self.url, row_dict['body'])
+        if commit:
+            con.commit()
         logger.debug('Added article object to article table at ID %s: %s',article_id, self.url)
         return article_id
 
     def to_row_dict(self):
-        """ Converts the Article object into a dictionary suitable for passing into the SQLite
+        """ Converts the Article object into a new dictionary suitable for passing into the SQLite
             database as a new row. The parsed dicitonary is also flattened out.
+            The Article itself is left as it was, so it can still be used after storing
         """
-        article_dict = self.__dict__
-        article_dict.update(article_dict['parsed'])
-        del article_dict['parsed']
-        del article_dict['soup']
-        return article_dict
+        row_dict = {field: getattr(self, field) for field in self.ROW_FIELDS}
+        if isinstance(row_dict['raw_html'], bytes):
+            row_dict['raw_html'] = row_dict['raw_html'].decode('utf-8', errors='replace')
+        row_dict.update(self.parsed)
+        return row_dict
 
     def is_copy(self, other):
         """ Boolean function that checks if one Article object is a copy of another
@@ -0,0 +1,269 @@
+"""
+
+    ***Article Diff***
+    A paragraph and word-level diff engine for comparing article snapshots
+
+    difflib.HtmlDiff only works line by line (i.e. paragraph by paragraph for the article body),
+    so a single reworded sentence highlights the whole <p>, and it can get very slow on long
+    articles with a lot of changed lines. This module instead:
+        1. Aligns the paragraphs of the two versions
+        2. For paragraphs that were edited, diffs the individual words so only the actual
+           changes are highlighted
+    Both steps use Myers' O(ND) algorithm with the linear space refinement (finding the 'middle
+    snake' and splitting the problem in two), so the cost depends on the size of the changes
+    rather than the product of the two lengths.
+
+    make_table() produces a <table class="diff"> using the same CSS classes as difflib.HtmlDiff so
+    it can be dropped straight into the compare.html template.
+
+"""
+
+import re
+from html import escape
+
+
+# Splits text into HTML tags, words, runs of whitespace and single punctuation characters
+TOKEN_RE = re.compile(r'<[^>]*>|\w+|\s+|[^\w\s]')
+
+# Paired paragraphs with less than this proportion of tokens in common are shown as a whole
+# paragraph removed and another added, rather than a confusing mess of word-level changes
+MIN_SIMILARITY = 0.3
+
+
+def to_ids(a, b):
+    """ Maps the items of both sequences to small integers, so the diff only ever compares ints
+        (comparing long equal strings would otherwise cost their full length every time)
+        Returns the two lists of ints
+    """
+    ids = {}
+    a_ids = [ids.setdefault(item, len(ids)) for item in a]
+    b_ids = [ids.setdefault(item, len(ids)) for item in b]
+    return a_ids, b_ids
+
+def bisect(a, a0, a1, b, b0, b1):
+    """ Finds the 'middle snake' of the shortest edit script between a[a0:a1] and b[b0:b1] by
+        running the Myers search forwards from the start and backwards from the end at the same
+        time until they overlap. Only two arrays of size O(N + M) are used.
+        Returns (x, y) - the split point, relative to a0 and b0 - or None if the two ranges have
+        nothing in common
+    """
+    # pylint: disable=too-many-locals,too-many-branches
+    # It's one algorithm and splitting it up would make it harder to follow, not easier
+    n = a1 - a0
+    m = b1 - b0
+    max_d = (n + m + 1) // 2
+    v_offset = max_d
+    v_length = 2 * max_d + 2
+    v1 = [-1] * v_length
+    v2 = [-1] * v_length
+    v1[v_offset + 1] = 0
+    v2[v_offset + 1] = 0
+    delta = n - m
+    # If the total number of items is odd, the forward path will collide with the reverse path
+    front = delta % 2 != 0
+    # Offsets for the start and end of the k loops, to skip diagonals that have left the grid
+    k1start = k1end = k2start = k2end = 0
+    for d in range(max_d):
+        # Walk the forward path one step
+        for k1 in range(-d + k1start, d + 1 - k1end, 2):
+            k1_offset = v_offset + k1
+            if k1 == -d or (k1 != d and v1[k1_offset - 1] < v1[k1_offset + 1]):
+                x1 = v1[k1_offset + 1]
+            else:
+                x1 = v1[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[a0 + x1] == b[b0 + y1]:
+                x1 += 1
+                y1 += 1
+            v1[k1_offset] = x1
+            if x1 > n:
+                # Ran off the right of the grid
+                k1end += 2
+            elif y1 > m:
+                # Ran off the bottom of the grid
+                k1start += 2
+            elif front:
+                k2_offset = v_offset + delta - k1
+                if 0 <= k2_offset < v_length and v2[k2_offset] != -1:
+                    # Mirror x2 onto the top-left coordinate system
+                    if x1 >= n - v2[k2_offset]:
+                        return x1, y1
+
+        # Walk the reverse path one step
+        for k2 in range(-d + k2start, d + 1 - k2end, 2):
+            k2_offset = v_offset + k2
+            if k2 == -d or (k2 != d and v2[k2_offset - 1] < v2[k2_offset + 1]):
+                x2 = v2[k2_offset + 1]
+            else:
+                x2 = v2[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[a1 - x2 - 1] == b[b1 - y2 - 1]:
+                x2 += 1
+                y2 += 1
+            v2[k2_offset] = x2
+            if x2 > n:
+                k2end += 2
+            elif y2 > m:
+                k2start += 2
+            elif not front:
+                k1_offset = v_offset + delta - k2
+                if 0 <= k1_offset < v_length and v1[k1_offset] != -1:
+                    x1 = v1[k1_offset]
+                    y1 = v_offset + x1 - k1_offset
+                    if x1 >= n - x2:
+                        return x1, y1
+    return None
+
+def diff_opcodes(a, b):
+    """ Diffs two sequences of hashable items
+        Returns a list of (tag, i1, i2, j1, j2) tuples in the same format as
+        difflib.SequenceMatcher.get_opcodes(), where tag is 'equal', 'delete', 'insert' or 'replace'
+    """
+    a, b = to_ids(a, b)
+    ops = []
+    # Work through the sub-problems with a stack rather than recursion, as the depth can grow
+    # with the number of changes. Items are either ('diff', ranges) still to be solved, or
+    # ('equal', ranges) of a common suffix to output once everything before it is done.
+    stack = [('diff', 0, len(a), 0, len(b))]
+    while stack:
+        kind, a0, a1, b0, b1 = stack.pop()
+        if kind == 'equal':
+            ops.append(('equal', a0, a1, b0, b1))
+            continue
+        # Strip off any common prefix and suffix first, it's cheap and very common
+        prefix = 0
+        while a0 + prefix < a1 and b0 + prefix < b1 and a[a0 + prefix] == b[b0 + prefix]:
+            prefix += 1
+        if prefix:
+            ops.append(('equal', a0, a0 + prefix, b0, b0 + prefix))
+            a0 += prefix
+            b0 += prefix
+        suffix = 0
+        while a1 - suffix > a0 and b1 - suffix > b0 and a[a1 - suffix - 1] == b[b1 - suffix - 1]:
+            suffix += 1
+        if suffix:
+            stack.append(('equal', a1 - suffix, a1, b1 - suffix, b1))
+            a1 -= suffix
+            b1 -= suffix
+
+        if a0 == a1 and b0 == b1:
+            continue
+        if a0 == a1:
+            ops.append(('insert', a0, a1, b0, b1))
+            continue
+        if b0 == b1:
+            ops.append(('delete', a0, a1, b0, b1))
+            continue
+        split = bisect(a, a0, a1, b, b0, b1)
+        if split is None:
+            ops.append(('delete', a0, a1, b0, b0))
+            ops.append(('insert', a1, a1, b0, b1))
+            continue
+        x, y = split
+        # Pushed in reverse so the left half is solved (and output) first
+        stack.append(('diff', a0 + x, a1, b0 + y, b1))
+        stack.append(('diff', a0, a0 + x, b0, b0 + y))
+    return merge_opcodes(ops)
+
+def merge_opcodes(ops):
+    """ Joins up neighbouring opcodes of the same kind, and turns a delete next to an insert into
+        a single replace, to match what difflib.SequenceMatcher.get_opcodes() would give
+    """
+    merged = []
+    for tag, i1, i2, j1, j2 in ops:
+        if i1 == i2 and j1 == j2:
+            continue
+        if merged:
+            last_tag, li1, _, lj1, _ = merged[-1]
+            if last_tag == tag or (last_tag != 'equal' and tag != 'equal'):
+                if last_tag != tag:
+                    tag = 'replace'
+                merged[-1] = (tag, li1, i2, lj1, j2)
+                continue
+        merged.append((tag, i1, i2, j1, j2))
+    return merged
+
+def word_diff(line_a, line_b):
+    """ Diffs two paragraphs word by word
+        Returns (html_a, html_b) with removed words wrapped in <span class="diff_sub"> and added
+        words wrapped in <span class="diff_add">, or None if the paragraphs are too different for
+        a word-level diff to be useful
+    """
+    tokens_a = TOKEN_RE.findall(line_a)
+    tokens_b = TOKEN_RE.findall(line_b)
+    opcodes = diff_opcodes(tokens_a, tokens_b)
+    common = sum(i2 - i1 for tag, i1, i2, _, _ in opcodes if tag == 'equal')
+    if 2 * common < MIN_SIMILARITY * (len(tokens_a) + len(tokens_b)):
+        return None
+    html_a = []
+    html_b = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        text_a = escape(''.join(tokens_a[i1:i2]))
+        text_b = escape(''.join(tokens_b[j1:j2]))
+        if tag == 'equal':
+            html_a.append(text_a)
+            html_b.append(text_b)
+            continue
+        if text_a:
+            html_a.append(f'<span class="diff_sub">{text_a}</span>')
+        if text_b:
+            html_b.append(f'<span class="diff_add">{text_b}</span>')
+    return ''.join(html_a), ''.join(html_b)
+
+def diff_rows(lines_a, lines_b):
+    """ Aligns two lists of lines (paragraphs) and yields one tuple per table row:
+        (line_number_a, html_a, line_number_b, html_b) - either side can be None if the line only
+        exists on the other side
+    """
+    for tag, i1, i2, j1, j2 in diff_opcodes(lines_a, lines_b):
+        if tag == 'equal':
+            for i, j in zip(range(i1, i2), range(j1, j2)):
+                line = escape(lines_a[i])
+                yield i + 1, line, j + 1, line
+            continue
+        # Pair up the changed lines in order and diff them word by word where it makes sense,
+        # any left over are whole lines removed (or added)
+        paired = min(i2 - i1, j2 - j1)
+        for i, j in zip(range(i1, i1 + paired), range(j1, j1 + paired)):
+            words = word_diff(lines_a[i], lines_b[j])
+            if words is None:
+                yield i + 1, f'<span class="diff_sub">{escape(lines_a[i])}</span>', None, None
+                yield None, None, j + 1, f'<span class="diff_add">{escape(lines_b[j])}</span>'
+            else:
+                yield i + 1, words[0], j + 1, words[1]
+        for i in range(i1 + paired, i2):
+            yield i + 1, f'<span class="diff_sub">{escape(lines_a[i])}</span>', None, None
+        for j in range(j1 + paired, j2):
+            yield None, None, j + 1, f'<span class="diff_add">{escape(lines_b[j])}</span>'
+
+def make_table(text_a, text_b, fromdesc='', todesc=''):
+    """ Builds the HTML side-by-side comparison table for two versions of a parsed article part
+        text_a, text_b = string or None (None is treated as an empty part)
+        fromdesc, todesc = string; HTML shown in the column headers
+        Returns a string of HTML
+    """
+    lines_a = text_a.splitlines() if text_a is not None else ['']
+    lines_b = text_b.splitlines() if text_b is not None else ['']
+    rows = []
+    for number_a, html_a, number_b, html_b in diff_rows(lines_a, lines_b):
+        rows.append(
+            '<tr>' +
+            '<td class="diff_next"></td>' +
+            f'<td class="diff_header">{number_a or ""}</td>' +
+            f'<td class="diff_text">{html_a or ""}</td>' +
+            '<td class="diff_next"></td>' +
+            f'<td class="diff_header">{number_b or ""}</td>' +
+            f'<td class="diff_text">{html_b or ""}</td>' +
+            '</tr>'
+            )
+    return (
+        '<table class="diff words">\n' +
+        '<thead><tr>' +
+        '<th class="diff_next"><br /></th>' +
+        f'<th colspan="2" class="diff_header">{fromdesc}</th>' +
+        '<th class="diff_next"><br /></th>' +
+        f'<th colspan="2" class="diff_header">{todesc}</th>' +
+        '</tr></thead>\n' +
+        '<tbody>\n' + '\n'.join(rows) + '\n</tbody>\n' +
+        '</table>'
+        )
@@ -0,0 +1,168 @@
+"""
+
+    ***Change statistics***
+    Works out what changed between two versions of an article and stores it in the
+    article_change table (see db_schema.sql)
+
+    The monitor calls record_change() as it stores each new version of an existing article, so
+    questions like "which articles had headline edits" only need to read one indexed table
+    instead of diffing every pair of versions on demand.
+
+    Can also be run as a script to fill in the table for versions stored before it existed:
+        python change_stats.py path/to/news_updates_monitor.sqlite3
+
+"""
+
+import argparse
+import logging
+import sqlite3
+
+from article_diff import diff_opcodes, TOKEN_RE
+from database import apply_schema
+
+
+logger = logging.getLogger(__name__)
+
+# The parsed fields and the name of their *_changed column in the article_change table
+CHANGE_FIELDS = {
+    'headline': 'headline_changed',
+    'body': 'body_changed',
+    'byline': 'byline_changed',
+    '_timestamp': 'timestamp_changed',
+    }
+
+
+def compute_change_stats(old, new):
+    """ Compares two versions of an article's parsed fields
+        old, new = dict; Article.parsed dictionaries (or article table rows, which have the same
+                   keys). None values are treated as empty strings.
+        Returns a dict with a Boolean per field in CHANGE_FIELDS, plus:
+            chars_added, chars_removed: characters of body text added/removed, counted word by
+                                        word inside edited paragraphs
+            paragraphs_added, paragraphs_removed: whole paragraphs added/removed
+            paragraphs_edited: paragraphs that exist in both versions but were changed
+    """
+    stats = {
+        column: (old[field] or '') != (new[field] or '') for field, column in CHANGE_FIELDS.items()
+        }
+    stats.update({
+        'chars_added': 0,
+        'chars_removed': 0,
+        'paragraphs_added': 0,
+        'paragraphs_removed': 0,
+        'paragraphs_edited': 0,
+        })
+    if not stats['body_changed']:
+        return stats
+
+    lines_old = (old['body'] or '').splitlines()
+    lines_new = (new['body'] or '').splitlines()
+    for tag, i1, i2, j1, j2 in diff_opcodes(lines_old, lines_new):
+        if tag == 'equal':
+            continue
+        # Edited paragraphs are paired up in order (like article_diff.diff_rows), the rest are
+        # whole paragraphs added or removed
+        paired = min(i2 - i1, j2 - j1)
+        for i, j in zip(range(i1, i1 + paired), range(j1, j1 + paired)):
+            added, removed = count_changed_chars(lines_old[i], lines_new[j])
+            stats['chars_added'] += added
+            stats['chars_removed'] += removed
+        stats['paragraphs_edited'] += paired
+        stats['paragraphs_removed'] += i2 - i1 - paired
+        stats['paragraphs_added'] += j2 - j1 - paired
+        stats['chars_removed'] += sum(len(line) for line in lines_old[i1 + paired:i2])
+        stats['chars_added'] += sum(len(line) for line in lines_new[j1 + paired:j2])
+    return stats
+
+def count_changed_chars(line_old, line_new):
+    """ Returns (chars_added, chars_removed) between two versions of one paragraph """
+    tokens_old = TOKEN_RE.findall(line_old)
+    tokens_new = TOKEN_RE.findall(line_new)
+    added = removed = 0
+    for tag, i1, i2, j1, j2 in diff_opcodes(tokens_old, tokens_new):
+        if tag != 'equal':
+            removed += sum(len(token) for token in tokens_old[i1:i2])
+            added += sum(len(token) for token in tokens_new[j1:j2])
+    return added, removed
+
+def record_change(con, article_id, previous, new, url, version, changed_timestamp):
+    """ Works out the change statistics between two versions and inserts them into the
+        article_change table. Does not commit - the caller commits alongside the new version.
+        con = sqlite3.Connection object
+        article_id = integer; article_id of the new version
+        previous = dict; article table row of the previous version (must include article_id)
+        new = dict; parsed fields of the new version
+        url = string
+        version = integer; version number of the new snapshot
+        changed_timestamp = ISO8601 datetime as string; when the new version was fetched
+    """
+    stats = compute_change_stats(previous, new)
+    stats.update({
+        'article_id': article_id,
+        'previous_article_id': previous['article_id'],
+        'url': url,
+        'version': version,
+        'changed_timestamp': changed_timestamp,
+        'previous_headline': previous['headline'] if stats['headline_changed'] else None,
+        'headline': new['headline'] if stats['headline_changed'] else None,
+        })
+    columns = ', '.join(stats.keys())
+    values = ':' + ', :'.join(stats.keys())
+    con.execute(f'INSERT OR REPLACE INTO article_change({columns}) VALUES({values})', stats)
+    return stats
+
+def backfill(con, batch_size=500):
+    """ Records the change statistics for every stored version that doesn't have them yet
+        Walks each URL's versions in order, committing every batch_size changes
+        Returns the number of changes recorded
+    """
+    # Only the IDs are held in memory, so this stays small even for a big archive
+    recorded = {row[0] for row in con.execute('SELECT article_id FROM article_change')}
+    cursor = con.execute(
+        """
+        SELECT article_id, url, fetched_timestamp, headline, body, byline, _timestamp
+        FROM article
+        ORDER BY url, article_id
+        """
+        )
+    fields = ('article_id', 'url', 'fetched_timestamp', 'headline', 'body', 'byline', '_timestamp')
+    previous = None
+    version = 0
+    counter = 0
+    for row in cursor:
+        current = dict(zip(fields, row))
+        if previous is None or previous['url'] != current['url']:
+            version = 0
+            previous = None
+        version += 1
+        if previous is not None and current['article_id'] not in recorded:
+            record_change(
+                con, current['article_id'], previous, current, current['url'], version,
+                current['fetched_timestamp']
+                )
+            counter += 1
+            if counter % batch_size == 0:
+                con.commit()
+                logger.info('Recorded %s changes so far...', counter)
+        previous = current
+    con.commit()
+    return counter
+
+
+if __name__ == '__main__':
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s: %(message)s')
+
+    parser = argparse.ArgumentParser(
+        description='Fill in the article_change table for versions stored before it existed'
+        )
+    parser.add_argument('database', help='path to the SQLite database file')
+    parser.add_argument('--batch-size', type=int, default=500, help='changes per transaction')
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.database)
+    connection.execute('PRAGMA foreign_keys = ON')
+    apply_schema(connection)
+    total = backfill(connection, args.batch_size)
+    logger.info('Backfill complete: recorded %s changes', total)
+    connection.close()
@@ -0,0 +1,169 @@
+"""
+
+    ***Summary counters***
+    Reads and maintains the summary and url_summary tables (see db_schema.sql)
+
+    The counters are kept up to date by SQLite triggers whenever a row is added to (or removed
+    from) the tracking, article or fetch tables, so reading them is a single-row lookup instead of
+    a COUNT(*) over the whole table.
+
+    Can also be run as a script to check the counters against the real tables:
+        python counters.py path/to/news_updates_monitor.sqlite3 [--rebuild]
+
+"""
+
+import argparse
+import logging
+import sqlite3
+
+from database import apply_schema
+
+
+logger = logging.getLogger(__name__)
+
+
+def fetchone_tuple(con, sql, params=()):
+    """ Runs a query and returns the first row as a plain tuple, whatever row_factory the
+        connection is using (the monitor sometimes uses dict_factory)
+    """
+    cursor = con.cursor()
+    cursor.row_factory = None
+    return cursor.execute(sql, params).fetchone()
+
+def get_totals(con):
+    """ Returns a tuple of (total_urls, total_snapshots, total_fetches)
+        Falls back to counting the tables directly if the counters haven't been built yet
+        con = sqlite3.Connection object
+    """
+    row = fetchone_tuple(
+        con, 'SELECT total_urls, total_snapshots, total_fetches FROM summary WHERE id = 1'
+        )
+    if row is None:
+        logger.warning('Summary counters missing - run counters.py --rebuild to create them')
+        return count_totals(con)
+    return row
+
+def get_url_counts(con, url):
+    """ Returns a tuple of (snapshots, fetches) for a single URL
+        con = sqlite3.Connection object
+        url = string
+    """
+    row = fetchone_tuple(con, 'SELECT snapshots, fetches FROM url_summary WHERE url = ?', (url,))
+    if row is None:
+        return (0, 0)
+    return row
+
+def count_totals(con):
+    """ Counts the totals from scratch - only used for rebuilding/checking the counters """
+    total_urls, = fetchone_tuple(con, 'SELECT COUNT(*) FROM tracking')
+    total_snapshots, = fetchone_tuple(con, 'SELECT COUNT(*) FROM article')
+    total_fetches, = fetchone_tuple(con, 'SELECT COUNT(*) FROM fetch')
+    return (total_urls, total_snapshots, total_fetches)
+
+def ensure_counters(con):
+    """ Builds the counters if they don't exist yet (i.e. first run after upgrading an existing
+        database). Does nothing if they already exist.
+    """
+    row = con.execute('SELECT 1 FROM summary WHERE id = 1').fetchone()
+    if row is None:
+        logger.info('Summary counters not found, building them from scratch...')
+        rebuild_counters(con)
+
+def rebuild_counters(con):
+    """ Throws away the existing counters and rebuilds them from the tracking, article and fetch
+        tables. Runs in a single transaction so readers never see half-built counters.
+    """
+    with con:
+        con.execute('DELETE FROM summary')
+        con.execute('DELETE FROM url_summary')
+        con.execute(
+            """
+            INSERT INTO summary(id, total_urls, total_snapshots, total_fetches)
+            VALUES (1, (SELECT COUNT(*) FROM tracking), (SELECT COUNT(*) FROM article),
+                    (SELECT COUNT(*) FROM fetch))
+            """
+            )
+        con.execute('INSERT INTO url_summary(url) SELECT url FROM tracking')
+        con.execute(
+            """
+            INSERT INTO url_summary(url, snapshots)
+            SELECT url, COUNT(*) FROM article WHERE true GROUP BY url
+            ON CONFLICT(url) DO UPDATE SET snapshots = excluded.snapshots
+            """
+            )
+        con.execute(
+            """
+            INSERT INTO url_summary(url, fetches)
+            SELECT url, COUNT(*) FROM fetch WHERE true GROUP BY url
+            ON CONFLICT(url) DO UPDATE SET fetches = excluded.fetches
+            """
+            )
+    logger.info('Summary counters rebuilt')
+
+def check_counters(con):
+    """ Compares the counters against the real tables
+        Returns a list of strings describing each mismatch (empty list if everything matches)
+    """
+    mismatches = []
+    row = con.execute(
+        'SELECT total_urls, total_snapshots, total_fetches FROM summary WHERE id = 1'
+        ).fetchone()
+    if row is None:
+        return ['summary: counters have not been built']
+    actual = count_totals(con)
+    for name, stored, real in zip(('total_urls', 'total_snapshots', 'total_fetches'), row, actual):
+        if stored != real:
+            mismatches.append(f'summary.{name}: stored {stored}, actual {real}')
+
+    # Every URL that appears anywhere, with its stored and actual counts side by side
+    cursor = con.execute(
+        """
+        WITH actual AS (
+            SELECT url, SUM(snapshots) AS snapshots, SUM(fetches) AS fetches FROM (
+                SELECT url, 0 AS snapshots, 0 AS fetches FROM tracking
+                UNION ALL
+                SELECT url, COUNT(*), 0 FROM article GROUP BY url
+                UNION ALL
+                SELECT url, 0, COUNT(*) FROM fetch GROUP BY url
+                )
+            GROUP BY url
+            )
+        SELECT actual.url, url_summary.snapshots, actual.snapshots,
+               url_summary.fetches, actual.fetches
+        FROM actual LEFT JOIN url_summary ON (url_summary.url = actual.url)
+        WHERE url_summary.url IS NULL
+           OR url_summary.snapshots != actual.snapshots
+           OR url_summary.fetches != actual.fetches
+        """
+        )
+    for url, stored_snapshots, snapshots, stored_fetches, fetches in cursor:
+        mismatches.append(
+            f'url_summary {url}: snapshots stored {stored_snapshots}, actual {snapshots}; ' +
+            f'fetches stored {stored_fetches}, actual {fetches}'
+            )
+    return mismatches
+
+
+if __name__ == '__main__':
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s: %(message)s')
+
+    parser = argparse.ArgumentParser(description='Check or rebuild the summary counters')
+    parser.add_argument('database', help='path to the SQLite database file')
+    parser.add_argument(
+        '--rebuild', action='store_true', help='rebuild the counters from scratch after checking'
+        )
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.database)
+    connection.execute('PRAGMA foreign_keys = ON')
+    apply_schema(connection)
+    problems = check_counters(connection)
+    for problem in problems:
+        logger.warning(problem)
+    logger.info('Consistency check found %s mismatches', len(problems))
+    if args.rebuild:
+        rebuild_counters(connection)
+        logger.info('Consistency check after rebuild found %s mismatches',
+                    len(check_counters(connection)))
+    connection.close()
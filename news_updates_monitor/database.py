@@ -0,0 +1,22 @@
+"""
+
+    ***Database helpers***
+    Schema setup shared by the monitor, the web interface and the maintenance scripts
+
+"""
+
+import os
+
+
+# db_schema.sql lives in the root of the repo, one level above this file
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'db_schema.sql')
+
+
+def apply_schema(con):
+    """ Runs db_schema.sql against the given database. Every statement in the file uses
+        IF NOT EXISTS, so this is safe to call on an existing database to bring it up to date with
+        any tables, indexes or triggers added since it was first created
+        con = sqlite3.Connection object
+    """
+    with open(SCHEMA_FILE, encoding='utf-8') as f:
+        con.executescript(f.read())
@@ -0,0 +1,215 @@
+"""
+
+    ***Article discovery***
+    Finding new article URLs from RSS/Atom feeds, as a cheaper alternative to the homepage
+
+    The homepage is a big page that has to be fully parsed with bs4 every run just to collect its
+    '/news/articles/' links, and it only shows what's on the front page. The section feeds are
+    small, cover far more articles, and the server can answer "nothing's changed" with a 304
+    when asked with the ETag/Last-Modified of the last copy (stored in the feed_state table) -
+    so most runs cost a few tiny requests and no parsing at all.
+
+    Feeds are read with an incremental XML parser straight off the response stream, each item
+    being thrown away as soon as its link has been read, so memory use stays the same however
+    big a feed gets. Both RSS 2.0 (<item><link>) and Atom (<entry><link href>) are understood.
+
+    The monitor picks which sources to use (the homepage, the feeds or both) in the [discovery]
+    section of its config.ini, see find_new_news() in monitor.py.
+
+"""
+
+import logging
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, urljoin
+
+import requests
+import urllib3
+
+# pylint: disable-next=import-error
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+ARTICLE_PATH = '/news/articles/'
+
+FEED_REQUESTS = metrics.Counter(
+    'news_monitor_feed_requests_total',
+    'Discovery feed requests by HTTP status (304 = unchanged), or exception name for requests '
+    'that failed.', ('status',)
+    )
+DISCOVERED_URLS = metrics.Counter(
+    'news_monitor_discovered_urls_total',
+    'Article URLs found by each discovery source, including ones already being tracked.',
+    ('source',)
+    )
+
+
+def article_url(link, base_url):
+    """ Returns the tracking URL for a link if it's to a news article, otherwise None
+        Only the path is kept, on base_url, so links from feeds (which are on bbc.com and have
+        tracking parameters like ?at_medium=RSS) match the homepage's links to the same article
+        link = string; absolute or relative to base_url
+    """
+    if not link or 'comments' in link:
+        return None
+    path = urlsplit(link.strip()).path
+    if ARTICLE_PATH not in path:
+        return None
+    return base_url + path[path.find(ARTICLE_PATH):]
+
+def local_name(tag):
+    """ Returns an element's tag without its namespace, e.g. 'entry' for Atom's
+        '{http://www.w3.org/2005/Atom}entry'
+    """
+    return tag.rsplit('}', 1)[-1]
+
+def parse_feed(stream, base_url):
+    """ Reads an RSS or Atom feed incrementally, yielding the article URL of each item/entry
+        that links to one (see article_url())
+        stream = binary file-like object, e.g. a response's raw stream
+        Raises xml.etree.ElementTree.ParseError if the feed isn't well-formed XML
+    """
+    # Elements still open, so each finished item can be removed from its parent (clearing it
+    # isn't enough on its own - the empty element would stay in the tree)
+    open_elements = []
+    for event, elem in ET.iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            open_elements.append(elem)
+            continue
+        open_elements.pop()
+        name = local_name(elem.tag)
+        if name not in ('item', 'entry'):
+            continue
+        for child in elem:
+            child_name = local_name(child.tag)
+            if child_name == 'link':
+                # RSS has the URL as the text, Atom as href (with rel="alternate" or no rel)
+                if child.get('rel', 'alternate') != 'alternate':
+                    continue
+                link = child.get('href') if child.get('href') is not None else child.text
+            elif child_name == 'guid' and child.get('isPermaLink', 'true') == 'true':
+                link = child.text
+            else:
+                continue
+            url = article_url(link, base_url)
+            if url is not None:
+                yield url
+                break
+        elem.clear()
+        if open_elements:
+            open_elements[-1].remove(elem)
+
+def get_feed_state(con, feed_url):
+    """ Returns (etag, last_modified) from the last successful read of the feed, either of which
+        may be None
+    """
+    row = con.execute(
+        'SELECT etag, last_modified FROM feed_state WHERE feed_url = ?', (feed_url,)
+        ).fetchone()
+    return tuple(row) if row is not None else (None, None)
+
+def record_feed_state(con, feed_url, status, response=None, items=None):
+    """ Records the outcome of a feed request. The ETag and Last-Modified are only replaced
+        after a successful read, so a failed request doesn't lose them. Does not commit.
+        response = requests.Response for a 200, or None
+        items = integer; article links found (for a 200)
+    """
+    etag = last_modified = None
+    if response is not None:
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+    con.execute(
+        """
+        INSERT INTO feed_state(feed_url, etag, last_modified, last_checked, last_status, items)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(feed_url) DO UPDATE SET
+          etag = CASE WHEN excluded.last_status = '200' THEN excluded.etag ELSE etag END,
+          last_modified = CASE WHEN excluded.last_status = '200'
+                               THEN excluded.last_modified ELSE last_modified END,
+          last_checked = excluded.last_checked,
+          last_status = excluded.last_status,
+          items = COALESCE(excluded.items, items)
+        """,
+        (feed_url, etag, last_modified, datetime.now(timezone.utc).isoformat(), status, items)
+        )
+
+def read_feed(con, session, feed_url, base_url, timeout=10):
+    """ Requests a feed (conditionally, if it has been read before) and returns the article URLs
+        in it - an empty list if it hasn't changed since the last read (a 304), or None if the
+        request or the XML failed (logged)
+        con = sqlite3.Connection; for feed_state (committed here)
+        session = requests.Session
+        feed_url = string; absolute URL of the feed
+    """
+    etag, last_modified = get_feed_state(con, feed_url)
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    urls = None
+    try:
+        with session.get(feed_url, headers=headers, timeout=timeout, stream=True) as response:
+            status = str(response.status_code)
+            if response.status_code == 304:
+                urls = []
+            elif response.status_code != 200:
+                logger.error(
+                    'Feed Error: URL: %s\nHTTP Error - Status Code: %s\n', feed_url, status
+                    )
+            else:
+                # Undo any gzip etc. while streaming, as response.content would
+                response.raw.decode_content = True
+                urls = list(parse_feed(response.raw, base_url))
+                record_feed_state(con, feed_url, status, response, len(urls))
+    # The feed is read from the raw stream, so errors part way through come from urllib3
+    except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError) as e:
+        status = e.__class__.__name__
+        logger.error(
+            'Feed Error: URL: %s\nException __str__:\n%s\nException Type:\n%s\n',
+            feed_url, e, type(e)
+            )
+    except ET.ParseError as e:
+        status = 'ParseError'
+        urls = None
+        logger.error('Feed Error: URL: %s\nNot a valid feed: %s\n', feed_url, e)
+    FEED_REQUESTS.inc(status=status)
+    if status != '200':
+        record_feed_state(con, feed_url, status)
+    con.commit()
+    return urls
+
+def read_feeds(con, feed_urls, base_url, timeout=10):
+    """ Reads each feed in turn, sharing one connection to the feed server
+        feed_urls = list of strings; absolute, or relative to base_url (e.g. /news/rss.xml)
+        Returns (set of article URLs, number of feeds that failed)
+    """
+    found = set()
+    failed = 0
+    with requests.Session() as session:
+        for feed_url in feed_urls:
+            urls = read_feed(con, session, urljoin(base_url + '/', feed_url), base_url, timeout)
+            if urls is None:
+                failed += 1
+            else:
+                found.update(urls)
+    return found, failed
+
+def untracked(con, urls):
+    """ Returns the URLs that aren't in the tracking table yet, looking each batch up by its
+        primary key rather than reading every tracked URL
+        urls = iterable of strings
+    """
+    urls = list(set(urls))
+    tracked = set()
+    # Well under SQLite's limit on bind parameters
+    batch = 500
+    for i in range(0, len(urls), batch):
+        chunk = urls[i:i + batch]
+        cursor = con.execute(
+            f'SELECT url FROM tracking WHERE url IN ({",".join("?" * len(chunk))})', chunk
+            )
+        tracked.update(row[0] for row in cursor)
+    return [url for url in urls if url not in tracked]
@@ -0,0 +1,152 @@
+"""
+
+    ***Export***
+    Writes the whole database out as newline-delimited JSON (one file per table, one row per
+    line) for analysis in other tools
+
+    Each table is read in primary key order a batch at a time, so memory use stays the same
+    however big the database is. After every batch the file is flushed to disk and a checkpoint
+    is saved, so an interrupted export can be re-run with the same arguments and it carries on
+    from the last complete batch. Once an export has finished, running it again starts a fresh
+    one.
+
+    Usage:
+        python export.py path/to/news_updates_monitor.sqlite3 path/to/output_folder
+
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+
+
+logger = logging.getLogger(__name__)
+
+# Tables in the order they're exported, and the integer key each one is read in order of
+EXPORT_TABLES = {
+    'tracking': 'rowid',
+    'article': 'article_id',
+    'fetch': 'fetch_id',
+    'article_change': 'article_id',
+    'article_validity': 'article_id',
+    }
+CHECKPOINT_FILE = 'checkpoint.json'
+
+
+def load_checkpoint(path):
+    """ Returns the saved checkpoint dict, or None if there isn't one (or the last export
+        finished)
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return None
+    if checkpoint.get('complete'):
+        return None
+    return checkpoint
+
+def save_checkpoint(path, checkpoint):
+    """ Saves the checkpoint by replacing the file, so it's never left half written """
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+def export_table(con, table, key, output_dir, checkpoint, checkpoint_path, batch_size=1000):
+    """ Exports one table to <output_dir>/<table>.ndjson, starting from wherever the checkpoint
+        says it got to. Updates and saves the checkpoint after each batch.
+        Returns the number of rows written by this call
+    """
+    # pylint: disable=too-many-arguments
+    progress = checkpoint['tables'].setdefault(table, {'last_key': None, 'offset': 0, 'rows': 0})
+    path = os.path.join(output_dir, f'{table}.ndjson')
+    if os.path.exists(path):
+        mode = 'r+b'
+    else:
+        # The file has gone missing since the checkpoint, so start the table again
+        mode = 'wb'
+        progress.update({'last_key': None, 'offset': 0, 'rows': 0})
+    counter = 0
+    with open(path, mode) as f:
+        # Anything after the last checkpoint is from a batch that never finished
+        f.truncate(progress['offset'])
+        f.seek(progress['offset'])
+        while True:
+            where = '1' if progress['last_key'] is None else f'{key} > ?'
+            params = () if progress['last_key'] is None else (progress['last_key'],)
+            cursor = con.execute(
+                f'SELECT {key} AS export_key, * FROM {table} WHERE {where} ORDER BY {key} LIMIT ?',
+                params + (batch_size,)
+                )
+            # The first column is only there for the checkpoint, so it's left out of the file
+            fields = [column[0] for column in cursor.description][1:]
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            lines = [json.dumps(dict(zip(fields, row[1:]))) + '\n' for row in rows]
+            f.write(''.join(lines).encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+            progress['last_key'] = rows[-1][0]
+            progress['offset'] = f.tell()
+            progress['rows'] += len(rows)
+            save_checkpoint(checkpoint_path, checkpoint)
+            counter += len(rows)
+            if counter % (batch_size * 100) == 0:
+                logger.info('%s: exported %s rows so far...', table, progress['rows'])
+    return counter
+
+def export_database(con, output_dir, batch_size=1000):
+    """ Exports every table in EXPORT_TABLES to output_dir, resuming an unfinished export if
+        there's a checkpoint for one
+        Returns a dict of the total rows exported per table
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint_path = os.path.join(output_dir, CHECKPOINT_FILE)
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint is None:
+        checkpoint = {'complete': False, 'tables': {}}
+    else:
+        logger.info('Resuming the export from the last checkpoint')
+    for table, key in EXPORT_TABLES.items():
+        exists = con.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+            ).fetchone()
+        if exists is None:
+            # e.g. a database from before the table was added that hasn't been upgraded yet
+            logger.warning('%s: table not found, skipping it', table)
+            continue
+        written = export_table(
+            con, table, key, output_dir, checkpoint, checkpoint_path, batch_size
+            )
+        logger.info(
+            '%s: %s rows written (%s in total)',
+            table, written, checkpoint['tables'][table]['rows']
+            )
+    checkpoint['complete'] = True
+    save_checkpoint(checkpoint_path, checkpoint)
+    return {table: progress['rows'] for table, progress in checkpoint['tables'].items()}
+
+
+if __name__ == '__main__':
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s: %(message)s')
+
+    parser = argparse.ArgumentParser(
+        description='Export the database as newline-delimited JSON, one file per table'
+        )
+    parser.add_argument('database', help='path to the SQLite database file')
+    parser.add_argument('output', help='folder to write the .ndjson files (and checkpoint) to')
+    parser.add_argument('--batch-size', type=int, default=1000, help='rows read at a time')
+    args = parser.parse_args()
+
+    # Read only, so an export can safely run alongside the monitor
+    connection = sqlite3.connect(f'file:{args.database}?mode=ro', uri=True)
+    totals = export_database(connection, args.output, args.batch_size)
+    connection.close()
+    logger.info('Export complete: %s', ', '.join(f'{n} {t} rows' for t, n in totals.items()))
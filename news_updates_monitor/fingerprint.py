@@ -0,0 +1,114 @@
+"""
+
+    ***Region fingerprints***
+    Lets the monitor skip parsing pages whose article hasn't changed
+
+    Most of a BBC article page (recommendations, promos, tracking markup) changes every few
+    minutes, so comparing whole pages is useless - that's why Article.is_copy() compares the
+    parsed fields. But parsing every page with bs4 is the slowest part of a run. Instead, a byte
+    level scan cuts out just the <article> element (or <main> if there isn't one) and hashes it.
+    If the hash matches the one recorded for the URL's latest version, the parse would give the
+    same result, so the fetch is recorded as unchanged without parsing.
+
+    To be safe, a page only gets a fingerprint if everything parse_all() reads (the <h1>,
+    text-block and byline-block divs and timestamp <time> tags) is inside the region. Anything
+    else gets None and is parsed in full as usual.
+
+"""
+
+import hashlib
+
+
+# Bump this whenever Article.parse_all() changes what it extracts, so fingerprints recorded by
+# the old parser don't cause pages to be skipped that the new one would parse differently
+FINGERPRINT_VERSION = b'1'
+
+# Elements tried as the region, in order
+REGION_TAGS = (b'article', b'main')
+
+# Everything Article.parse_all() looks at. Plain substring counts rather than a regex, as a
+# regex scan of a whole page costs almost as much as the time saved by not parsing it.
+PARSED_MARKUP = (
+    b'<h1',
+    b'data-component="text-block"', b"data-component='text-block'",
+    b'data-component="byline-block"', b"data-component='byline-block'",
+    b'data-testid="timestamp"', b"data-testid='timestamp'",
+    )
+HEADLINE_MARKUP = PARSED_MARKUP[0]
+BODY_MARKUP = PARSED_MARKUP[1:3]
+
+
+def find_region(content):
+    """ Finds the article's part of the page without parsing it
+        content = bytes; the raw response body
+        Returns (start, end) byte offsets, or None if no region could be found that contains
+        everything the parser reads
+    """
+    # Tags and attribute names are case-insensitive in HTML
+    lowered = content.lower()
+    for tag in REGION_TAGS:
+        start = lowered.find(b'<' + tag)
+        while start != -1 and lowered[start + len(tag) + 1:start + len(tag) + 2] not in \
+                (b'>', b' ', b'\t', b'\n', b'\r'):
+            # e.g. <articles> or <mainframe>, not the element we want
+            start = lowered.find(b'<' + tag, start + 1)
+        # The last closing tag, so nested elements of the same type are included
+        end = lowered.rfind(b'</' + tag)
+        if start == -1 or end < start:
+            continue
+        end = lowered.find(b'>', end)
+        if end == -1:
+            continue
+        end += 1
+        # Nothing the parser reads can be outside the region, and it must have a headline and
+        # a body
+        if all(lowered.count(m) == lowered.count(m, start, end) for m in PARSED_MARKUP) and \
+                lowered.count(HEADLINE_MARKUP, start, end) and \
+                any(lowered.count(m, start, end) for m in BODY_MARKUP):
+            return start, end
+    return None
+
+def region_fingerprint(content):
+    """ Returns a hex digest of the article region of the page, or None if there isn't a region
+        that can safely stand in for a full parse (see find_region())
+        content = bytes or string; the raw HTML
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    if not content:
+        return None
+    region = find_region(content)
+    if region is None:
+        return None
+    digest = hashlib.sha1(FINGERPRINT_VERSION)
+    digest.update(memoryview(content)[region[0]:region[1]])
+    return digest.hexdigest()
+
+def latest_fingerprint(con, url):
+    """ Returns (article_id, fingerprint) recorded for the URL's latest stored version, or None
+        if there isn't one (or it's for an older version)
+    """
+    cursor = con.cursor()
+    cursor.row_factory = None
+    return cursor.execute(
+        """
+        SELECT article_id, fingerprint
+        FROM region_fingerprint
+        WHERE url = ?
+          AND article_id = (SELECT MAX(article_id) FROM article WHERE url = ?)
+        """, (url, url)
+        ).fetchone()
+
+def record_fingerprint(con, url, article_id, fingerprint):
+    """ Records that a page with this fingerprint parses to the given version. Called after
+        every full parse, so the latest page seen is what the next fetch is compared with.
+        Does not commit. Does nothing if fingerprint is None.
+    """
+    if fingerprint is None:
+        return
+    con.execute(
+        """
+        INSERT OR REPLACE INTO region_fingerprint(url, article_id, fingerprint)
+        VALUES (?, ?, ?)
+        """, (url, article_id, fingerprint)
+        )
@@ -0,0 +1,209 @@
+"""
+
+    ***Homepage positions***
+    Keeps a history of where each article has been on the homepage and for how long
+
+    Every time the monitor reads the homepage it records the position of each article link on it
+    (1 for the first article link on the page, 2 for the next different article, and so on). The
+    same couple of hundred links are there run after run, so rather than a row per link per run
+    the history is stored as runs in the homepage_run table (see db_schema.sql): one row for each
+    continuous stretch of homepage reads a URL was on the page for, which is extended while it
+    stays there. Its positions during the run are run-length encoded in the row as
+    "position*reads" pairs, e.g. "1*4 3*2 7*10" - top for 4 reads, then 3rd for 2, then 7th for 10.
+
+    A run ends when a homepage read doesn't have the URL on it, so an article that drops off and
+    comes back later gets a new run. Failed reads aren't recorded at all, so a run carries on over
+    them if the URL is still there on the next successful read.
+
+    The monitor can use this to keep checking articles often for as long as they stay near the
+    top of the homepage (prominent_positions in the [homepage] section of its config.ini), as
+    those are the stories most likely to still be being updated.
+
+    Can also be run as a script to show a URL's time on the homepage, or what's on it now:
+        python homepage.py path/to/news_updates_monitor.sqlite3 --url URL
+        python homepage.py path/to/news_updates_monitor.sqlite3 --current
+
+"""
+
+import argparse
+import sqlite3
+from datetime import datetime, timezone
+
+
+def encode_positions(positions):
+    """ Run-length encodes a list of (position, reads) pairs as a string, e.g. '1*4 3*2' """
+    return ' '.join(f'{position}*{reads}' for position, reads in positions)
+
+def decode_positions(encoded):
+    """ Turns an encoded string back into a list of (position, reads) pairs """
+    pairs = []
+    for pair in encoded.split():
+        position, _, reads = pair.partition('*')
+        pairs.append((int(position), int(reads)))
+    return pairs
+
+def extend_positions(encoded, position):
+    """ Adds one more read at the given position to the end of an encoded string """
+    head, _, last = encoded.rpartition(' ')
+    last_position, _, reads = last.partition('*')
+    if int(last_position) == position:
+        last = f'{position}*{int(reads) + 1}'
+        return f'{head} {last}' if head else last
+    return f'{encoded} {position}*1'
+
+def latest_check(con):
+    """ Returns the time of the latest recorded homepage read, or None if there hasn't been one """
+    return con.execute('SELECT MAX(checked_timestamp) FROM homepage_check').fetchone()[0]
+
+def record_homepage(con, urls, checked_timestamp=None):
+    """ Records one read of the homepage: extends the runs of URLs that were on the previous read
+        too (if their position changed it's added to the run's positions) and starts new runs for
+        the rest. Does not commit.
+        con = sqlite3.Connection object
+        urls = list of strings; the article URLs on the homepage, in the order they appear
+        checked_timestamp = ISO8601 datetime as string (default: now)
+    """
+    if checked_timestamp is None:
+        checked_timestamp = datetime.now(timezone.utc).isoformat()
+    previous = latest_check(con)
+    open_runs = {}
+    if previous is not None:
+        cursor = con.execute(
+            'SELECT url, run_id, positions FROM homepage_run WHERE last_seen = ?', (previous,)
+            )
+        open_runs = {url: (run_id, positions) for url, run_id, positions in cursor}
+    extended = []
+    started = []
+    for position, url in enumerate(urls, start=1):
+        if url in open_runs:
+            run_id, positions = open_runs.pop(url)
+            extended.append((
+                checked_timestamp, position, position, extend_positions(positions, position),
+                run_id
+                ))
+        else:
+            started.append((url, checked_timestamp, checked_timestamp, position, position,
+                            encode_positions([(position, 1)])))
+    con.executemany(
+        """
+        UPDATE homepage_run
+        SET last_seen = ?, reads = reads + 1, best_position = MIN(best_position, ?),
+            last_position = ?, positions = ?
+        WHERE run_id = ?
+        """, extended
+        )
+    con.executemany(
+        """
+        INSERT INTO homepage_run(url, first_seen, last_seen, reads, best_position, last_position,
+                                 positions)
+        VALUES (?, ?, ?, 1, ?, ?, ?)
+        """, started
+        )
+    con.execute(
+        'INSERT OR REPLACE INTO homepage_check(checked_timestamp, links) VALUES (?, ?)',
+        (checked_timestamp, len(urls))
+        )
+
+def homepage_lifetime(con, url):
+    """ Returns a URL's history on the homepage as a dict:
+            runs = list of dicts (first_seen, last_seen, reads, best_position, positions), oldest
+                   first, where positions is a list of (position, reads) pairs
+            first_seen, last_seen = ISO8601 datetime strings, or None if it's never been on it
+            reads = integer; homepage reads it was on
+            best_position = integer, or None
+            seconds = float; total time on the homepage (from the first to the last read of each
+                      run, so a run of a single read counts as 0)
+            current = boolean; whether it was on the latest homepage read
+    """
+    cursor = con.cursor()
+    cursor.row_factory = None
+    rows = cursor.execute(
+        """
+        SELECT first_seen, last_seen, reads, best_position, positions
+        FROM homepage_run
+        WHERE url = ?
+        ORDER BY first_seen
+        """, (url,)
+        ).fetchall()
+    runs = [
+        {'first_seen': first_seen, 'last_seen': last_seen, 'reads': reads,
+         'best_position': best_position, 'positions': decode_positions(positions)}
+        for first_seen, last_seen, reads, best_position, positions in rows
+        ]
+    seconds = sum(
+        (datetime.fromisoformat(run['last_seen']) -
+         datetime.fromisoformat(run['first_seen'])).total_seconds()
+        for run in runs
+        )
+    return {
+        'url': url,
+        'runs': runs,
+        'first_seen': runs[0]['first_seen'] if runs else None,
+        'last_seen': runs[-1]['last_seen'] if runs else None,
+        'reads': sum(run['reads'] for run in runs),
+        'best_position': min((run['best_position'] for run in runs), default=None),
+        'seconds': seconds,
+        'current': bool(runs) and runs[-1]['last_seen'] == latest_check(con),
+        }
+
+def on_homepage(con, max_position=None, max_age=None):
+    """ Returns a dict of the URLs on the latest homepage read and their positions
+        max_position = integer; only URLs at this position or higher up the page
+        max_age = datetime.timedelta; return nothing if the latest read is older than this (e.g.
+                  the homepage has been failing), rather than out of date positions
+    """
+    latest = latest_check(con)
+    if latest is None:
+        return {}
+    if max_age is not None and \
+            datetime.now(timezone.utc) - datetime.fromisoformat(latest) > max_age:
+        return {}
+    cursor = con.cursor()
+    cursor.row_factory = None
+    return dict(cursor.execute(
+        """
+        SELECT url, last_position FROM homepage_run
+        WHERE last_seen = ? AND last_position <= ?
+        """, (latest, max_position if max_position is not None else 2**31)
+        ))
+
+def format_duration(seconds):
+    """ Returns a number of seconds as e.g. '2d 3h 15m' """
+    minutes = int(seconds // 60)
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    return ' '.join(
+        f'{value}{unit}' for value, unit in ((days, 'd'), (hours, 'h'), (minutes, 'm'))
+        if value
+        ) or '0m'
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description="Show an article's history on the homepage, or what's on the homepage now"
+        )
+    parser.add_argument('database', help='path to the SQLite database file')
+    parser.add_argument('--url', help='article URL to show the homepage history of')
+    parser.add_argument('--current', action='store_true',
+                        help='list the articles on the latest homepage read, top first')
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(f'file:{args.database}?mode=ro', uri=True)
+    if args.url:
+        lifetime = homepage_lifetime(connection, args.url)
+        if not lifetime['runs']:
+            print('Never seen on the homepage')
+        for run in lifetime['runs']:
+            print(f"{run['first_seen'][:16]} to {run['last_seen'][:16]}: {run['reads']} reads, " +
+                  f"best position {run['best_position']}, positions " +
+                  encode_positions(run['positions']))
+        if lifetime['runs']:
+            print(f"On the homepage for {format_duration(lifetime['seconds'])} over " +
+                  f"{len(lifetime['runs'])} runs" +
+                  (', and still there' if lifetime['current'] else ''))
+    if args.current:
+        positions = on_homepage(connection)
+        for current_url, current_position in sorted(positions.items(), key=lambda item: item[1]):
+            print(f'{current_position:4}  {current_url}')
+    connection.close()
@@ -0,0 +1,626 @@
+"""
+
+    ***Bulk ingestion***
+    Loads archived copies of article pages into the database as if the monitor had fetched them
+    when they were captured - WARC files (e.g. from the Wayback Machine, or a crawler run with
+    wget --warc-file) and folders of saved HTML pages
+
+    It works in two stages, and both can be interrupted and run again:
+    1. Staging: the archives are streamed a record at a time, the article pages in them are
+       parsed by a pool of worker processes with Article.parse_all(), and the parsed fields are
+       saved in the ingest_capture table a batch at a time (see db_schema.sql). A capture that
+       has been staged before (same URL and time) is skipped before it's parsed. So is a page
+       whose article region (see fingerprint.py) matches one already staged for the same URL -
+       the earlier parse is copied instead, as most captures of an article are of the same
+       version. How far it got through each WARC file is saved with every batch, so an
+       interrupted run carries on from there rather than reading the file from the start.
+    2. Applying: the staged captures are gone through in URL then time order and each one is
+       checked against the URL's previous version, the same as check_articles() in the monitor:
+       new and changed versions are stored (with their change statistics, validity interval and
+       search index) and the rest recorded as unchanged fetches, a batch per transaction.
+       Storing a version adds it to change_log (via a trigger, see db_schema.sql), which feeds the
+       web interface's live /events feed, so the rows for the batch's versions are deleted again
+       before it's committed - otherwise years-old captures would be sent out as if they had just
+       happened.
+
+    A URL's versions have to be stored in time order, so a capture from before the latest fetch
+    of its URL already in the database can't be slotted in, and is skipped (counted as 'older').
+    Backfill before starting the monitor on a new database, or for URLs it hasn't seen. URLs that
+    weren't already being tracked are added with schedule_level 0, so the monitor doesn't start
+    fetching years-old articles every run.
+
+    Saved HTML files don't say where or when they came from, so the URL is taken from the page's
+    canonical link (or og:url) and the time from a Wayback Machine style timestamp
+    (YYYYMMDDhhmmss) anywhere in the file's path, or the file's modification time if there
+    isn't one.
+
+    Usage:
+        python ingest.py path/to/news_updates_monitor.sqlite3 captures.warc.gz saved_pages/ ...
+                         [--workers N] [--batch-size N] [--base-url https://www.bbc.co.uk]
+
+"""
+
+import argparse
+import gzip
+import io
+import logging
+import multiprocessing
+import os
+import re
+import sqlite3
+import time
+import zlib
+from collections import Counter
+from datetime import datetime, timezone
+
+from article import Article, table_row_to_article, dict_factory
+from change_stats import record_change
+from counters import ensure_counters, get_url_counts
+from database import apply_schema
+from discovery import article_url
+from fingerprint import region_fingerprint, record_fingerprint
+from validity import parse_timestamp, record_new_version, record_unchanged
+
+
+logger = logging.getLogger(__name__)
+
+WARC_EXTENSIONS = ('.warc', '.warc.gz')
+HTML_EXTENSIONS = ('.html', '.htm')
+PARSED_FIELDS = ('headline', 'body', 'byline', '_timestamp', 'parse_errors')
+
+# Where a saved page says what its URL is, in order of preference
+PAGE_URL_TAGS = (
+    (re.compile(rb'<link\b[^>]*\brel=["\']?canonical\b[^>]*>', re.IGNORECASE),
+     re.compile(rb'\bhref=["\']?([^"\'\s>]+)', re.IGNORECASE)),
+    (re.compile(rb'<meta\b[^>]*\bproperty=["\']?og:url\b[^>]*>', re.IGNORECASE),
+     re.compile(rb'\bcontent=["\']?([^"\'\s>]+)', re.IGNORECASE)),
+    )
+WAYBACK_TIMESTAMP_RE = re.compile(r'(?<!\d)(\d{14})(?!\d)')
+
+
+class ArchiveError(Exception):
+    """ Raised when the rest of a WARC file can't be read, e.g. it was cut off part way through a
+        record or isn't a WARC file at all
+    """
+
+
+# Reading the archives
+
+def read_headers(stream):
+    """ Reads a first line and 'Name: value' header lines up to the next blank line, as used by
+        both WARC records and the HTTP responses inside them
+        stream = binary file-like object
+        Returns (first line, dict of lower case header names to values), or (None, None) at the
+        end of the stream
+    """
+    first = stream.readline()
+    # Records are followed by blank lines
+    while first in (b'\r\n', b'\n'):
+        first = stream.readline()
+    if not first:
+        return None, None
+    headers = {}
+    for line in iter(stream.readline, b''):
+        if line in (b'\r\n', b'\n'):
+            break
+        name, _, value = line.decode('utf-8', errors='replace').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return first.decode('utf-8', errors='replace').strip(), headers
+
+def dechunk(body):
+    """ Joins the chunks of a body sent with Transfer-Encoding: chunked
+        Raises ValueError if the chunk sizes aren't valid
+    """
+    chunks = []
+    position = 0
+    while True:
+        line_end = body.find(b'\r\n', position)
+        if line_end == -1:
+            break
+        size = int(body[position:line_end].split(b';')[0], 16)
+        if size == 0:
+            break
+        chunks.append(body[line_end + 2:line_end + 2 + size])
+        position = line_end + 2 + size + 2
+    return b''.join(chunks)
+
+def http_page(block):
+    """ Returns the HTML of a successful response recorded in a WARC response record, undoing
+        any chunked or gzip/deflate encoding, or None if it wasn't a 200 HTML page
+        block = bytes; the record's content, i.e. the HTTP response as it was received
+        Raises ValueError (or zlib.error/EOFError) if the encoding can't be undone
+    """
+    stream = io.BytesIO(block)
+    status_line, headers = read_headers(stream)
+    if status_line is None:
+        return None
+    status = status_line.split()
+    if len(status) < 2 or status[1] != '200':
+        return None
+    if not headers.get('content-type', 'text/html').lower().startswith('text/html'):
+        return None
+    body = stream.read()
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        body = dechunk(body)
+    encoding = headers.get('content-encoding', '').lower()
+    if encoding in ('gzip', 'x-gzip'):
+        body = gzip.decompress(body)
+    elif encoding == 'deflate':
+        # Meant to have a zlib header, but some servers send raw deflate
+        try:
+            body = zlib.decompress(body)
+        except zlib.error:
+            body = zlib.decompress(body, -zlib.MAX_WBITS)
+    elif encoding not in ('', 'identity'):
+        raise ValueError(f'unsupported Content-Encoding: {encoding}')
+    return body
+
+def open_warc(path):
+    """ Opens a WARC file for reading, decompressing it as it's read if it's gzipped (usually one
+        gzip member per record, which gzip reads straight through)
+    """
+    with open(path, 'rb') as f:
+        gzipped = f.read(2) == b'\x1f\x8b'
+    return gzip.open(path, 'rb') if gzipped else open(path, 'rb')
+
+def read_warc(path, base_url, stats, offset=0):
+    """ Streams the article pages out of a WARC file. Only 'response' records (and 'resource'
+        records of HTML) for article URLs are read - everything else is skipped over unread.
+        path = string
+        stats = collections.Counter; counts pages skipped and unreadable
+        offset = integer; position in the uncompressed file to start from, as saved with a
+                 previous batch
+        Yields a capture dict for each page (url, fetched_timestamp, content, source, offset),
+        where offset is the position just after its record
+        Raises ArchiveError if the file stops making sense part way through
+    """
+    try:
+        with open_warc(path) as stream:
+            stream.seek(offset)
+            while True:
+                version, headers = read_headers(stream)
+                if version is None:
+                    return
+                if not version.startswith('WARC/') or 'content-length' not in headers:
+                    raise ArchiveError(f'{path}: no WARC record at offset {stream.tell()}')
+                length = int(headers['content-length'])
+                record_type = headers.get('warc-type')
+                url = article_url(headers.get('warc-target-uri', '').strip('<>'), base_url)
+                is_page = record_type == 'response' or (
+                    record_type == 'resource' and
+                    headers.get('content-type', '').lower().startswith('text/html')
+                    )
+                if url is None or not is_page:
+                    stream.seek(length, os.SEEK_CUR)
+                    continue
+                block = stream.read(length)
+                if len(block) < length:
+                    raise ArchiveError(f'{path}: cut off part way through the last record')
+                fetched_timestamp = parse_timestamp(headers.get('warc-date'))
+                try:
+                    content = http_page(block) if record_type == 'response' else block
+                except (ValueError, EOFError, zlib.error) as e:
+                    logger.warning('%s: could not decode the capture of %s: %s', path, url, e)
+                    stats['unreadable'] += 1
+                    continue
+                if content is None or fetched_timestamp is None:
+                    stats['skipped'] += 1
+                    continue
+                yield {
+                    'url': url,
+                    'fetched_timestamp': fetched_timestamp,
+                    'content': content,
+                    'source': path,
+                    'offset': stream.tell(),
+                    }
+    except (OSError, EOFError, ValueError) as e:
+        # e.g. a corrupt gzip member or a nonsense Content-Length
+        raise ArchiveError(f'{path}: {e}') from e
+
+def page_url(content, base_url):
+    """ Returns the article URL a saved page gives for itself, or None if it doesn't have one """
+    head_end = content.find(b'</head>')
+    head = content[:head_end] if head_end != -1 else content
+    for tag_re, attribute_re in PAGE_URL_TAGS:
+        for tag in tag_re.finditer(head):
+            match = attribute_re.search(tag.group())
+            if match:
+                return article_url(match.group(1).decode('utf-8', errors='replace'), base_url)
+    return None
+
+def capture_time(path):
+    """ Returns the time a saved page was captured as an ISO 8601 string: the Wayback Machine
+        style timestamp in its path if there is one, otherwise the file's modification time
+    """
+    for match in WAYBACK_TIMESTAMP_RE.finditer(path):
+        try:
+            moment = datetime.strptime(match.group(1), '%Y%m%d%H%M%S')
+        except ValueError:
+            continue
+        return moment.replace(tzinfo=timezone.utc).isoformat()
+    return datetime.fromtimestamp(os.path.getmtime(path), timezone.utc).isoformat()
+
+def read_html_folder(folder, base_url, stats):
+    """ Streams the article pages out of a folder (and its subfolders) of saved HTML files, in
+        name order
+        Yields a capture dict for each page (url, fetched_timestamp, content, source, offset)
+    """
+    for root, dirs, files in os.walk(folder):
+        # In place, so os.walk goes through the subfolders in order too
+        dirs.sort()
+        for name in sorted(files):
+            if not name.lower().endswith(HTML_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                content = f.read()
+            url = page_url(content, base_url)
+            if url is None:
+                stats['skipped'] += 1
+                continue
+            yield {
+                'url': url,
+                'fetched_timestamp': capture_time(path),
+                'content': content,
+                'source': path,
+                'offset': None,
+                }
+
+
+# Staging
+
+def parse_page(job):
+    """ Runs in the worker processes: parses one page
+        job = tuple of (url, content)
+        Returns the parsed dict
+    """
+    url, content = job
+    article = Article(url=url, raw_html=content)
+    article.parse_all(encoding='utf-8')
+    return article.parsed
+
+def unstaged(con, captures, stats):
+    """ Passes on the captures that haven't been staged before, with their region fingerprint
+        added
+    """
+    for capture in captures:
+        stats['read'] += 1
+        staged = con.execute(
+            'SELECT 1 FROM ingest_capture WHERE url = ? AND fetched_timestamp = ?',
+            (capture['url'], capture['fetched_timestamp'])
+            ).fetchone()
+        if staged is not None:
+            stats['duplicate'] += 1
+            continue
+        capture['fingerprint'] = region_fingerprint(capture['content'])
+        yield capture
+
+def batches(iterable, size):
+    """ Yields lists of up to size items at a time """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def plan_batch(con, batch, stats):
+    """ Works out which pages in a batch actually need parsing. A page with the same fingerprint
+        as one already staged (and not yet applied) for its URL gets a copy of that parse, and
+        one with the same fingerprint as another page in the batch shares its job.
+        Returns the list of (url, content) jobs for parse_page(). Each capture gets either its
+        'parsed' dict or the index of its 'job'.
+    """
+    jobs = []
+    batch_jobs = {}
+    for capture in batch:
+        key = (capture['url'], capture['fingerprint'])
+        if capture['fingerprint'] is not None:
+            row = con.execute(
+                """
+                SELECT headline, body, byline, _timestamp, parse_errors
+                FROM ingest_capture
+                WHERE url = ? AND fingerprint = ? AND result IS NULL
+                LIMIT 1
+                """, key
+                ).fetchone()
+            if row is not None:
+                capture['parsed'] = dict(zip(PARSED_FIELDS, row))
+                stats['reused'] += 1
+                continue
+            if key in batch_jobs:
+                capture['job'] = batch_jobs[key]
+                stats['reused'] += 1
+                continue
+            batch_jobs[key] = len(jobs)
+        capture['job'] = len(jobs)
+        jobs.append((capture['url'], capture['content']))
+        stats['parsed'] += 1
+    return jobs
+
+def stage_batch(con, batch, parse_result, stats):
+    """ Waits for a batch's pages to be parsed, then saves the batch in ingest_capture - along
+        with how far through its WARC file the batch got - and commits
+        parse_result = multiprocessing.pool.AsyncResult of the batch's jobs
+    """
+    parsed = parse_result.get()
+    rows = []
+    for capture in batch:
+        fields = capture['parsed'] if 'parsed' in capture else parsed[capture['job']]
+        rows.append((
+            capture['url'], capture['fetched_timestamp'], capture['source'],
+            capture['fingerprint'], *(fields[field] for field in PARSED_FIELDS)
+            ))
+    cursor = con.executemany(
+        """
+        INSERT OR IGNORE INTO ingest_capture(url, fetched_timestamp, source, fingerprint,
+                                             headline, body, byline, _timestamp, parse_errors)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows
+        )
+    stats['staged'] += cursor.rowcount
+    last = batch[-1]
+    if last['offset'] is not None:
+        con.execute(
+            'UPDATE ingest_source SET offset = ?, captures = captures + ? WHERE path = ?',
+            (last['offset'], len(batch), last['source'])
+            )
+    con.commit()
+
+def stage(con, pool, captures, stats, batch_size=200, chunksize=1):
+    """ Parses and stages captures a batch at a time. While one batch is being parsed by the
+        workers the next is read, so the archive is read and the database written in parallel
+        with the parsing.
+        pool = multiprocessing.Pool
+        chunksize = integer; jobs sent to a worker at a time
+        captures = iterable of capture dicts, from read_warc() or read_html_folder()
+        Returns True if it got to the end of the captures, or False if the archive turned out to
+        be broken part way through (logged)
+    """
+    broken = []
+
+    def readable(captures):
+        # Ends the captures cleanly at a broken archive, so the ones read before it are staged
+        try:
+            yield from captures
+        except ArchiveError as e:
+            logger.error('Archive error, the rest of the file has been skipped: %s', e)
+            broken.append(e)
+
+    pending = None
+    started = time.perf_counter()
+    for batch in batches(unstaged(con, readable(captures), stats), batch_size):
+        jobs = plan_batch(con, batch, stats)
+        for capture in batch:
+            # Only the job needs the page now
+            capture['content'] = None
+        result = pool.map_async(parse_page, jobs, chunksize=chunksize)
+        if pending is not None:
+            stage_batch(con, *pending, stats)
+            elapsed = time.perf_counter() - started
+            logger.info(
+                'Staged %s captures (%s parsed, %s copied), %.0f pages per minute...',
+                stats['staged'], stats['parsed'], stats['reused'],
+                stats['staged'] / elapsed * 60 if elapsed else 0
+                )
+        pending = (batch, result)
+    if pending is not None:
+        stage_batch(con, *pending, stats)
+    return not broken
+
+def stage_warc(con, pool, path, base_url, stats, batch_size=200, chunksize=1):
+    # pylint: disable=too-many-arguments
+    """ Stages a WARC file, carrying on from where the last run got to. Files that have been
+        fully staged before are skipped, unless they've changed size since.
+    """
+    path = os.path.abspath(path)
+    size = os.path.getsize(path)
+    row = con.execute(
+        'SELECT size, offset, complete FROM ingest_source WHERE path = ?', (path,)
+        ).fetchone()
+    if row is not None and row[0] == size and row[2]:
+        logger.info('%s: already staged, skipping it', path)
+        return
+    offset = row[1] if row is not None and row[0] == size else 0
+    con.execute(
+        """
+        INSERT INTO ingest_source(path, size, offset) VALUES (?, ?, ?)
+        ON CONFLICT(path) DO UPDATE SET size = excluded.size, offset = excluded.offset
+        """, (path, size, offset)
+        )
+    con.commit()
+    if offset:
+        logger.info('%s: carrying on from offset %s', path, offset)
+    captures = read_warc(path, base_url, stats, offset)
+    if stage(con, pool, captures, stats, batch_size, chunksize):
+        con.execute('UPDATE ingest_source SET complete = 1 WHERE path = ?', (path,))
+        con.commit()
+
+def stage_paths(con, paths, base_url, workers=None, batch_size=200):
+    """ Stages every WARC file and folder of saved HTML pages given
+        paths = list of strings
+        workers = integer; parsing processes (default: one per CPU)
+        Returns a collections.Counter of what happened to the pages read
+    """
+    stats = Counter()
+    workers = workers or os.cpu_count() or 1
+    # A few chunks per worker per batch, so they all finish at about the same time
+    chunksize = max(1, batch_size // (workers * 4))
+    with multiprocessing.Pool(workers) as pool:
+        for path in paths:
+            if os.path.isdir(path):
+                logger.info('%s: staging the saved pages in the folder', path)
+                captures = read_html_folder(path, base_url, stats)
+                stage(con, pool, captures, stats, batch_size, chunksize)
+            elif path.lower().endswith(WARC_EXTENSIONS):
+                logger.info('%s: staging the WARC file', path)
+                stage_warc(con, pool, path, base_url, stats, batch_size, chunksize)
+            else:
+                logger.warning('%s: not a folder or a .warc/.warc.gz file, skipping it', path)
+    return stats
+
+
+# Applying
+
+def url_state(con, reader, url):
+    """ Returns a dict of what's needed to apply captures of a URL: its latest stored version
+        (as an article table row, or None) and the time of its latest fetch (or None).
+        Adds the URL to the tracking table (at schedule_level 0) if it isn't there already.
+        reader = sqlite3.Cursor using dict_factory
+    """
+    con.execute('INSERT OR IGNORE INTO tracking VALUES(?, 0)', (url,))
+    previous = reader.execute(
+        'SELECT * FROM article WHERE url = ? ORDER BY article_id DESC LIMIT 1', (url,)
+        ).fetchone()
+    latest = reader.execute(
+        'SELECT MAX(fetched_timestamp) AS latest FROM fetch WHERE url = ?', (url,)
+        ).fetchone()['latest']
+    return {'url': url, 'previous': previous, 'latest': latest}
+
+def apply_capture(con, capture, state):
+    """ Stores one staged capture like check_articles() in the monitor would have if it had
+        fetched the page at the time: a new version if it's the first or has changed, otherwise
+        an unchanged fetch. Does not commit.
+        capture = dict; ingest_capture row
+        state = dict from url_state(), updated here
+        Returns (result, article_id of the version it was stored as or matched)
+    """
+    url = capture['url']
+    fetched_timestamp = capture['fetched_timestamp']
+    if state['latest'] is not None and fetched_timestamp <= state['latest']:
+        return 'older', None
+    parsed = {field: capture[field] for field in PARSED_FIELDS}
+    parsed['parse_errors'] = bool(parsed['parse_errors'])
+    article = Article(
+        url=url, fetched_timestamp=fetched_timestamp, parsed=parsed,
+        fingerprint=capture['fingerprint']
+        )
+    previous = state['previous']
+    if previous is not None and article.is_copy(table_row_to_article(previous)):
+        article_id = previous['article_id']
+        record_unchanged(con, article_id, fetched_timestamp)
+        record_fingerprint(con, url, article_id, article.fingerprint)
+        result = 'unchanged'
+        fetch_article_id = None
+    else:
+        article_id = article.store(con, commit=False)
+        if previous is not None:
+            # The snapshot counter has already been incremented, so it is the version number
+            version, _ = get_url_counts(con, url)
+            record_change(
+                con, article_id, previous, article.parsed, url, version, fetched_timestamp
+                )
+        record_new_version(con, article_id, url, fetched_timestamp)
+        record_fingerprint(con, url, article_id, article.fingerprint)
+        result = 'new' if previous is None else 'changed'
+        fetch_article_id = article_id
+        state['previous'] = dict(article.to_row_dict(), article_id=article_id)
+    con.execute(
+        """
+        INSERT INTO fetch(url, schedule_level, fetched_timestamp, status, changed, article_id)
+        VALUES (?, NULL, ?, '200', ?, ?)
+        """, (url, fetched_timestamp, result == 'changed', fetch_article_id)
+        )
+    state['latest'] = fetched_timestamp
+    return result, article_id
+
+def apply_staged(con, batch_size=500):
+    """ Applies every staged capture that hasn't been applied yet, in URL then time order,
+        committing a batch at a time. Applied captures keep their row (so they're not staged
+        again) but their parsed fields are cleared.
+        Returns a collections.Counter of the results
+    """
+    reader = con.cursor()
+    reader.row_factory = dict_factory
+    results = Counter()
+    state = None
+    while True:
+        captures = reader.execute(
+            """
+            SELECT * FROM ingest_capture
+            WHERE result IS NULL
+            ORDER BY url, fetched_timestamp
+            LIMIT ?
+            """, (batch_size,)
+            ).fetchall()
+        if not captures:
+            break
+        last_change_id, = con.execute(
+            'SELECT COALESCE(MAX(change_id), 0) FROM change_log'
+            ).fetchone()
+        stored = []
+        for capture in captures:
+            if state is None or state['url'] != capture['url']:
+                state = url_state(con, reader, capture['url'])
+            result, article_id = apply_capture(con, capture, state)
+            if result in ('new', 'changed'):
+                stored.append(article_id)
+            con.execute(
+                """
+                UPDATE ingest_capture
+                SET result = ?, article_id = ?, headline = NULL, body = NULL, byline = NULL,
+                    _timestamp = NULL
+                WHERE capture_id = ?
+                """, (result, article_id, capture['capture_id'])
+                )
+            results[result] += 1
+        # Keeps the backfill out of the live feed. Only this batch's rows, in case the monitor
+        # has stored something since last_change_id was read.
+        if stored:
+            con.execute(
+                f"""
+                DELETE FROM change_log
+                WHERE change_id > ? AND article_id IN ({', '.join('?' * len(stored))})
+                """, (last_change_id, *stored)
+                )
+        con.commit()
+        if results.total() % (batch_size * 20) < batch_size:
+            logger.info('Applied %s captures so far: %s', results.total(), dict(results))
+    return results
+
+
+if __name__ == '__main__':
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s: %(message)s')
+
+    parser = argparse.ArgumentParser(
+        description='Load archived article pages (WARC files or folders of saved HTML) into the '
+                    'database, as versions and fetches at the times they were captured'
+        )
+    parser.add_argument('database', help='path to the SQLite database file')
+    parser.add_argument(
+        'paths', nargs='*',
+        help='.warc/.warc.gz files and folders of saved .html pages (none just applies whatever '
+             'was staged by an earlier run)'
+        )
+    parser.add_argument(
+        '--base-url', default='https://www.bbc.co.uk',
+        help='site the article URLs are stored under, as BASE_URL in the monitor'
+        )
+    parser.add_argument(
+        '--workers', type=int, default=None, help='parsing processes (default: one per CPU)'
+        )
+    parser.add_argument(
+        '--batch-size', type=int, default=200, help='pages parsed and staged at a time'
+        )
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.database)
+    connection.execute('PRAGMA foreign_keys = ON')
+    apply_schema(connection)
+    # The version numbers come from the per-URL counters
+    ensure_counters(connection)
+    start = time.perf_counter()
+    staging_stats = stage_paths(
+        connection, args.paths, args.base_url, args.workers, args.batch_size
+        )
+    staged_in = time.perf_counter() - start
+    logger.info('Staging finished in %.0fs: %s', staged_in, dict(staging_stats))
+    applied = apply_staged(connection, args.batch_size * 5)
+    logger.info(
+        'Applied %s captures in %.0fs: %s',
+        applied.total(), time.perf_counter() - start - staged_in, dict(applied)
+        )
+    connection.close()
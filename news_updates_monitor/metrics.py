@@ -0,0 +1,357 @@
+"""
+
+    ***Monitor metrics***
+    Timings and counts from the monitor's main loop, in the Prometheus text format
+
+    Each stage of a run (discovery, scheduling, fetching, parsing and storing) is timed, along
+    with every request and every parse, and there are counters for responses by status, bytes
+    downloaded, parses skipped, parse errors and versions stored. These build up for as long as
+    the monitor runs and can be scraped from a small HTTP endpoint (see start_server() and the
+    [metrics] section of the monitor's config.ini), while summarise_cycle() gives the log a one
+    line summary of each run.
+
+    Written with the standard library rather than prometheus_client as it only needs a handful
+    of counters and histograms - the output is the same text format, so anything that can scrape
+    Prometheus can read it.
+
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class Registry():
+    """ Holds every metric and renders them as Prometheus text. The lock is shared by all the
+        metrics so the endpoint never sees one half updated.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = []
+
+    def add(self, metric):
+        """ Registers a metric and returns it """
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """ Returns all the metrics in the Prometheus text exposition format """
+        with self.lock:
+            return ''.join(metric.render() for metric in self.metrics)
+
+    def snapshot(self):
+        """ Returns {metric name: {labels: value}} of every metric's current values, where
+            histograms have a (count, sum) tuple as their value. Used to compare one cycle with
+            the next.
+        """
+        with self.lock:
+            return {metric.name: metric.snapshot() for metric in self.metrics}
+
+
+REGISTRY = Registry()
+
+
+def format_labels(labelnames, labels, extra=''):
+    """ Returns the {name="value",...} part of a sample line
+        extra = string; an already formatted label to add at the end (the histogram's le)
+    """
+    pairs = [
+        name + '="' + str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') +
+        '"'
+        for name, value in zip(labelnames, labels)
+        ]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def format_value(value):
+    """ Returns a number as Prometheus writes it """
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric():
+    """ Base class for a metric with optional labels
+        name = string; the metric's name (counters should end in _total)
+        documentation = string; the HELP text
+        labelnames = tuple of strings; label names, given as keyword arguments when it's updated
+    """
+    type_name = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = registry.lock
+        self.values = {}
+        registry.add(self)
+
+    def label_key(self, labels):
+        """ Returns the label values as a tuple in labelnames order """
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} needs labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        """ Returns the HELP and TYPE lines """
+        return f'# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.type_name}\n'
+
+    def render(self):
+        """ Returns the metric's lines (called with the registry lock held) """
+        lines = [self.header()]
+        for key, value in sorted(self.values.items()):
+            lines.append(
+                f'{self.name}{format_labels(self.labelnames, key)} {format_value(value)}\n'
+                )
+        return ''.join(lines)
+
+    def snapshot(self):
+        """ Returns a copy of the current values (called with the registry lock held) """
+        return dict(self.values)
+
+
+class Counter(Metric):
+    """ A count that only ever goes up """
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """ Adds amount to the count for the given labels """
+        key = self.label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """ A value that can go up and down, e.g. a queue length """
+    type_name = 'gauge'
+
+    def set(self, value, **labels):
+        """ Sets the value for the given labels """
+        key = self.label_key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def set_to_current_time(self, **labels):
+        """ Sets the value to the current Unix time """
+        self.set(time.time(), **labels)
+
+
+class Histogram(Metric):
+    """ Counts observations (e.g. durations in seconds) into cumulative buckets
+        buckets = tuple of floats; the upper bounds, in ascending order (+Inf is added)
+    """
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=(), registry=REGISTRY):
+        # pylint: disable=too-many-arguments
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, **labels):
+        """ Records one observation for the given labels """
+        key = self.label_key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """ Context manager that observes how many seconds its block took """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        """ Returns the bucket, sum and count lines for each set of labels """
+        lines = [self.header()]
+        for key, (counts, total) in sorted(self.values.items()):
+            for bound, count in zip(self.buckets, counts):
+                le = 'le="' + format_value(bound) + '"'
+                lines.append(
+                    f'{self.name}_bucket{format_labels(self.labelnames, key, le)} {count}\n'
+                    )
+            labels = format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {format_value(total)}\n')
+            # The +Inf bucket counts everything
+            lines.append(f'{self.name}_count{labels} {counts[-1]}\n')
+        return ''.join(lines)
+
+    def snapshot(self):
+        """ Returns {labels: (count, sum)} """
+        return {key: (counts[-1], total) for key, (counts, total) in self.values.items()}
+
+
+class Stopwatch():
+    """ Context manager that adds up the time spent in its block over several uses, for a stage
+        that is split across more than one step
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds += time.perf_counter() - self.start
+
+
+# Buckets in seconds
+STAGE_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+REQUEST_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PARSE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+# The stages of main_loop(), in order
+STAGES = ('discovery', 'scheduling', 'fetching', 'parsing', 'storing')
+
+CYCLE_SECONDS = Histogram(
+    'news_monitor_cycle_seconds', 'Time taken by each run of the main loop.',
+    buckets=STAGE_BUCKETS
+    )
+STAGE_SECONDS = Histogram(
+    'news_monitor_stage_seconds',
+    'Time taken by each stage of a run of the main loop, including its pauses for reading the '
+    'console.',
+    ('stage',), buckets=STAGE_BUCKETS
+    )
+REQUEST_SECONDS = Histogram(
+    'news_monitor_request_seconds',
+    'Article request latency, from sending the request until the response headers arrived.',
+    buckets=REQUEST_BUCKETS
+    )
+PARSE_SECONDS = Histogram(
+    'news_monitor_parse_seconds', 'Time taken to parse each article page.',
+    buckets=PARSE_BUCKETS
+    )
+RESPONSES = Counter(
+    'news_monitor_responses_total',
+    'Article requests by HTTP status, or exception name for requests that failed.', ('status',)
+    )
+RESPONSE_BYTES = Counter(
+    'news_monitor_response_bytes_total', 'Bytes of article page bodies downloaded.'
+    )
+PARSES_SKIPPED = Counter(
+    'news_monitor_parses_skipped_total',
+    'Pages not parsed because their article region was unchanged (see fingerprint.py).'
+    )
+PARSE_ERRORS = Counter(
+    'news_monitor_parse_errors_total', 'Pages parsed with one or more parse errors.'
+    )
+ARTICLES_CHECKED = Counter(
+    'news_monitor_articles_checked_total',
+    'Parsed pages checked against the database, by whether they were a new article, a changed '
+    'version or unchanged.', ('result',)
+    )
+NEW_URLS = Counter(
+    'news_monitor_new_urls_total', 'New article URLs found on the homepage.'
+    )
+SCHEDULED_URLS = Gauge(
+    'news_monitor_scheduled_urls', 'URLs due to be fetched in the latest run, by schedule level.',
+    ('schedule_level',)
+    )
+FETCH_QUEUE = Gauge(
+    'news_monitor_fetch_queue', 'Requests waiting in the throttler.'
+    )
+CHECK_QUEUE = Gauge(
+    'news_monitor_check_queue', 'Parsed pages waiting to be checked against the database.'
+    )
+LAST_CYCLE = Gauge(
+    'news_monitor_last_cycle_timestamp_seconds', 'Unix time the latest run finished.'
+    )
+
+
+def record_response(response, exception=None):
+    """ Counts a finished article request: its status, latency and size
+        response = requests.Response, or None if the request failed
+        exception = the exception the request failed with, if it did
+    """
+    if exception is not None:
+        RESPONSES.inc(status=exception.__class__.__name__)
+        return
+    RESPONSES.inc(status=response.status_code)
+    REQUEST_SECONDS.observe(response.elapsed.total_seconds())
+    RESPONSE_BYTES.inc(len(response.content))
+
+def summarise_cycle(before, after=None):
+    """ Returns a one line summary of a run for the log
+        before, after = dicts from REGISTRY.snapshot() taken at the start and end of the run
+                        (after defaults to now)
+    """
+    if after is None:
+        after = REGISTRY.snapshot()
+
+    def diff(metric, key=()):
+        old, new = before[metric.name].get(key), after[metric.name].get(key)
+        # A histogram with nothing observed yet (e.g. no requests made since the monitor started)
+        # has no values at all, but is still a (count, sum) pair
+        if isinstance(metric, Histogram):
+            old, new = old or (0, 0.0), new or (0, 0.0)
+            return new[0] - old[0], new[1] - old[1]
+        return (new or 0) - (old or 0)
+
+    stages = []
+    for stage in STAGES:
+        count, seconds = diff(STAGE_SECONDS, (stage,))
+        if count:
+            stages.append(f'{stage} {seconds:.1f}s')
+    statuses = []
+    for key in sorted(after[RESPONSES.name]):
+        count = diff(RESPONSES, key)
+        if count:
+            statuses.append(f'{key[0]}: {count:g}')
+    requests, request_seconds = diff(REQUEST_SECONDS)
+    parses, parse_seconds = diff(PARSE_SECONDS)
+    checked = {result: diff(ARTICLES_CHECKED, (result,))
+               for result in ('new', 'changed', 'unchanged')}
+    return (
+        f'Run metrics: {", ".join(stages) or "no stages timed"} | ' +
+        f'{requests} responses ({", ".join(statuses) or "none"}), ' +
+        f'{(request_seconds / requests if requests else 0) * 1000:.0f} ms avg, ' +
+        f'{diff(RESPONSE_BYTES) / 2**20:.1f} MB | ' +
+        f'{parses} parsed ({(parse_seconds / parses if parses else 0) * 1000:.0f} ms avg), ' +
+        f'{diff(PARSES_SKIPPED):g} skipped, {diff(PARSE_ERRORS):g} with errors | ' +
+        f'{checked["new"]:g} new, {checked["changed"]:g} changed, ' +
+        f'{checked["unchanged"]:g} unchanged'
+        )
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """ Serves the registry at /metrics """
+
+    def do_GET(self):
+        """ Returns the metrics, or a 404 for anything else """
+        # pylint: disable=invalid-name
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """ Scrapes every few seconds would drown out the monitor's own console output """
+
+def start_server(host='127.0.0.1', port=9464):
+    """ Serves /metrics from a background thread for as long as the program runs
+        Returns the ThreadingHTTPServer
+    """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
@@ -0,0 +1,354 @@
+"""
+
+    ***Near-duplicate detection***
+    Finds articles that have been published more than once under different URLs, using MinHash
+    signatures and locality-sensitive hashing (LSH)
+
+    The BBC sometimes republishes a story, almost word for word, at a new /news/articles/ URL.
+    Comparing every body with every other body to find these would take forever, so instead each
+    version's body is cut into overlapping runs of SHINGLE_WORDS words ("shingles") and boiled
+    down to a signature of NUM_HASHES numbers. The fraction of positions where two signatures
+    agree is an estimate of how similar the two sets of shingles are (Jaccard similarity).
+
+    Classic MinHash takes the smallest hash of any shingle under each of NUM_HASHES different
+    hash functions, but that's NUM_HASHES passes over every shingle - far too slow in pure Python
+    to do every time a version is stored. This uses one-permutation hashing instead: each
+    shingle is hashed once, the hash picks one of NUM_HASHES bins and each bin keeps the smallest
+    hash that lands in it. Bins that nothing lands in (only likely for short bodies) borrow from
+    the next bin along, so every position still means the same thing in every signature.
+
+    The signature is then split into BANDS bands, and each band hashed to a bucket in the
+    minhash_band table (see db_schema.sql). Two versions land in the same bucket for at least
+    one band if they're similar - over 98% of the time for bodies 70% the same, and less than
+    half the time for bodies under 40% the same - so finding candidates is a few index lookups,
+    and only the candidates' signatures are compared.
+
+    Changing any of the settings below means running --backfill --rebuild, as signatures made
+    with different settings can't be compared.
+
+    Article.store() calls index_minhash() for each new version, so the index is kept up to date
+    as the monitor runs. Bodies shorter than MIN_SHINGLES shingles (video and live pages, or
+    failed parses) aren't indexed, as they'd all look the same.
+
+    Can also be run as a script:
+        python minhash.py path/to/news_updates_monitor.sqlite3 --backfill   index older versions
+        python minhash.py path/to/news_updates_monitor.sqlite3 --url URL    also published as
+        python minhash.py path/to/news_updates_monitor.sqlite3 --report     every cluster
+
+"""
+
+import argparse
+import hashlib
+import logging
+import re
+import sqlite3
+from array import array
+from functools import lru_cache
+from itertools import groupby
+
+from database import apply_schema
+from search import strip_html
+
+
+logger = logging.getLogger(__name__)
+
+SHINGLE_WORDS = 5
+MIN_SHINGLES = 20
+NUM_HASHES = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_HASHES // BANDS
+# Fraction of the signature that has to match for two versions to count as the same story
+DEFAULT_THRESHOLD = 0.8
+# Added (per bin of distance) to values borrowed by empty bins, see compute_signature()
+BORROW_OFFSET = 0x9E3779B9
+
+WORD_RE = re.compile(r'\w+')
+
+
+def shingle_hashes(body):
+    """ Returns the set of 64 bit hashes of the body's shingles (runs of SHINGLE_WORDS words,
+        lower case, ignoring the HTML and punctuation)
+        body = string; the stored body HTML
+    """
+    words = WORD_RE.findall(strip_html(body).lower())
+    shingles = set()
+    for i in range(max(len(words) - SHINGLE_WORDS + 1, 1 if words else 0)):
+        shingle = ' '.join(words[i:i + SHINGLE_WORDS]).encode('utf-8')
+        # A stable hash - Python's own hash() of a string changes every time it's started
+        shingles.add(int.from_bytes(hashlib.blake2b(shingle, digest_size=8).digest(), 'little'))
+    return shingles
+
+def compute_signature(body):
+    """ Returns the body's signature as an array of NUM_HASHES unsigned 32 bit ints, or None if
+        it's too short to be worth indexing
+        Only the low 32 bits of each bin's minimum are kept, which halves the storage for a
+        negligible chance of two different minimums looking the same
+    """
+    shingles = shingle_hashes(body)
+    if len(shingles) < MIN_SHINGLES:
+        return None
+    empty = 1 << 64
+    bins = [empty] * NUM_HASHES
+    for shingle in shingles:
+        position = shingle % NUM_HASHES
+        value = shingle // NUM_HASHES
+        if value < bins[position]:
+            bins[position] = value
+    signature = array('I', [0]) * NUM_HASHES
+    for position in range(NUM_HASHES):
+        # An empty bin takes the value of the next filled one (wrapping round), offset by the
+        # distance so it can only match a bin that borrowed from the same place
+        distance = 0
+        while bins[(position + distance) % NUM_HASHES] == empty:
+            distance += 1
+        value = bins[(position + distance) % NUM_HASHES] + distance * BORROW_OFFSET
+        signature[position] = value & 0xFFFFFFFF
+    return signature
+
+def band_buckets(signature):
+    """ Returns the LSH bucket of each band of the signature, as signed 64 bit ints for SQLite.
+        The band number is hashed in too, so the same values in different bands don't collide.
+    """
+    buckets = []
+    for band in range(BANDS):
+        values = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(bytes([band]) + values.tobytes(), digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, 'little', signed=True))
+    return buckets
+
+def similarity(signature_a, signature_b):
+    """ Returns the estimated Jaccard similarity (0 to 1) of the bodies two signatures came from
+    """
+    return sum(a == b for a, b in zip(signature_a, signature_b)) / NUM_HASHES
+
+def load_signature(blob):
+    """ Turns a stored signature back into an array """
+    signature = array('I')
+    signature.frombytes(blob)
+    return signature
+
+def index_minhash(con, article_id, url, body):
+    """ Adds one article version to the near-duplicate index. Does not commit - the caller commits
+        alongside the article row.
+        con = sqlite3.Connection object
+        article_id = integer
+        url = string
+        body = string or None; the parsed body (HTML) of the version
+    """
+    signature = compute_signature(body)
+    if signature is None:
+        return
+    con.execute(
+        'INSERT OR REPLACE INTO article_minhash(article_id, url, signature) VALUES (?, ?, ?)',
+        (article_id, url, signature.tobytes())
+        )
+    con.executemany(
+        'INSERT OR IGNORE INTO minhash_band(bucket, article_id) VALUES (?, ?)',
+        [(bucket, article_id) for bucket in band_buckets(signature)]
+        )
+
+def backfill(con, batch_size=1000, rebuild=False):
+    """ Indexes every stored version that isn't in the near-duplicate index yet, committing every
+        batch_size versions, so an interrupted backfill just carries on where it stopped
+        rebuild = boolean; empty the index first (needed after changing the hash settings)
+        Returns the number of versions looked at (bodies too short to index are looked at
+        again each time, as they have nothing in the index to show they've been done)
+    """
+    if rebuild:
+        con.execute('DELETE FROM minhash_band')
+        con.execute('DELETE FROM article_minhash')
+        con.commit()
+    counter = 0
+    last_id = 0
+    while True:
+        rows = con.execute(
+            """
+            SELECT article_id, url, body FROM article
+            WHERE article_id > ?
+              AND NOT EXISTS (
+                SELECT 1 FROM article_minhash WHERE article_id = article.article_id
+                )
+            ORDER BY article_id
+            LIMIT ?
+            """, (last_id, batch_size)
+            ).fetchall()
+        if not rows:
+            break
+        for article_id, url, body in rows:
+            index_minhash(con, article_id, url, body)
+        con.commit()
+        counter += len(rows)
+        last_id = rows[-1][0]
+        logger.info('Indexed %s versions so far...', counter)
+    return counter
+
+def also_published_as(con, url, threshold=DEFAULT_THRESHOLD, limit=20):
+    """ Finds other URLs with a version that's a near-duplicate of any version of this one
+        con = sqlite3.Connection object
+        url = string
+        threshold = float; minimum estimated similarity
+        Returns a list of dicts (url, similarity, headline, first_seen), most similar first,
+        where headline is that URL's latest headline and first_seen its first version's time
+    """
+    cursor = con.cursor()
+    cursor.row_factory = None
+    signatures = [
+        load_signature(blob) for blob, in cursor.execute(
+            'SELECT signature FROM article_minhash WHERE url = ? ORDER BY article_id', (url,)
+            )
+        ]
+    buckets = sorted({bucket for signature in signatures for bucket in band_buckets(signature)})
+    if not buckets:
+        return []
+    candidates = cursor.execute(
+        f"""
+        SELECT DISTINCT article_minhash.article_id, article_minhash.url, article_minhash.signature
+        FROM minhash_band
+        JOIN article_minhash USING (article_id)
+        WHERE minhash_band.bucket IN ({','.join('?' * len(buckets))})
+          AND article_minhash.url != ?
+        """, (*buckets, url)
+        ).fetchall()
+    best = {}
+    for _, other_url, blob in candidates:
+        other = load_signature(blob)
+        score = max(similarity(signature, other) for signature in signatures)
+        if score >= threshold and score > best.get(other_url, 0):
+            best[other_url] = score
+    matches = sorted(best.items(), key=lambda item: (-item[1], item[0]))[:limit]
+    results = []
+    for other_url, score in matches:
+        headline, first_seen = cursor.execute(
+            """
+            SELECT
+              (SELECT headline FROM article WHERE url = ? ORDER BY article_id DESC LIMIT 1),
+              (SELECT MIN(fetched_timestamp) FROM article WHERE url = ?)
+            """, (other_url, other_url)
+            ).fetchone()
+        results.append({
+            'url': other_url, 'similarity': score, 'headline': headline, 'first_seen': first_seen
+            })
+    return results
+
+def find_clusters(con, threshold=DEFAULT_THRESHOLD, comparisons=5):
+    """ Groups every indexed URL with the other URLs it's a near-duplicate of, by going through
+        the LSH buckets in order once. Within each bucket, a version is only compared with the
+        first versions of up to `comparisons` other URLs in it (URLs already known to be in the
+        same group are skipped), so the time taken grows with the size of the index rather than
+        the number of possible pairs.
+        Returns a list of clusters, each a list of URLs (two or more), biggest first
+    """
+    parent = {}
+
+    def find(item):
+        # Union-find with path halving
+        parent.setdefault(item, item)
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    @lru_cache(maxsize=10000)
+    def signature_of(article_id):
+        blob, = con.execute(
+            'SELECT signature FROM article_minhash WHERE article_id = ?', (article_id,)
+            ).fetchone()
+        return load_signature(blob)
+
+    cursor = con.cursor()
+    cursor.row_factory = None
+    rows = cursor.execute(
+        """
+        SELECT minhash_band.bucket, minhash_band.article_id, article_minhash.url
+        FROM minhash_band
+        JOIN article_minhash USING (article_id)
+        ORDER BY minhash_band.bucket
+        """
+        )
+    compared = 0
+    for _, members in groupby(rows, key=lambda row: row[0]):
+        # The first (oldest) version of each URL in the bucket
+        firsts = {}
+        for _, article_id, url in members:
+            firsts.setdefault(url, article_id)
+        if len(firsts) < 2:
+            continue
+        earlier = []
+        for url, article_id in firsts.items():
+            for other_url, other_id in earlier[:comparisons]:
+                if find(url) == find(other_url):
+                    continue
+                compared += 1
+                if similarity(signature_of(article_id), signature_of(other_id)) >= threshold:
+                    parent[find(url)] = find(other_url)
+            earlier.append((url, article_id))
+    logger.info('Compared %s pairs of signatures', compared)
+    clusters = {}
+    for url in parent:
+        clusters.setdefault(find(url), []).append(url)
+    return sorted(
+        (sorted(urls) for urls in clusters.values() if len(urls) > 1),
+        key=lambda urls: (-len(urls), urls[0])
+        )
+
+def print_report(con, clusters):
+    """ Prints each cluster with every URL's first seen time and latest headline, in the order
+        they were first seen
+    """
+    for i, urls in enumerate(clusters):
+        details = []
+        for url in urls:
+            first_seen, headline = con.execute(
+                """
+                SELECT MIN(fetched_timestamp),
+                       (SELECT headline FROM article WHERE url = ? ORDER BY article_id DESC
+                        LIMIT 1)
+                FROM article WHERE url = ?
+                """, (url, url)
+                ).fetchone()
+            details.append((first_seen or '', url, headline))
+        print(f'\n{i + 1}. Published {len(urls)} times:')
+        for first_seen, url, headline in sorted(details):
+            print(f'  {first_seen[:19]}  {url}\n                       {headline}')
+
+
+if __name__ == '__main__':
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s: %(message)s')
+
+    parser = argparse.ArgumentParser(
+        description='Find articles republished under more than one URL'
+        )
+    parser.add_argument('database', help='path to the SQLite database file')
+    parser.add_argument(
+        '--backfill', action='store_true',
+        help='index versions stored before the near-duplicate index existed'
+        )
+    parser.add_argument(
+        '--rebuild', action='store_true',
+        help='with --backfill, throw the index away and build it again from scratch'
+        )
+    parser.add_argument('--url', help='list the other URLs this article was also published as')
+    parser.add_argument('--report', action='store_true', help='list every group of duplicates')
+    parser.add_argument(
+        '--threshold', type=float, default=DEFAULT_THRESHOLD,
+        help='estimated similarity (0 to 1) that counts as a duplicate'
+        )
+    parser.add_argument('--batch-size', type=int, default=1000, help='versions per transaction')
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.database)
+    connection.execute('PRAGMA foreign_keys = ON')
+    apply_schema(connection)
+    if args.backfill:
+        total = backfill(connection, args.batch_size, args.rebuild)
+        logger.info('Backfill complete: looked at %s versions', total)
+    if args.url:
+        for match in also_published_as(connection, args.url, args.threshold, limit=100):
+            print(f"{match['similarity']:.2f}  {match['first_seen'][:19]}  {match['url']}\n" +
+                  f"      {match['headline']}")
+    if args.report:
+        found = find_clusters(connection, args.threshold)
+        print_report(connection, found)
+        print(f'\n{len(found)} stories published under more than one URL')
+    connection.close()
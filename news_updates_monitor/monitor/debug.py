@@ -81,14 +81,13 @@ def debug_table(attrs, parsed):
             article_list = db[_id]
             n = 0
             for article in article_list:
-                article_dict = article.__dict__
                 data_row = ''
                 data_row += indent(start_indent+2) + '<tr>\n'
                 data_row += indent(start_indent+4) + '<td>' + _id + '</td>\n'
                 data_row += indent(start_indent+4) + '<td>' + str(n) + '</td>\n'
                 for attr in  attrs:
                     data_row += (
-                        indent(start_indent+4) + '<td>' + str(article_dict[attr]) + '</td>\n'
+                        indent(start_indent+4) + '<td>' + str(getattr(article, attr)) + '</td>\n'
                         )
                 for item in parsed:
                     data_row += (
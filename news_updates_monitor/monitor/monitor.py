@@ -29,6 +29,64 @@ sys.path.append('..')
 # Disabling Pylint as it cannot detect the system path hacked local module
 # pylint: disable-next=import-error
 from article import Article, table_row_to_article, dict_factory
+# pylint: disable-next=import-error
+from database import apply_schema
+# pylint: disable-next=import-error
+from counters import get_totals, ensure_counters, get_url_counts
+# pylint: disable-next=import-error
+from change_stats import record_change
+# pylint: disable-next=import-error
+from validity import record_new_version, record_unchanged
+# pylint: disable-next=import-error
+from fingerprint import region_fingerprint, latest_fingerprint, record_fingerprint
+# pylint: disable-next=import-error
+import metrics
+# pylint: disable-next=import-error
+import discovery
+# pylint: disable-next=import-error
+import homepage
+# pylint: disable-next=import-error
+from profiling import Profiler
+# pylint: disable-next=import-error
+from soak import MemoryWatch
+
+
+# Replaced by the root logger when run as a script (see below), but needed when it's imported
+logger = logging.getLogger(__name__)
+
+# The database every function reads and writes (relative to this folder, where the monitor is run
+# from) - the benchmarks point this at a synthetic database instead
+DATABASE = 'test_db/news_updates_monitor.sqlite3'
+
+# Where the news is fetched from, and seconds between article requests. Both can be changed in
+# the [monitor] section of config.ini (see load_config()), e.g. to run against the fake news
+# server in the benchmarks folder instead of the live site.
+BASE_URL = 'https://www.bbc.co.uk'
+FETCH_DELAY = 5.0
+
+# Where new articles are found (see find_new_news()): 'homepage' scrapes BASE_URL/news, 'feeds'
+# reads FEEDS. FEEDS are absolute URLs or paths on BASE_URL. Both set by the [discovery] section
+# of config.ini.
+DISCOVERY_SOURCES = ('homepage',)
+FEEDS = ()
+
+# (host, port) to serve the Prometheus metrics on (see metrics.py), or None for no endpoint. Set
+# by the [metrics] section of config.ini.
+METRICS_ADDRESS = None
+
+# Profiles runs of the main loop that take too long (see profiling.py), or None when profiling is
+# off. Set by the [profiling] section of config.ini.
+PROFILER = None
+
+# Checks memory use for leaks between runs of the main loop (see soak.py), or None when soak mode
+# is off. Set by the [soak] section of config.ini.
+MEMORY_WATCH = None
+
+# Articles in the top PROMINENT_POSITIONS of the latest homepage read are kept on schedule_level
+# PROMINENT_LEVEL or lower for as long as they stay there (see update_schedule_levels()), or 0 to
+# schedule by age alone. Set by the [homepage] section of config.ini.
+PROMINENT_POSITIONS = 0
+PROMINENT_LEVEL = 2
 
 
 class TimeoutHTTPAdapter(HTTPAdapter):
@@ -80,30 +138,41 @@ def request_html(url):
 def main_loop():
     """ Checks the BBC News homepage for new articles, as well as checks existing articles in the
         database for updates. Uses a scheduling system so that articles are only checked at certain
-        times depending on how old they are.        
+        times depending on how old they are.
+        Each stage is timed (see metrics.py) and a summary of the run is logged at the end.
     """
-    # Runs any tasks scheduled by the Schedule module (weekly report for now)
-    schedule.run_pending()
-    # Update Tracking table to make sure all schedule_levels are up to date
-    update_schedule_levels()
-    # Find new news articles that we haven't yet seen and add them to the Tracking table
-    new_news_to_tracking()
-    # Decide which URLs will be fetched this loop based on their schedule_level
-    scheduled_urls = calculate_scheduled_urls()
-    # Fetch the URLs and convert to parsed article objects (i.e. article snapshots)
-    articles = urls_to_parsed_articles(urls=scheduled_urls, delay=5)
-    # Process article objects: store new and updated articles in database
-    check_articles(articles)
+    before = metrics.REGISTRY.snapshot()
+    scheduling = metrics.Stopwatch()
+    with metrics.CYCLE_SECONDS.time():
+        # Runs any tasks scheduled by the Schedule module (weekly report for now)
+        schedule.run_pending()
+        # Update Tracking table to make sure all schedule_levels are up to date
+        with scheduling:
+            update_schedule_levels()
+        # Find new news articles that we haven't yet seen and add them to the Tracking table
+        with metrics.STAGE_SECONDS.time(stage='discovery'):
+            new_news_to_tracking()
+        # Decide which URLs will be fetched this loop based on their schedule_level
+        with scheduling:
+            scheduled_urls = calculate_scheduled_urls()
+        metrics.STAGE_SECONDS.observe(scheduling.seconds, stage='scheduling')
+        # Fetch the URLs and convert to parsed article objects (i.e. article snapshots)
+        # The fetching and parsing stages are timed inside
+        articles = urls_to_parsed_articles(urls=scheduled_urls, delay=FETCH_DELAY)
+        # Process article objects: store new and updated articles in database
+        metrics.CHECK_QUEUE.set(len(articles))
+        with metrics.STAGE_SECONDS.time(stage='storing'):
+            check_articles(articles)
+        metrics.CHECK_QUEUE.set(0)
+    metrics.LAST_CYCLE.set_to_current_time()
+    logger.info('%s', metrics.summarise_cycle(before))
 
 def weekly_report():
-    con = sqlite3.connect('test_db/news_updates_monitor.sqlite3')
+    con = sqlite3.connect(DATABASE)
     con.execute('PRAGMA foreign_keys = ON')
-    cursor = con.execute('SELECT COUNT(*) FROM tracking')
-    total, = cursor.fetchone()
-    cursor = con.execute('SELECT COUNT(*) FROM article')
-    total_snapshot, = cursor.fetchone()
-    cursor = con.execute('SELECT COUNT(*) FROM fetch')
-    total_fetch, = cursor.fetchone()
+    # Maintained by triggers (see counters.py) so no need to count the tables
+    total, total_snapshot, total_fetch = get_totals(con)
+    con.close()
     telegram_str = ('<b>*** Weekly Report ***</b>\n' +
                 'Total unique articles: <b>{:,}</b>\n'.format(total) +
                 'Total article snapshots: <b>{:,}</b>\n'.format(total_snapshot) +
@@ -131,6 +200,10 @@ def update_schedule_levels():
         timestamps were relied on like the rest of the levels). The system should not attempt to
         manually update these levels based on their timestamps, so that we can keep them in the
         database without having the system clog up trying to catch up with the old fetches.
+
+        If PROMINENT_POSITIONS is set, articles that are that close to the top of the latest
+        homepage read are kept at PROMINENT_LEVEL at most, however old they are, and go back to
+        their level by age once they've moved down or off it.
     """
     schedule_level_duration = {
     1: timedelta(hours=3),
@@ -139,7 +212,7 @@ def update_schedule_levels():
     4: timedelta(weeks=1),
     5: timedelta(weeks=4),
     }
-    con = sqlite3.connect('test_db/news_updates_monitor.sqlite3')
+    con = sqlite3.connect(DATABASE)
     con.execute('PRAGMA foreign_keys = ON')
     cursor = con.execute(
             """
@@ -154,6 +227,10 @@ def update_schedule_levels():
     logger.info('Updating Tracking table schedule_levels for existing articles...')
     time.sleep(2)
     rows = cursor.fetchall()
+    prominent = {}
+    if PROMINENT_POSITIONS:
+        # An old homepage read (e.g. it's been failing) could hold articles up for hours
+        prominent = homepage.on_homepage(con, PROMINENT_POSITIONS, max_age=timedelta(hours=1))
     counter = 0
     for row in rows:
         url, current_schedule_level, first_fetched_timestamp, _ = row
@@ -174,6 +251,8 @@ def update_schedule_levels():
             new_schedule_level = 1
         else:
             typing.assert_never(time_since_fetch)
+        if url in prominent:
+            new_schedule_level = min(new_schedule_level, PROMINENT_LEVEL)
 
         if new_schedule_level != current_schedule_level:
             # The new level is different to the existing one in DB, so we can update it
@@ -195,35 +274,51 @@ def new_news_to_tracking():
     """
     logger.info('Finding new news articles...')
     time.sleep(2)
-    con = sqlite3.connect('test_db/news_updates_monitor.sqlite3')
+    con = sqlite3.connect(DATABASE)
     con.execute('PRAGMA foreign_keys = ON')
     new_urls = find_new_news()
     for url in new_urls:
         # New URLs always start on schedule_level 1
         con.execute("INSERT INTO tracking VALUES(?, 1)", (url,))
         con.commit()
+    metrics.NEW_URLS.inc(len(new_urls))
     logger.info('Added %s new URLs into the Tracking table', len(new_urls))
     con.close()
 
 def find_new_news():
-    """ Parses BBC homepage for all news articles and checks if they are new to our system
+    """ Collects news article URLs from each of the DISCOVERY_SOURCES (the BBC homepage and/or
+        the section feeds) and checks if they are new to our system
         Returns a list of URLs that should be added to our system
     """
-    con = sqlite3.connect('test_db/news_updates_monitor.sqlite3')
+    con = sqlite3.connect(DATABASE)
     con.execute('PRAGMA foreign_keys = ON')
-    latest_news_urls = get_news_urls()
-    cursor = con.execute("SELECT url FROM tracking")
-    stored_urls = [row[0] for row in cursor]
-    online_urls_not_in_storage = list(set(latest_news_urls) - set(stored_urls))
+    latest_news_urls = set()
+    if 'homepage' in DISCOVERY_SOURCES:
+        homepage_urls = get_news_urls()
+        # If the homepage request failed (already logged by request_html()) it's tried again
+        # next loop
+        if homepage_urls is not None:
+            discovery.DISCOVERED_URLS.inc(len(homepage_urls), source='homepage')
+            homepage.record_homepage(con, homepage_urls)
+            con.commit()
+            latest_news_urls.update(homepage_urls)
+    if 'feeds' in DISCOVERY_SOURCES:
+        feed_urls, failed = discovery.read_feeds(con, FEEDS, BASE_URL)
+        discovery.DISCOVERED_URLS.inc(len(feed_urls), source='feeds')
+        latest_news_urls.update(feed_urls)
+        logger.info(
+            'Found %s article links in %s feeds (%s failed)', len(feed_urls), len(FEEDS), failed
+            )
+    online_urls_not_in_storage = discovery.untracked(con, latest_news_urls)
     con.close()
     return online_urls_not_in_storage
 
 def get_news_urls(debug=None):
     """ Extracts all the news article URLs from the BBC Homepage
-        Returns a list of URL strings
+        Returns a list of URL strings, in the order they first appear on the page
         debug = integer; flag to reduce the number returned for testing purposes
     """
-    news_homepage = 'https://www.bbc.co.uk/news'
+    news_homepage = BASE_URL + '/news'
     news_homepage_html = request_html(news_homepage)
     # In the event of connection issues we don't want to carry on with the function
     if news_homepage_html is None:
@@ -234,10 +329,12 @@ def get_news_urls(debug=None):
         href = link.get('href')
         # href attribute exists on the <a> AND contains '/news/articles/'
         # AND is not the '#comments' version of the link
-        if href is not None and href.find('/news/articles/') != -1 and href.find('comments') == -1:
-            news_urls.append('https://www.bbc.co.uk' + href)
-    # Remove duplicate URLs
-    news_urls = list(set(news_urls))
+        # (discovery.article_url() also keeps just the path, in case a link is absolute)
+        url = discovery.article_url(href, BASE_URL)
+        if url is not None:
+            news_urls.append(url)
+    # Remove duplicate URLs, keeping the first link's place so the order is the homepage's
+    news_urls = list(dict.fromkeys(news_urls))
     if debug is not None:
         return news_urls[:debug]
     return news_urls
@@ -253,7 +350,7 @@ def calculate_scheduled_urls():
      """
     logger.info('Calculating which URLs to fetch based on schedule_level...')
     time.sleep(2)
-    con = sqlite3.connect('test_db/news_updates_monitor.sqlite3')
+    con = sqlite3.connect(DATABASE)
     con.execute('PRAGMA foreign_keys = ON')
 
     all_urls = []
@@ -266,6 +363,7 @@ def calculate_scheduled_urls():
     level_1_urls = [row[0] for row in cursor]
     all_urls.extend(level_1_urls)
     schedule_results[1] = len(level_1_urls)
+    metrics.SCHEDULED_URLS.set(len(level_1_urls), schedule_level=1)
 
     # Setup schedule levels
     schedule_level = {
@@ -296,6 +394,7 @@ def calculate_scheduled_urls():
             if time_since_fetch >= wait_time:
                 urls.append(url)
         schedule_results[level] = len(urls)
+        metrics.SCHEDULED_URLS.set(len(urls), schedule_level=level)
         all_urls.extend(urls)
 
     schedule_results_str = ''
@@ -314,8 +413,9 @@ def urls_to_parsed_articles(urls, delay):
         urls = list of strings
         delay = float; seconds to use for requests throttling
     """
-    # pylint: disable=too-many-locals
+    # pylint: disable=too-many-locals,too-many-statements
     #         it was 16/15 - it could be refactored but a lot of effort for the sake of 1 variable
+    #         (and a few more since the fingerprint check was added)
 
     # List of request objects to send to the throttler
     reqs = []
@@ -330,67 +430,98 @@ def urls_to_parsed_articles(urls, delay):
 
     # Throttler queues all the requests and processes them slowly
     # This step can take a while depending on the delay and number of URLs
-    with BaseThrottler(name='base-throttler', delay=delay, session=session) as bt:
-        throttled_requests = bt.multi_submit(reqs)
+    metrics.FETCH_QUEUE.set(len(reqs))
+    with metrics.STAGE_SECONDS.time(stage='fetching'):
+        with BaseThrottler(name='base-throttler', delay=delay, session=session) as bt:
+            throttled_requests = bt.multi_submit(reqs)
+    metrics.FETCH_QUEUE.set(0)
 
-    con = sqlite3.connect('test_db/news_updates_monitor.sqlite3')
+    con = sqlite3.connect(DATABASE)
     con.execute('PRAGMA foreign_keys = ON')
     res = []
+    c_skipped = 0
+
+    # Fingerprinting, parsing and recording the fetches are all timed as the parsing stage
+    with metrics.STAGE_SECONDS.time(stage='parsing'):
+        for tr in throttled_requests:
+            fetched_timestamp = datetime.now(timezone.utc).isoformat()
+            metrics.record_response(tr.response, tr.exception)
+            # First check for any exceptions
+            if tr.exception is not None:
+                logger.error(
+                    'Request Error: URL: %s\n' +
+                    'Exception __str__:\n%s\n' +
+                    'Exception Type:\n%s\n',
+                    tr.request.url, tr.exception, type(tr.exception)
+                    )
+                status = tr.exception.__class__.__name__
+            # The 3rd party library doesn't raise exception for HTTPError so we check
+            elif tr.response.status_code != 200:
+                logger.error(
+                    'Request Error: URL: %s\n' +
+                    'HTTP Error - Status Code: %s\n',
+                    tr.request.url, tr.response.status_code
+                    )
+                status = str(tr.response.status_code)
+            # Anything that gets to here is status code 200
+            else:
+                status = '200'
+                fingerprint = region_fingerprint(tr.response.content)
+                latest = latest_fingerprint(con, tr.response.url) if fingerprint else None
+                if latest is not None and latest[1] == fingerprint:
+                    # The article part of the page is byte for byte the same as when it last
+                    # parsed to the latest version, so record an unchanged fetch without parsing it
+                    record_unchanged(con, latest[0], fetched_timestamp)
+                    schedule_level = get_schedule_level(tr.request.url)
+                    bind = (tr.request.url, schedule_level, fetched_timestamp, status, False)
+                    con.execute("""
+                        INSERT INTO fetch('url', 'schedule_level', 'fetched_timestamp', 'status',
+                                          'changed')
+                        VALUES(?, ?, ?, ?, ?)
+                        """, bind)
+                    con.commit()
+                    c_skipped += 1
+                    metrics.PARSES_SKIPPED.inc()
+                    continue
+                # The raw bytes go straight to the parser, which decodes them as UTF-8 itself
+                # (see request_html() for why the encoding is fixed) - this avoids keeping a
+                # decoded copy of every page in memory alongside the response
+                article = Article(url=tr.response.url, fingerprint=fingerprint)
+                article.raw_html = tr.response.content
+                # Note: technically not when it is 'fetched' as that happens inside the threading
+                # of requests_throttler, so there could be up to a couple of minutes delay on this
+                # time
+                # NOTE: the above may no longer be true!
+                article.fetched_timestamp = fetched_timestamp
+                with metrics.PARSE_SECONDS.time():
+                    article.parse_all(encoding='utf-8')
+                if article.parsed['parse_errors']:
+                    metrics.PARSE_ERRORS.inc()
+                res.append(article)
+
+            schedule_level = get_schedule_level(tr.request.url)
+            bind = (tr.request.url, schedule_level, fetched_timestamp, status)
+            con.execute("""
+                INSERT INTO fetch('url', 'schedule_level', 'fetched_timestamp', 'status')
+                VALUES(?, ?, ?, ?)
+                """, bind)
+            con.commit()
 
-    for tr in throttled_requests:
-        fetched_timestamp = datetime.now(timezone.utc).isoformat()
-        # First check for any exceptions
-        if tr.exception is not None:
-            logger.error(
-                'Request Error: URL: %s\n' +
-                'Exception __str__:\n%s\n' +
-                'Exception Type:\n%s\n',
-                tr.request.url, tr.exception, type(tr.exception)
-                )
-            status = tr.exception.__class__.__name__
-        # The 3rd party library doesn't raise exception for HTTPError so we check
-        elif tr.response.status_code != 200:
-            logger.error(
-                'Request Error: URL: %s\n' +
-                'HTTP Error - Status Code: %s\n',
-                tr.request.url, tr.response.status_code
-                )
-            status = str(tr.response.status_code)
-        # Anything that gets to here is status code 200
-        else:
-            tr.response.encoding = 'utf-8'
-            article = Article(url=tr.response.url)
-            article.raw_html = tr.response.text
-            # Note: technically not when it is 'fetched' as that happens inside the threading of
-            # requests_throttler, so there could be up to a couple of minutes delay on this time
-            # NOTE: the above may no longer be true!
-            article.fetched_timestamp = fetched_timestamp
-            article.parse_all()
-            res.append(article)
-            status = '200'
-
-        schedule_level = get_schedule_level(tr.request.url)
-        bind = (tr.request.url, schedule_level, fetched_timestamp, status)
-        con.execute("""
-            INSERT INTO fetch('url', 'schedule_level', 'fetched_timestamp', 'status')
-            VALUES(?, ?, ?, ?)
-            """, bind)
-        con.commit()
-
-        if status != '200':
-            telegram_str = ('<b>*** Request Error ***</b>\n' +
-                '<b>URL: </b>' + tr.request.url + '\n' +
-                '<b>Fetched Timestamp: </b>' + fetched_timestamp + '\n' +
-                '<b>Status: </b>' + status
-                )
-            asyncio.run(telegram_bot_send_msg(telegram_str))
+            if status != '200':
+                telegram_str = ('<b>*** Request Error ***</b>\n' +
+                    '<b>URL: </b>' + tr.request.url + '\n' +
+                    '<b>Fetched Timestamp: </b>' + fetched_timestamp + '\n' +
+                    '<b>Status: </b>' + status
+                    )
+                asyncio.run(telegram_bot_send_msg(telegram_str))
 
     con.close()
+    logger.info('Skipped parsing %s pages with an unchanged article region', c_skipped)
     return res
 
 def get_schedule_level(url):
     """ Returns a given URL's current schedule_level from the Tracking table """
-    con = sqlite3.connect('test_db/news_updates_monitor.sqlite3')
+    con = sqlite3.connect(DATABASE)
     con.execute('PRAGMA foreign_keys = ON')
     cursor = con.execute('SELECT schedule_level FROM tracking WHERE url=?', (url,))
     schedule_level = cursor.fetchone()
@@ -407,7 +538,7 @@ def check_articles(articles):
     """
     logger.info('Checking fetched article snapshots for new and updated articles...')
     time.sleep(2)
-    con = sqlite3.connect('test_db/news_updates_monitor.sqlite3')
+    con = sqlite3.connect(DATABASE)
     con.execute('PRAGMA foreign_keys = ON')
     con.row_factory = dict_factory
 
@@ -423,6 +554,8 @@ def check_articles(articles):
         if row is None:
             # New article previously unseen
             article_id = article.store(con)
+            record_new_version(con, article_id, article.url, article.fetched_timestamp)
+            record_fingerprint(con, article.url, article_id, article.fingerprint)
             bind = (False, article_id, article.fetched_timestamp)
             con.execute("""
                 UPDATE fetch
@@ -431,6 +564,7 @@ def check_articles(articles):
                 """, bind)
             con.commit()
             c_new += 1
+            metrics.ARTICLES_CHECKED.inc(result='new')
         else:
             stored_article = table_row_to_article(row)
             logger.debug(
@@ -441,6 +575,10 @@ def check_articles(articles):
 
             if article.is_copy(stored_article):
                 # No changes so just log the fetch data
+                record_unchanged(con, row['article_id'], article.fetched_timestamp)
+                # The page might have different bytes but the same parsed content, so next time
+                # it's the new bytes that mean nothing has changed
+                record_fingerprint(con, article.url, row['article_id'], article.fingerprint)
                 bind = (False, article.fetched_timestamp)
                 con.execute("""
                     UPDATE fetch
@@ -448,9 +586,19 @@ def check_articles(articles):
                     WHERE fetched_timestamp = ?
                     """, bind)
                 con.commit()
+                metrics.ARTICLES_CHECKED.inc(result='unchanged')
             else:
                 # This is a new version of an existing article, so should be stored
                 article_id = article.store(con)
+                # Record what changed while both versions are to hand (committed below)
+                # The snapshot counter has already been incremented, so it is the version number
+                version, _ = get_url_counts(con, article.url)
+                record_change(
+                    con, article_id, row, article.parsed, article.url, version,
+                    article.fetched_timestamp
+                    )
+                record_new_version(con, article_id, article.url, article.fetched_timestamp)
+                record_fingerprint(con, article.url, article_id, article.fingerprint)
                 bind = (True, article_id, article.fetched_timestamp)
                 con.execute("""
                     UPDATE fetch
@@ -459,6 +607,7 @@ def check_articles(articles):
                     """, bind)
                 con.commit()
                 c_updated +=1
+                metrics.ARTICLES_CHECKED.inc(result='changed')
     con.close()
     c_total = c_new + c_updated
     logger.info(
@@ -468,23 +617,109 @@ def check_articles(articles):
 
 def is_online():
     """ Boolean function that checks whether the internet is connected 
-        Checks against https://www.bbc.co.uk
+        Checks against BASE_URL (https://www.bbc.co.uk by default)
         This covers both if they are down or if my connection is down, as either way
         we will get an exception raised here
     """
     try:
-        requests.get('https://www.bbc.co.uk', timeout=10)
+        requests.get(BASE_URL, timeout=10)
         return True
     except requests.exceptions.ConnectionError as e:
         logger.debug(
-            'No response from https://www.bbc.co.uk - ' +
+            'No response from %s - ' +
             'the internet connection is likely down\n' +
             'Exception __str__:\n%s\n' +
             'Exception Type:\n%s\n',
-            e, type(e)
+            BASE_URL, e, type(e)
             )
         return False
 
+def load_config(path='config.ini'):
+    """ Reads the optional [monitor] and [metrics] sections of the config file:
+        [monitor]
+            base_url = string; the site to monitor (default https://www.bbc.co.uk)
+            fetch_delay = float; seconds between article requests (default 5)
+        [metrics]
+            enabled = boolean; serve the Prometheus metrics over HTTP (default False)
+            host = string; address to serve them on (default 127.0.0.1, i.e. this machine only)
+            port = integer; port to serve them on (default 9464)
+        [profiling]
+            enabled = boolean; profile every run, saving the slow ones (default False)
+            threshold = float; seconds a run has to take for its profile to be saved (default 900)
+            directory = string; where to save them (default log/profiles)
+            top = integer; functions listed in each profile's summary (default 40)
+            keep = integer; profiles kept, oldest deleted first (default 20)
+        [discovery]
+            sources = comma separated; 'homepage' and/or 'feeds' (default homepage)
+            feeds = one per line; feed URLs, or paths on base_url (default none)
+        [homepage]
+            prominent_positions = integer; keep articles this near the top of the homepage on
+                                  prominent_level at most (default 0, i.e. off)
+            prominent_level = integer; 1 to 5 (default 2)
+        [soak]
+            enabled = boolean; trace memory use and warn if it keeps growing (default False)
+            threshold_mb = float; growth since the first run that gets a warning (default 50)
+            every = integer; runs between memory checks (default 1)
+            top = integer; allocation sites listed in each warning (default 10)
+            frames = integer; traceback frames recorded per allocation (default 10)
+        Anything missing keeps its default
+    """
+    # pylint: disable-next=global-statement
+    global BASE_URL, FETCH_DELAY, DISCOVERY_SOURCES, FEEDS, METRICS_ADDRESS, PROFILER, \
+        MEMORY_WATCH, PROMINENT_POSITIONS, PROMINENT_LEVEL
+    config = configparser.ConfigParser()
+    config.read(path)
+    if config.has_section('monitor'):
+        BASE_URL = config.get('monitor', 'base_url', fallback=BASE_URL).rstrip('/')
+        FETCH_DELAY = config.getfloat('monitor', 'fetch_delay', fallback=FETCH_DELAY)
+    if config.has_section('discovery'):
+        sources = config.get('discovery', 'sources', fallback=','.join(DISCOVERY_SOURCES))
+        DISCOVERY_SOURCES = tuple(
+            source.strip() for source in sources.split(',') if source.strip()
+            )
+        unknown = set(DISCOVERY_SOURCES) - {'homepage', 'feeds'}
+        if unknown or not DISCOVERY_SOURCES:
+            raise ValueError(
+                f'[discovery] sources must be homepage and/or feeds, not {sources!r}'
+                )
+        FEEDS = tuple(config.get('discovery', 'feeds', fallback='').split())
+        if 'feeds' in DISCOVERY_SOURCES and not FEEDS:
+            raise ValueError('[discovery] sources includes feeds but no feeds are listed')
+    if config.has_section('homepage'):
+        PROMINENT_POSITIONS = config.getint(
+            'homepage', 'prominent_positions', fallback=PROMINENT_POSITIONS
+            )
+        PROMINENT_LEVEL = config.getint('homepage', 'prominent_level', fallback=PROMINENT_LEVEL)
+        if PROMINENT_POSITIONS < 0:
+            raise ValueError('[homepage] prominent_positions must be 0 (off) or more')
+        if not 1 <= PROMINENT_LEVEL <= 5:
+            raise ValueError(
+                f'[homepage] prominent_level must be 1 to 5, not {PROMINENT_LEVEL}'
+                )
+    if config.getboolean('metrics', 'enabled', fallback=False):
+        METRICS_ADDRESS = (
+            config.get('metrics', 'host', fallback='127.0.0.1'),
+            config.getint('metrics', 'port', fallback=9464)
+            )
+    if config.getboolean('profiling', 'enabled', fallback=False):
+        PROFILER = Profiler(
+            config.get('profiling', 'directory', fallback='log/profiles'),
+            config.getfloat('profiling', 'threshold', fallback=900),
+            top=config.getint('profiling', 'top', fallback=40),
+            keep=config.getint('profiling', 'keep', fallback=20)
+            )
+    if config.getboolean('soak', 'enabled', fallback=False):
+        MEMORY_WATCH = MemoryWatch(
+            threshold_mb=config.getfloat('soak', 'threshold_mb', fallback=50),
+            every=config.getint('soak', 'every', fallback=1),
+            top=config.getint('soak', 'top', fallback=10),
+            frames=config.getint('soak', 'frames', fallback=10)
+            )
+    logger.info(
+        'Monitoring %s with %s seconds between requests, finding new articles from: %s',
+        BASE_URL, FETCH_DELAY, ', '.join(DISCOVERY_SOURCES)
+        )
+
 async def telegram_bot_send_msg(msg):
     """ Sends a message using the specified Telegram bot Token and Chat ID from the config.ini file
         Can be disabled using enabled = False in the config file
@@ -545,13 +780,31 @@ if __name__ == '__main__':
     # Disabling Pylint - this is not a module level constant
     # pylint: disable-next=invalid-name
     interval = 60*15
+    load_config()
+    if METRICS_ADDRESS is not None:
+        metrics.start_server(*METRICS_ADDRESS)
+        logger.info('Serving metrics at http://%s:%s/metrics', *METRICS_ADDRESS)
+    if MEMORY_WATCH is not None:
+        MEMORY_WATCH.start()
+    # Bring an existing database up to date with any new tables/triggers before starting
+    con = sqlite3.connect(DATABASE)
+    con.execute('PRAGMA foreign_keys = ON')
+    apply_schema(con)
+    ensure_counters(con)
+    con.close()
     try:
         schedule.every().saturday.at("10:00").do(weekly_report)
         while True:
             logger.info('Waking up from sleep...')
             time.sleep(3)
             if is_online():
-                main_loop()
+                if PROFILER is not None:
+                    with PROFILER.profile('main_loop'):
+                        main_loop()
+                else:
+                    main_loop()
+                if MEMORY_WATCH is not None:
+                    MEMORY_WATCH.check()
                 time.sleep(3)
             else:
                 logger.error('No internet connection detected, skipping this loop')
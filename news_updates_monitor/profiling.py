@@ -0,0 +1,206 @@
+"""
+
+    ***Profiling***
+    Opt-in cProfile hooks that keep a record of whatever was slow
+
+    While enabled, every monitor run (or web request) is profiled, but the profile is only saved
+    if it took longer than the threshold - so when a run overruns or a /compare page crawls, the
+    reason is already on disk. Each slow one gets two files in the profile folder:
+        <timestamp>-<name>-<milliseconds>ms.prof    the full profile, for pstats or snakeviz,
+                                                    e.g. python -m pstats file.prof
+        <timestamp>-<name>-<milliseconds>ms.txt     the top functions by cumulative and own time
+    Only the newest profiles are kept (see Profiler.keep) so they can't fill the disk.
+
+    Profiling slows everything down a fair bit, so it's off unless switched on in the monitor's
+    config.ini ([profiling] section) or the web interface's settings (PROFILE_REQUESTS).
+
+"""
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+
+logger = logging.getLogger(__name__)
+
+
+class Profiler():
+    """ Profiles blocks of code and saves the profiles of the slow ones """
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, directory, threshold, top=30, keep=50):
+        """
+        directory = string; where to save the profiles (created if needed)
+        threshold = float; seconds a block has to take for its profile to be saved
+        top = integer; functions listed in each .txt summary
+        keep = integer; profiles kept in the directory, oldest deleted first
+        """
+        self.directory = directory
+        self.threshold = threshold
+        self.top = top
+        self.keep = keep
+        # Only one block can be profiled at a time: since Python 3.12 cProfile hooks every thread
+        # in the process, and a second profiler can't start while one is running
+        self.lock = threading.Lock()
+
+    def start(self):
+        """ Starts profiling
+            Returns (cProfile.Profile, start time) to pass to stop(), or None if another block is
+            already being profiled (or something else, e.g. a debugger, is profiling)
+        """
+        if not self.lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            self.lock.release()
+            return None
+        return profiler, time.perf_counter()
+
+    def stop(self, session, name, details=''):
+        """ Stops profiling, saving the profile if it took longer than the threshold
+            session = the tuple returned by start() (does nothing if it's None)
+            name = string; goes in the file names, e.g. 'main_loop' or 'compare'
+            details = string; extra information for the top of the .txt summary, e.g. the URL
+        """
+        if session is None:
+            return
+        profiler, start = session
+        try:
+            profiler.disable()
+            elapsed = time.perf_counter() - start
+            if elapsed >= self.threshold:
+                self.save(profiler, name, details, elapsed)
+        finally:
+            self.lock.release()
+
+    @contextmanager
+    def profile(self, name, details=''):
+        """ Context manager that profiles its block, saving the profile if it's slow (see stop())
+            If another block is already being profiled, this one runs without profiling.
+        """
+        session = self.start()
+        try:
+            yield
+        finally:
+            self.stop(session, name, details)
+
+    def save(self, profiler, name, details, elapsed):
+        """ Writes the .prof and .txt files, then removes the oldest profiles over the limit
+            Failures are logged rather than raised, as profiling shouldn't break what it's
+            profiling
+        """
+        now = datetime.now(timezone.utc)
+        slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_')[:60] or 'profile'
+        base = os.path.join(
+            self.directory, f'{now:%Y%m%d-%H%M%S-%f}-{slug}-{elapsed * 1000:.0f}ms'
+            )
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            profiler.dump_stats(base + '.prof')
+            with open(base + '.txt', 'w', encoding='utf-8') as f:
+                f.write(f'{name} took {elapsed:.3f}s at {now.isoformat()}\n')
+                if details:
+                    f.write(details + '\n')
+                f.write('\n' + summarise(profiler, self.top))
+            self.rotate()
+        except OSError as e:
+            logger.error('Could not save the profile for %s: %s', name, e)
+            return
+        logger.warning(
+            'Slow %s (%.1fs over the %.1fs threshold), profile saved to %s.prof',
+            name, elapsed, self.threshold, base
+            )
+
+    def rotate(self):
+        """ Deletes the oldest profiles (and their summaries) beyond the newest self.keep """
+        # The file names start with the time, so they sort oldest first
+        profiles = sorted(f for f in os.listdir(self.directory) if f.endswith('.prof'))
+        for file_name in profiles[:max(len(profiles) - self.keep, 0)]:
+            for path in (file_name, file_name[:-len('.prof')] + '.txt'):
+                try:
+                    os.remove(os.path.join(self.directory, path))
+                except FileNotFoundError:
+                    # Another process sharing the folder got there first
+                    pass
+
+
+def summarise(profiler, top):
+    """ Returns the top functions by cumulative time and by own time as text """
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.strip_dirs()
+    stream.write('*** By cumulative time ***\n')
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+    stream.write('*** By own time ***\n')
+    stats.sort_stats(pstats.SortKey.TIME).print_stats(top)
+    return stream.getvalue()
+
+
+class ProfiledApp():
+    """ WSGI middleware that profiles each request, named after its path. Profiling carries on
+        until the response has been sent, so streamed pages (e.g. /as_of and the API lists) are
+        covered too - except for server-sent event streams like /events, which never finish.
+    """
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, wsgi_app, profiler):
+        self.wsgi_app = wsgi_app
+        self.profiler = profiler
+
+    def __call__(self, environ, start_response):
+        session = self.profiler.start()
+        if session is None:
+            return self.wsgi_app(environ, start_response)
+        path = environ.get('PATH_INFO', '')
+        name = path.strip('/') or 'index'
+        details = environ.get('REQUEST_METHOD', 'GET') + ' ' + path
+        if environ.get('QUERY_STRING'):
+            details += '?' + environ['QUERY_STRING']
+        event_stream = []
+
+        def check_start_response(status, headers, exc_info=None):
+            for header, value in headers:
+                if header.lower() == 'content-type' and value.startswith('text/event-stream'):
+                    event_stream.append(True)
+            return start_response(status, headers, exc_info)
+
+        try:
+            body = self.wsgi_app(environ, check_start_response)
+        except BaseException:
+            self.profiler.stop(session, name, details)
+            raise
+        if event_stream:
+            self.profiler.stop(session, name, details)
+            return body
+        return ProfiledBody(body, lambda: self.profiler.stop(session, name, details))
+
+
+class ProfiledBody():
+    """ Wraps a WSGI response body, calling on_close once it has been sent (when the server
+        closes it, as WSGI servers must)
+    """
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, body, on_close):
+        self.body = body
+        self.on_close = on_close
+
+    def __iter__(self):
+        return iter(self.body)
+
+    def close(self):
+        """ Closes the wrapped body, then calls on_close """
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            self.on_close()
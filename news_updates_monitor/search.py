@@ -0,0 +1,315 @@
+"""
+
+    ***Search***
+    Full-text search over article headlines and bodies using SQLite FTS5 (see article_fts in
+    db_schema.sql)
+
+    Every stored version of every article is indexed, with the HTML stripped out of the body, and
+    the FTS rowid is the article_id. Article.store() calls index_article() for each new version
+    so the index is kept up to date as the monitor runs.
+
+    The latest version of each URL is also in a second, much smaller index (article_fts_current),
+    which index_article() moves it out of as soon as a newer version is stored. Searching current
+    versions only ever touches that one, rather than every version of every article.
+
+    Ranking has to score every match before it can sort them, so a common word would mean scoring
+    most of the index. Instead only the newest SEARCH_CANDIDATES matching versions are ranked: the
+    rowid is the article_id, so FTS5 can walk its list of matches newest first and stop once it
+    has that many, only scoring the ones it returns. Searches with fewer matches than that are
+    ranked in full.
+
+    Can also be run as a script to index versions stored before the index existed (or before the
+    index of current versions existed):
+        python search.py path/to/news_updates_monitor.sqlite3
+
+"""
+
+import argparse
+import logging
+import re
+import sqlite3
+from html import escape, unescape
+
+from database import apply_schema
+
+
+logger = logging.getLogger(__name__)
+
+TAG_RE = re.compile(r'<[^>]*>')
+# Quoted phrases, or single words (optionally ending in * for a prefix search)
+QUERY_TERM_RE = re.compile(r'"([^"]*)"|([^\s"]+)')
+WORD_RE = re.compile(r'\w')
+
+# Which versions a search looks at:
+#   current = only the latest version of each URL
+#   all = any version of each URL (the latest version that matches is shown)
+#   superseded = only older versions, i.e. text that has since been edited out of the article
+SEARCH_MODES = ('current', 'all', 'superseded')
+
+# Headline matches count for more than body matches when ranking (bm25 column weights)
+HEADLINE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+# FTS5 ranks matches with this instead of its default (unweighted) bm25
+RANK = f'bm25({HEADLINE_WEIGHT}, {BODY_WEIGHT})'
+
+# Most matching versions ranked by a search (the newest ones). Bounds the work for common words,
+# which match most versions - older matches than these aren't found.
+SEARCH_CANDIDATES = 2000
+
+# Control characters mark the matches in snippets, so the snippet text can be HTML escaped before
+# the markers are swapped for <mark> tags
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+
+def strip_html(html):
+    """ Returns the plain text of a stored article body (or any other HTML fragment)
+        Each paragraph is already on its own line, so removing the tags is enough
+    """
+    if html is None:
+        return ''
+    return unescape(TAG_RE.sub('', html))
+
+def index_article(con, article_id, url, headline, body):
+    """ Adds one article version to the search index, and makes it the URL's version in the index
+        of current versions. Does not commit - the caller commits alongside the article row.
+        con = sqlite3.Connection object
+        article_id = integer
+        url = string
+        headline, body = string or None; the parsed headline and body (HTML) of the version
+    """
+    text = (article_id, headline or '', strip_html(body))
+    con.execute('INSERT OR REPLACE INTO article_fts(rowid, headline, body) VALUES (?, ?, ?)', text)
+    previous, = con.execute(
+        'SELECT MAX(article_id) FROM article WHERE url = ? AND article_id < ?', (url, article_id)
+        ).fetchone()
+    if previous is not None:
+        con.execute('DELETE FROM article_fts_current WHERE rowid = ?', (previous,))
+    con.execute(
+        'INSERT OR REPLACE INTO article_fts_current(rowid, headline, body) VALUES (?, ?, ?)', text
+        )
+
+def backfill(con, batch_size=1000):
+    """ Indexes every stored version that isn't in the search index yet, then adds the latest
+        version of each URL to the index of current versions if it isn't in there yet, committing
+        every batch_size versions, so an interrupted backfill just carries on where it stopped
+        Returns the number of versions indexed
+    """
+    counter = 0
+    last_id = 0
+    while True:
+        rows = con.execute(
+            """
+            SELECT article_id, headline, body FROM article
+            WHERE article_id > ?
+              AND NOT EXISTS (SELECT 1 FROM article_fts WHERE rowid = article.article_id)
+            ORDER BY article_id
+            LIMIT ?
+            """, (last_id, batch_size)
+            ).fetchall()
+        if not rows:
+            break
+        con.executemany(
+            'INSERT INTO article_fts(rowid, headline, body) VALUES (?, ?, ?)',
+            [(article_id, headline or '', strip_html(body)) for article_id, headline, body in rows]
+            )
+        con.commit()
+        counter += len(rows)
+        last_id = rows[-1][0]
+        logger.info('Indexed %s versions so far...', counter)
+    return counter + backfill_current(con, batch_size)
+
+def backfill_current(con, batch_size=1000):
+    """ Adds the latest version of every URL to the index of current versions, if it isn't
+        there already (see backfill())
+        Returns the number of versions added
+    """
+    counter = 0
+    last_url = ''
+    while True:
+        latest = con.execute(
+            """
+            SELECT url, MAX(article_id) FROM article
+            WHERE url > ?
+            GROUP BY url
+            ORDER BY url
+            LIMIT ?
+            """, (last_url, batch_size)
+            ).fetchall()
+        if not latest:
+            break
+        rows = con.execute(
+            f"""
+            SELECT article_fts.rowid, article_fts.headline, article_fts.body FROM article_fts
+            WHERE article_fts.rowid IN ({', '.join('?' * len(latest))})
+              AND NOT EXISTS (
+                  SELECT 1 FROM article_fts_current WHERE rowid = article_fts.rowid
+                  )
+            """, [article_id for _, article_id in latest]
+            ).fetchall()
+        con.executemany(
+            'INSERT INTO article_fts_current(rowid, headline, body) VALUES (?, ?, ?)', rows
+            )
+        con.commit()
+        counter += len(rows)
+        last_url = latest[-1][0]
+        if rows:
+            logger.info('Added %s current versions so far...', counter)
+    return counter
+
+def build_match_query(text):
+    """ Turns what the user typed into an FTS5 query, so stray punctuation or operators can
+        never cause a syntax error. Every word (or "quoted phrase") must appear, and a word ending
+        in * matches any word starting with it.
+        Returns the query string, or None if there's nothing to search for
+    """
+    terms = []
+    for phrase, word in QUERY_TERM_RE.findall(text or ''):
+        prefix = False
+        if word:
+            prefix = word.endswith('*')
+            phrase = word.rstrip('*')
+        # Punctuation on its own isn't indexed, so it can't be searched for
+        if not WORD_RE.search(phrase):
+            continue
+        term = '"' + phrase.replace('"', '""') + '"'
+        if prefix:
+            term += '*'
+        terms.append(term)
+    if not terms:
+        return None
+    return ' '.join(terms)
+
+def search(con, text, mode='current', limit=20, offset=0):
+    """ Searches the index and returns one result per URL, best match first
+        con = sqlite3.Connection object
+        text = string; the search as typed by the user (see build_match_query())
+        mode = string; one of SEARCH_MODES
+        limit, offset = integer; which slice of the ranked results to return
+        Returns a list of dicts with the keys:
+            url, article_id (the version shown), fetched_timestamp, versions (how many versions
+            of the URL are among the matches ranked), headline and snippet
+            (HTML strings with matches in <mark> tags)
+    """
+    query = build_match_query(text)
+    if query is None:
+        return []
+    if mode not in SEARCH_MODES:
+        raise ValueError(f'Unknown search mode: {mode}')
+
+    # The rank is the bm25() score, which is negative - lower is better. Ordering by rowid lets
+    # FTS5 stop after the newest SEARCH_CANDIDATES matches, and it only scores the rows it returns.
+    if mode == 'current':
+        fts_table = 'article_fts_current'
+        sql = f"""
+            SELECT article.url, article.article_id, 1 AS versions
+            FROM (
+                SELECT rowid, rank FROM article_fts_current
+                WHERE article_fts_current MATCH ?1 AND rank MATCH '{RANK}'
+                ORDER BY rowid DESC
+                LIMIT ?2
+                ) AS matches
+            JOIN article ON (article.article_id = matches.rowid)
+            ORDER BY matches.rank
+            LIMIT ?3 OFFSET ?4
+            """
+    else:
+        fts_table = 'article_fts'
+        # Superseded text is in an older version but not in the URL's current version, so the
+        # versions matching in the current index are left out of the candidates, and so are URLs
+        # whose current version matches (the current version may not be a candidate itself). The
+        # + stops SQLite handing the NOT IN list to FTS5, which would run the search for each ID.
+        exclude = ''
+        having = ''
+        if mode == 'superseded':
+            exclude = 'AND +rowid NOT IN current_matches'
+            having = """
+                HAVING (
+                    SELECT MAX(article_id) FROM article AS latest WHERE latest.url = candidates.url
+                    ) NOT IN current_matches
+                """
+        sql = f"""
+            WITH current_matches AS MATERIALIZED (
+                SELECT rowid FROM article_fts_current WHERE article_fts_current MATCH ?1
+                ),
+            candidates AS MATERIALIZED (
+                SELECT article.url, article.article_id, matches.rank
+                FROM (
+                    SELECT rowid, rank FROM article_fts
+                    WHERE article_fts MATCH ?1 AND rank MATCH '{RANK}' {exclude}
+                    ORDER BY rowid DESC
+                    LIMIT ?2
+                    ) AS matches
+                JOIN article ON (article.article_id = matches.rowid)
+                )
+            SELECT url, MAX(article_id) AS article_id, COUNT(*) AS versions
+            FROM candidates
+            GROUP BY url
+            {having}
+            ORDER BY MIN(rank)
+            LIMIT ?3 OFFSET ?4
+            """
+    rows = con.execute(sql, (query, SEARCH_CANDIDATES, limit, offset)).fetchall()
+    if not rows:
+        return []
+
+    # Snippets are only worked out for the page of results actually being shown. FTS5 runs the
+    # search again for each ID in an IN list, which is slow for prefix searches (they merge the
+    # matches of every word with the prefix), so for those it gets the range of IDs instead and
+    # SQLite picks out the ones in the list (the + stops it handing the list to FTS5).
+    article_ids = [row[1] for row in rows]
+    placeholders = ', '.join('?' * len(article_ids))
+    if '"*' in query:
+        id_filter = f'rowid BETWEEN {min(article_ids)} AND {max(article_ids)} AND +rowid'
+    else:
+        id_filter = 'rowid'
+    snippets = {
+        article_id: (headline, snippet) for article_id, headline, snippet in con.execute(
+            f"""
+            SELECT rowid, highlight({fts_table}, 0, ?1, ?2),
+                   snippet({fts_table}, 1, ?1, ?2, '...', 32)
+            FROM {fts_table}
+            WHERE {fts_table} MATCH ?3 AND {id_filter} IN ({placeholders})
+            """, (MARK_START, MARK_END, query, *article_ids)
+            )
+        }
+    timestamps = dict(con.execute(
+        f'SELECT article_id, fetched_timestamp FROM article WHERE article_id IN ({placeholders})',
+        article_ids
+        ))
+
+    results = []
+    for url, article_id, versions in rows:
+        headline, snippet = snippets.get(article_id, ('', ''))
+        results.append({
+            'url': url,
+            'article_id': article_id,
+            'fetched_timestamp': timestamps.get(article_id),
+            'versions': versions,
+            'headline': mark_matches(headline),
+            'snippet': mark_matches(snippet),
+            })
+    return results
+
+def mark_matches(text):
+    """ HTML escapes a highlighted FTS5 snippet and swaps the match markers for <mark> tags """
+    return escape(text or '').replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+if __name__ == '__main__':
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s: %(message)s')
+
+    parser = argparse.ArgumentParser(
+        description='Add article versions stored before the search index existed to the index'
+        )
+    parser.add_argument('database', help='path to the SQLite database file')
+    parser.add_argument('--batch-size', type=int, default=1000, help='versions per transaction')
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.database)
+    connection.execute('PRAGMA foreign_keys = ON')
+    apply_schema(connection)
+    total = backfill(connection, args.batch_size)
+    logger.info('Backfill complete: indexed %s versions', total)
+    connection.close()
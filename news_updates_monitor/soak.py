@@ -0,0 +1,177 @@
+"""
+
+    ***Soak mode***
+    Watches the monitor's memory use over a long run, to catch leaks before the Pi starts swapping
+
+    Between runs of the main loop it reads the process's resident memory (RSS) and takes a
+    tracemalloc snapshot, then compares them with a baseline taken after the first run (when the
+    caches, imports and connection pools have all warmed up). Each check logs the memory in use
+    and the growth since the baseline. If either has grown by more than the threshold, it logs a
+    warning listing the lines of code that have allocated the most extra memory - e.g. soups or
+    responses that are being held on to - and then warns again only if it grows by another
+    threshold's worth.
+
+    tracemalloc makes every allocation slower and records a traceback for each one, so soak mode
+    is off unless switched on in the [soak] section of the monitor's config.ini (or e2e_monitor.py
+    --soak in the benchmarks folder, which runs lots of cycles against the fake news server).
+
+"""
+
+import linecache
+import logging
+import os
+import tracemalloc
+
+# pylint: disable-next=import-error
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+RSS_BYTES = metrics.Gauge(
+    'news_monitor_rss_bytes', 'Resident memory of the monitor process at the latest soak check.'
+    )
+TRACED_BYTES = metrics.Gauge(
+    'news_monitor_traced_bytes',
+    'Memory allocated by Python and still in use at the latest soak check (tracemalloc).'
+    )
+
+# Allocations made by tracemalloc itself (and the source lines it caches for the warnings) and by
+# imports aren't what we're looking for
+IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, linecache.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+    )
+
+
+def current_rss():
+    """ Returns the process's resident set size in bytes, or None where /proc isn't available
+        (resource.getrusage() only gives the peak, which never goes down)
+    """
+    try:
+        with open('/proc/self/statm', encoding='ascii') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+def format_mb(value):
+    """ Returns bytes as megabytes for the log, or 'unknown' """
+    return 'unknown' if value is None else f'{value / 2**20:.1f} MB'
+
+
+class MemoryWatch():
+    """ Takes periodic memory readings and warns when they keep growing """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, threshold_mb=50, every=1, top=10, frames=10):
+        """
+        threshold_mb = float; growth in RSS or traced memory since the baseline that gets a
+                       warning (and how much more it has to grow before the next warning)
+        every = integer; check after every this many runs
+        top = integer; allocation sites listed in each warning
+        frames = integer; frames of traceback tracemalloc keeps for each allocation - more shows
+                 where leaks come from, but uses more memory
+        """
+        self.threshold = threshold_mb * 2**20
+        self.every = every
+        self.top = top
+        self.frames = frames
+        self.runs = 0
+        self.baseline = None
+        self.baseline_rss = None
+        self.warn_at = None
+        # One dict per check: run, rss, traced, rss_growth, traced_growth (bytes)
+        self.history = []
+
+    def start(self):
+        """ Starts tracing allocations - call before the first run """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        logger.info(
+            'Soak mode: checking memory every %s runs, warning after %s of growth',
+            self.every, format_mb(self.threshold)
+            )
+
+    def stop(self):
+        """ Stops tracing and frees the snapshots """
+        tracemalloc.stop()
+        self.baseline = None
+
+    def check(self):
+        """ Counts a finished run, and every self.every runs takes readings, logs them and warns
+            if memory has grown by more than the threshold since the baseline
+            Returns the reading's dict, or None if this run wasn't checked
+        """
+        self.runs += 1
+        if self.baseline is not None and self.runs % self.every:
+            return None
+        snapshot = tracemalloc.take_snapshot().filter_traces(IGNORED)
+        rss = current_rss()
+        traced = sum(stat.size for stat in snapshot.statistics('filename'))
+        RSS_BYTES.set(rss or 0)
+        TRACED_BYTES.set(traced)
+        if self.baseline is None:
+            self.baseline = snapshot
+            self.baseline_rss = rss
+            self.warn_at = self.threshold
+            logger.info(
+                'Soak mode baseline after run %s: RSS %s, traced %s',
+                self.runs, format_mb(rss), format_mb(traced)
+                )
+            reading = {'run': self.runs, 'rss': rss, 'traced': traced,
+                       'rss_growth': 0, 'traced_growth': 0}
+            self.history.append(reading)
+            return reading
+
+        growth = snapshot.compare_to(self.baseline, 'traceback')
+        traced_growth = sum(stat.size_diff for stat in growth)
+        rss_growth = rss - self.baseline_rss if rss is not None and self.baseline_rss else 0
+        reading = {'run': self.runs, 'rss': rss, 'traced': traced,
+                   'rss_growth': rss_growth, 'traced_growth': traced_growth}
+        self.history.append(reading)
+        logger.info(
+            'Soak mode after run %s: RSS %s (%+.1f MB since the baseline), traced %s (%+.1f MB)',
+            self.runs, format_mb(rss), rss_growth / 2**20, format_mb(traced),
+            traced_growth / 2**20
+            )
+
+        worst = max(rss_growth, traced_growth)
+        if worst > self.warn_at:
+            logger.warning(
+                'Memory has grown by %s since the baseline after run %s. ' +
+                'Biggest growth since then:\n%s',
+                format_mb(worst), self.history[0]['run'], self.format_growth(growth)
+                )
+            # Don't warn again every run, only if it carries on growing
+            while self.warn_at < worst:
+                self.warn_at += self.threshold
+        return reading
+
+    def format_growth(self, growth):
+        """ Returns the top allocation sites that have grown, with the full traceback for the
+            biggest few
+            growth = list of tracemalloc.StatisticDiff, biggest first
+        """
+        lines = []
+        grown = [stat for stat in growth if stat.size_diff > 0][:self.top]
+        for i, stat in enumerate(grown):
+            # Tracebacks go from the oldest frame to the most recent, i.e. the allocating line
+            frame = stat.traceback[-1]
+            lines.append(
+                f'  {i + 1}. {short_path(frame.filename)}:{frame.lineno}: ' +
+                f'+{stat.size_diff / 1024:.0f} KB ({stat.count_diff:+} blocks)'
+                )
+            if i < 3:
+                # The rest of the traceback, i.e. what called the line above
+                callers = stat.traceback.format(most_recent_first=True)[2:]
+                lines.extend('       ' + line for line in callers)
+        return '\n'.join(lines) or '  (nothing traced has grown - the growth is outside Python)'
+
+
+def short_path(path):
+    """ Returns the last two parts of a file path, enough to tell which module it is """
+    return os.path.join(*os.path.normpath(path).split(os.sep)[-2:])
@@ -0,0 +1,174 @@
+"""
+
+    ***Validity intervals***
+    Reads and maintains the article_validity table (see db_schema.sql), which records when each
+    stored version of an article was the live one
+
+    A version is valid from the fetch that first found it (valid_from) until the fetch that found
+    the next version (valid_to, NULL while it's still the latest). last_seen is the most recent
+    fetch that saw it unchanged - the actual edit happened somewhere between last_seen and
+    valid_to. The monitor keeps the table up to date in check_articles(), so "what did this
+    article say at time T" is a single index lookup rather than a search through the fetch table.
+
+    Can also be run as a script to build the table from the article and fetch tables for
+    versions stored before it existed:
+        python validity.py path/to/news_updates_monitor.sqlite3
+
+"""
+
+import argparse
+import logging
+import sqlite3
+from datetime import datetime, timezone
+
+from database import apply_schema
+
+
+logger = logging.getLogger(__name__)
+
+VALIDITY_FIELDS = ('article_id', 'url', 'version', 'valid_from', 'valid_to', 'last_seen')
+
+
+def parse_timestamp(text):
+    """ Converts an ISO 8601 date/time string (e.g. from the query string) into the same form as
+        the stored timestamps, so they can be compared as strings. Times without a timezone are
+        taken to be UTC.
+        Returns the string, or None if text isn't a valid date/time
+    """
+    try:
+        moment = datetime.fromisoformat(text)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).isoformat()
+
+def record_new_version(con, article_id, url, fetched_timestamp):
+    """ Closes the validity interval of the URL's previous version (if there is one) and opens
+        one for the new version. Does not commit - the caller commits alongside the fetch.
+        con = sqlite3.Connection object
+        article_id = integer; the newly stored version
+        url = string
+        fetched_timestamp = ISO8601 datetime as string; when the new version was fetched
+    """
+    con.execute(
+        """
+        UPDATE article_validity
+        SET valid_to = ?
+        WHERE url = ? AND valid_to IS NULL AND article_id != ?
+        """, (fetched_timestamp, url, article_id)
+        )
+    con.execute(
+        """
+        INSERT OR REPLACE INTO article_validity(article_id, url, valid_from, valid_to, last_seen)
+        VALUES (?, ?, ?, NULL, ?)
+        """, (article_id, url, fetched_timestamp, fetched_timestamp)
+        )
+
+def record_unchanged(con, article_id, fetched_timestamp):
+    """ Records that a fetch found the given version unchanged. Does not commit. """
+    con.execute(
+        'UPDATE article_validity SET last_seen = ? WHERE article_id = ?',
+        (fetched_timestamp, article_id)
+        )
+
+def version_as_of(con, url, at):
+    """ Finds the version of an article that was live at a given time
+        con = sqlite3.Connection object
+        url = string
+        at = string; timestamp in the stored form (see parse_timestamp())
+        Returns a dict with the keys in VALIDITY_FIELDS (version being the version number), or
+        None if the article hadn't been found yet at that time
+    """
+    cursor = con.cursor()
+    cursor.row_factory = None
+    row = cursor.execute(
+        """
+        SELECT article_id, url,
+               (SELECT COUNT(*) FROM article
+                WHERE article.url = article_validity.url
+                  AND article.article_id <= article_validity.article_id) AS version,
+               valid_from, valid_to, last_seen
+        FROM article_validity
+        WHERE url = ? AND valid_from <= ?
+        ORDER BY valid_from DESC
+        LIMIT 1
+        """, (url, at)
+        ).fetchone()
+    if row is None:
+        return None
+    return dict(zip(VALIDITY_FIELDS, row))
+
+def articles_as_of(con, at):
+    """ Finds the live version of every article at a given time, one row per URL in URL order
+        The versions come straight from the article_validity_url index, and the cursor is
+        returned so callers can stream the rows rather than loading them all
+        Returns a cursor of (url, article_id, valid_from, valid_to, last_seen, headline) tuples
+    """
+    cursor = con.cursor()
+    cursor.row_factory = None
+    # SQLite fills in the other columns from the row with the MAX(valid_from)
+    return cursor.execute(
+        """
+        SELECT live.url, live.article_id, live.valid_from, live.valid_to, live.last_seen,
+               article.headline
+        FROM (
+            SELECT url, article_id, MAX(valid_from) AS valid_from, valid_to, last_seen
+            FROM article_validity
+            WHERE valid_from <= ?
+            GROUP BY url
+            ) AS live
+        JOIN article ON (article.article_id = live.article_id)
+        ORDER BY live.url
+        """, (at,)
+        )
+
+def backfill(con):
+    """ Rebuilds the article_validity table from the article and fetch tables in one transaction
+        valid_to comes from the next version's fetched_timestamp, and last_seen from the URL's
+        latest successful fetch before then
+        Returns the number of versions recorded
+    """
+    with con:
+        con.execute('DELETE FROM article_validity')
+        con.execute(
+            """
+            INSERT INTO article_validity(article_id, url, valid_from, valid_to, last_seen)
+            SELECT article_id, url, fetched_timestamp,
+                   LEAD(fetched_timestamp) OVER (PARTITION BY url ORDER BY article_id),
+                   fetched_timestamp
+            FROM article
+            """
+            )
+        con.execute(
+            """
+            UPDATE article_validity
+            SET last_seen = COALESCE((
+                SELECT MAX(fetch.fetched_timestamp) FROM fetch
+                WHERE fetch.url = article_validity.url
+                  AND fetch.status = '200'
+                  AND fetch.fetched_timestamp >= article_validity.valid_from
+                  AND (article_validity.valid_to IS NULL
+                       OR fetch.fetched_timestamp < article_validity.valid_to)
+                ), last_seen)
+            """
+            )
+    total, = con.execute('SELECT COUNT(*) FROM article_validity').fetchone()
+    return total
+
+
+if __name__ == '__main__':
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s: %(message)s')
+
+    parser = argparse.ArgumentParser(
+        description='Rebuild the article_validity table from the article and fetch tables'
+        )
+    parser.add_argument('database', help='path to the SQLite database file')
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.database)
+    connection.execute('PRAGMA foreign_keys = ON')
+    apply_schema(connection)
+    logger.info('Recorded validity intervals for %s versions', backfill(connection))
+    connection.close()
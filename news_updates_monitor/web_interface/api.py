@@ -0,0 +1,229 @@
+"""
+
+    ***JSON API***
+    Read-only JSON API for the monitor's database, registered under /api by web_interface.py
+
+    List endpoints are streamed straight from the database cursor a batch of rows at a time, so
+    even the full version history is never loaded into memory. They return a JSON array by
+    default, or newline-delimited JSON (one object per line) with ?format=ndjson. Lists are in
+    ID order and can be read incrementally with ?after=<last ID seen> and ?limit=.
+
+        /api/articles               tracked URLs with their counters
+        /api/article?url=           one URL, with a summary of each of its versions
+        /api/versions[?url=]        every stored version (add ?raw_html=1 for the raw HTML)
+        /api/versions/<article_id>  a single version
+        /api/fetches[?url=]         every fetch
+        /api/changes[?url=]         the change statistics for every new version
+
+"""
+
+import json
+
+from flask import Blueprint, current_app, request, abort, jsonify
+from werkzeug.exceptions import HTTPException
+
+from db import get_db
+
+
+api = Blueprint('api', __name__, url_prefix='/api')
+
+# Rows fetched from the cursor (and sent to the client) at a time
+STREAM_BATCH_SIZE = 500
+
+# Boolean as INT columns, returned as true/false
+BOOLEAN_COLUMNS = {
+    'parse_errors', 'changed', 'headline_changed', 'body_changed', 'byline_changed',
+    'timestamp_changed'
+    }
+
+VERSION_COLUMNS = (
+    'article_id, url, fetched_timestamp, headline, body, byline, _timestamp, parse_errors'
+    )
+
+
+@api.errorhandler(HTTPException)
+def json_error(e):
+    """ Returns API errors as JSON rather than the default HTML error page """
+    return jsonify({'error': e.name, 'description': e.description}), e.code
+
+def row_to_dict(fields, row):
+    """ Converts a row tuple to a dict, turning Boolean as INT columns into real Booleans """
+    item = dict(zip(fields, row))
+    for field in BOOLEAN_COLUMNS.intersection(item):
+        if item[field] is not None:
+            item[field] = bool(item[field])
+    return item
+
+def get_list_args():
+    """ Reads the ?format=, ?after= and ?limit= arguments shared by the list endpoints
+        Returns (format, after, limit) - after defaults to 0 and limit to -1 (no limit)
+    """
+    fmt = request.args.get('format', 'json')
+    if fmt not in ('json', 'ndjson'):
+        abort(400, description='format must be json or ndjson')
+    try:
+        after = int(request.args.get('after', 0))
+        limit = int(request.args.get('limit', -1))
+    except ValueError:
+        abort(400, description='after and limit must be integers')
+    return fmt, after, limit
+
+def stream_query(sql, params=()):
+    """ Runs a list query and streams the results in the requested format
+        sql = string; must filter on its ID column with '> ?' and end with 'LIMIT ?' - the
+              ?after= and ?limit= values are appended to params
+        Returns a streamed Response
+    """
+    fmt, after, limit = get_list_args()
+    con = get_db()
+    cursor = con.execute(sql, params + (after, limit))
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+    return current_app.response_class(stream_rows(cursor, fmt), mimetype=mimetype)
+
+def stream_rows(cursor, fmt):
+    """ Yields the cursor's rows as JSON text a batch at a time, then closes the cursor (the
+        connection is reused, so the query mustn't be left part way through)
+    """
+    fields = [column[0] for column in cursor.description]
+    separator = '\n' if fmt == 'ndjson' else ',\n'
+    try:
+        if fmt == 'json':
+            yield '[\n'
+        first = True
+        while True:
+            rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+            if not rows:
+                break
+            chunk = separator.join(json.dumps(row_to_dict(fields, row)) for row in rows)
+            if fmt == 'ndjson':
+                yield chunk + '\n'
+            else:
+                yield chunk if first else separator + chunk
+            first = False
+        if fmt == 'json':
+            yield '\n]\n'
+    finally:
+        cursor.close()
+
+def url_filter(column):
+    """ Returns (sql, params) for an optional ?url= filter on the given column """
+    url = request.args.get('url')
+    if url is None:
+        return '1', ()
+    return f'{column} = ?', (url,)
+
+
+@api.route('/articles')
+def articles():
+    """ Every tracked URL with its schedule level, counters and latest version's ID
+        id is the tracking table's rowid, for use with ?after=
+    """
+    return stream_query(
+        """
+        SELECT tracking.rowid AS id, tracking.url, tracking.schedule_level,
+               COALESCE(url_summary.snapshots, 0) AS snapshots,
+               COALESCE(url_summary.fetches, 0) AS fetches,
+               (SELECT MAX(article_id) FROM article WHERE article.url = tracking.url)
+                   AS latest_article_id
+        FROM tracking
+        LEFT JOIN url_summary ON (url_summary.url = tracking.url)
+        WHERE tracking.rowid > ?
+        ORDER BY tracking.rowid
+        LIMIT ?
+        """
+        )
+
+@api.route('/article')
+def article():
+    """ One tracked URL (?url=) with a summary of each stored version, oldest first """
+    url = request.args.get('url')
+    con = get_db()
+    cursor = con.execute(
+        """
+        SELECT tracking.url, tracking.schedule_level,
+               COALESCE(url_summary.snapshots, 0) AS snapshots,
+               COALESCE(url_summary.fetches, 0) AS fetches
+        FROM tracking
+        LEFT JOIN url_summary ON (url_summary.url = tracking.url)
+        WHERE tracking.url = ?
+        """, (url,)
+        )
+    fields = [column[0] for column in cursor.description]
+    row = cursor.fetchone()
+    if row is None:
+        abort(404, description='URL is not tracked')
+    result = row_to_dict(fields, row)
+    cursor = con.execute(
+        """
+        SELECT article_id, fetched_timestamp, headline, parse_errors
+        FROM article
+        WHERE url = ?
+        ORDER BY article_id
+        """, (url,)
+        )
+    fields = [column[0] for column in cursor.description]
+    result['versions'] = [
+        dict(row_to_dict(fields, row), version=version)
+        for version, row in enumerate(cursor, start=1)
+        ]
+    return jsonify(result)
+
+@api.route('/versions')
+def versions():
+    """ Every stored version (optionally only for ?url=), without the raw HTML unless
+        ?raw_html=1 is given
+    """
+    columns = VERSION_COLUMNS
+    if request.args.get('raw_html') == '1':
+        columns += ', raw_html'
+    where, params = url_filter('url')
+    return stream_query(
+        f"""
+        SELECT {columns}
+        FROM article
+        WHERE {where} AND article_id > ?
+        ORDER BY article_id
+        LIMIT ?
+        """, params
+        )
+
+@api.route('/versions/<int:article_id>')
+def version(article_id):
+    """ A single stored version, including its raw HTML """
+    con = get_db()
+    cursor = con.execute(
+        f'SELECT {VERSION_COLUMNS}, raw_html FROM article WHERE article_id = ?', (article_id,)
+        )
+    fields = [column[0] for column in cursor.description]
+    row = cursor.fetchone()
+    if row is None:
+        abort(404, description='No version with that article_id')
+    return jsonify(row_to_dict(fields, row))
+
+@api.route('/fetches')
+def fetches():
+    """ Every fetch (optionally only for ?url=) """
+    where, params = url_filter('url')
+    return stream_query(
+        f"""
+        SELECT fetch_id, url, schedule_level, fetched_timestamp, status, changed, article_id
+        FROM fetch
+        WHERE {where} AND fetch_id > ?
+        ORDER BY fetch_id
+        LIMIT ?
+        """, params
+        )
+
+@api.route('/changes')
+def changes():
+    """ The change statistics recorded for every new version (optionally only for ?url=) """
+    where, params = url_filter('url')
+    return stream_query(
+        f"""
+        SELECT *
+        FROM article_change
+        WHERE {where} AND article_id > ?
+        ORDER BY article_id
+        LIMIT ?
+        """, params
+        )
@@ -0,0 +1,36 @@
+"""
+
+    ***Database connections***
+    Per-thread connection reuse for the web interface
+
+    Opening an SQLite connection (and having it read the schema) on every request adds up once
+    the site is busy, so each worker thread keeps one read-only connection to the monitor's
+    database and reuses it for every request it handles. The web interface never writes to the
+    monitor's database, so the connections are opened with PRAGMA query_only as a safeguard.
+
+"""
+
+import sqlite3
+import threading
+
+from flask import current_app
+
+
+_local = threading.local()
+
+
+def get_db():
+    """ Returns this thread's connection to the database in the app's DATABASE config setting,
+        opening it on first use
+    """
+    path = current_app.config['DATABASE']
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    con = connections.get(path)
+    if con is None:
+        con = sqlite3.connect(path, timeout=current_app.config['DATABASE_TIMEOUT'])
+        con.execute('PRAGMA foreign_keys = ON')
+        con.execute('PRAGMA query_only = ON')
+        connections[path] = con
+    return con
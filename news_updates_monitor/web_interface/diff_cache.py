@@ -0,0 +1,167 @@
+"""
+
+    ***Diff Cache***
+    Two-level cache for the rendered diff tables shown on the /compare page
+
+    Article snapshots never change once stored, so the diff between two article IDs is always the
+    same and only needs working out once. Level 1 is a small in-process LRU (an OrderedDict), and
+    level 2 is a separate SQLite file on disk that survives restarts and is shared between worker
+    processes. The disk cache is kept under a maximum size by evicting the least recently used
+    entries.
+
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+logger = logging.getLogger(__name__)
+
+
+class DiffCache():
+    """ A bounded in-memory LRU in front of a size-limited on-disk SQLite cache
+        Keys are tuples (e.g. (id_a, id_b)), values are lists of strings (the rendered diff tables)
+    """
+
+    def __init__(self, path, max_entries=256, max_bytes=200*1024*1024):
+        """
+        path = string; location of the SQLite cache file (created if it doesn't exist)
+        max_entries = integer; number of entries kept in the in-memory LRU
+        max_bytes = integer; total size of the cached values allowed on disk before eviction
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            }
+        self._lru = OrderedDict()
+        # Flask's server (and most WSGI servers) handle requests in threads
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        con = self._connect()
+        con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS diff_cache (
+              cache_key TEXT NOT NULL PRIMARY KEY,
+              value TEXT,
+              size INTEGER,
+              last_used REAL
+            )
+            """
+            )
+        con.execute('CREATE INDEX IF NOT EXISTS diff_cache_last_used ON diff_cache(last_used)')
+        con.commit()
+        con.close()
+
+    def _connect(self):
+        """ Opens a connection to the cache file - short timeout as the cache is only an
+            optimisation and it's better to skip it than hold up the page
+        """
+        return sqlite3.connect(self.path, timeout=1)
+
+    def get(self, key):
+        """ Returns the cached value for key, or None if it isn't cached anywhere """
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return self._lru[key]
+
+        cache_key = json.dumps(key)
+        try:
+            con = self._connect()
+            row = con.execute(
+                'SELECT value FROM diff_cache WHERE cache_key = ?', (cache_key,)
+                ).fetchone()
+            if row is not None:
+                con.execute(
+                    'UPDATE diff_cache SET last_used = ? WHERE cache_key = ?',
+                    (time.time(), cache_key)
+                    )
+                con.commit()
+            con.close()
+        except sqlite3.Error as e:
+            logger.error('Diff cache read error: %s', e)
+            row = None
+
+        with self._lock:
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['disk_hits'] += 1
+            value = json.loads(row[0])
+            self._remember(key, value)
+            return value
+
+    def put(self, key, value):
+        """ Stores value in both levels of the cache, then evicts from disk if it's over size """
+        with self._lock:
+            self._remember(key, value)
+
+        data = json.dumps(value)
+        try:
+            con = self._connect()
+            con.execute(
+                'INSERT OR REPLACE INTO diff_cache VALUES (?, ?, ?, ?)',
+                (json.dumps(key), data, len(data), time.time())
+                )
+            con.commit()
+            self._evict(con)
+            con.close()
+        except sqlite3.Error as e:
+            logger.error('Diff cache write error: %s', e)
+
+    def _remember(self, key, value):
+        """ Adds to the in-memory LRU, dropping the least recently used entry if it's full
+            Caller must hold self._lock
+        """
+        self._lru[key] = value
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def _evict(self, con):
+        """ Deletes the least recently used disk entries until the total size is under max_bytes """
+        total, = con.execute('SELECT COALESCE(SUM(size), 0) FROM diff_cache').fetchone()
+        if total <= self.max_bytes:
+            return
+        cursor = con.execute('SELECT cache_key, size FROM diff_cache ORDER BY last_used')
+        to_delete = []
+        for cache_key, size in cursor:
+            if total <= self.max_bytes:
+                break
+            to_delete.append((cache_key,))
+            total -= size
+        con.executemany('DELETE FROM diff_cache WHERE cache_key = ?', to_delete)
+        con.commit()
+        with self._lock:
+            self.stats['evictions'] += len(to_delete)
+        logger.debug('Evicted %s entries from the diff cache', len(to_delete))
+
+    def get_stats(self):
+        """ Returns a dict of the hit/miss counters plus the current size of each level """
+        with self._lock:
+            stats = dict(self.stats)
+            stats['memory_entries'] = len(self._lru)
+        try:
+            con = self._connect()
+            stats['disk_entries'], stats['disk_bytes'] = con.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM diff_cache'
+                ).fetchone()
+            con.close()
+        except sqlite3.Error as e:
+            logger.error('Diff cache read error: %s', e)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0
+        return stats
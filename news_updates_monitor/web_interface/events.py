@@ -0,0 +1,222 @@
+"""
+
+    ***Change events***
+    Pushes newly stored article versions to the browser as server-sent events (see /events in
+    web_interface.py)
+
+    The monitor's change_log table gets a row for every version it stores (via a trigger, see
+    db_schema.sql). One background thread per web interface process watches it using a single
+    connection: each tick it checks PRAGMA data_version, which only changes when another
+    connection has committed something, and only then looks for new change_log rows. Any new
+    events are handed to every connected client's queue, so the database cost is the same however
+    many clients are connected.
+
+    Each open stream ties up a thread of the WSGI server, so streams are closed after max_seconds.
+    The browser reconnects by itself a few seconds later, sending the ID of the last event it saw,
+    and carries on from there without missing anything.
+
+"""
+
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+CHANGE_LOG_FIELDS = ('change_id', 'article_id', 'url', 'kind', 'headline', 'fetched_timestamp')
+
+
+def read_changes(con, after, limit=-1):
+    """ Returns the change_log rows after the given change_id (oldest first) as dicts """
+    cursor = con.execute(
+        f"""
+        SELECT {', '.join(CHANGE_LOG_FIELDS)}
+        FROM change_log
+        WHERE change_id > ?
+        ORDER BY change_id
+        LIMIT ?
+        """, (after, limit)
+        )
+    return [dict(zip(CHANGE_LOG_FIELDS, row)) for row in cursor]
+
+def format_event(change):
+    """ Formats a change_log row as a server-sent event, using the change_id as the event ID so
+        a reconnecting browser sends it back in the Last-Event-ID header
+    """
+    return (
+        f"id: {change['change_id']}\n" +
+        f"event: {change['kind']}\n" +
+        f'data: {json.dumps(change)}\n\n'
+        )
+
+
+class ChangeBroadcaster():
+    """ Watches the change_log table from a single background thread and fans new changes out to
+        every subscribed client
+    """
+
+    def __init__(self, path, poll_interval=1.0, queue_size=1000):
+        """
+        path = string; location of the monitor's SQLite database
+        poll_interval = float; seconds between checks for new changes
+        queue_size = integer; changes a client can fall behind by before it's disconnected (it
+                     will reconnect and catch up from its Last-Event-ID)
+        """
+        self.path = path
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self):
+        """ Registers a new client, starting the background thread if it isn't running yet
+            Returns the client's queue.Queue of change dicts (None means it has been dropped)
+        """
+        client = queue.Queue(self.queue_size)
+        with self._lock:
+            self._subscribers.add(client)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='change-broadcaster', daemon=True
+                    )
+                self._thread.start()
+        return client
+
+    def unsubscribe(self, client):
+        """ Removes a client's queue, e.g. once its connection has closed """
+        with self._lock:
+            self._subscribers.discard(client)
+
+    def _run(self):
+        """ Background thread: one cheap check per tick, and one query when something changed """
+        con = sqlite3.connect(self.path)
+        try:
+            # Only changes from now on are broadcast - clients catch up on anything older
+            # themselves (see catch_up())
+            last_change_id, = con.execute(
+                'SELECT COALESCE(MAX(change_id), 0) FROM change_log'
+                ).fetchone()
+            data_version = None
+            while True:
+                with self._lock:
+                    if not self._subscribers:
+                        self._thread = None
+                        return
+                version, = con.execute('PRAGMA data_version').fetchone()
+                if version != data_version:
+                    data_version = version
+                    changes = read_changes(con, last_change_id)
+                    if changes:
+                        last_change_id = changes[-1]['change_id']
+                        self._publish(changes)
+                time.sleep(self.poll_interval)
+        except sqlite3.Error as e:
+            logger.error('Change broadcaster stopped: %s', e)
+            with self._lock:
+                self._thread = None
+                # Wake every client so they disconnect (and reconnect) rather than wait forever
+                for client in self._subscribers:
+                    self._drop(client)
+                self._subscribers.clear()
+        finally:
+            con.close()
+
+    def _publish(self, changes):
+        """ Puts the changes on every client's queue, dropping any client that has fallen too
+            far behind
+        """
+        with self._lock:
+            for client in list(self._subscribers):
+                try:
+                    for change in changes:
+                        client.put_nowait(change)
+                except queue.Full:
+                    logger.info('Dropping an events client that has fallen behind')
+                    self._subscribers.discard(client)
+                    self._drop(client)
+
+    @staticmethod
+    def _drop(client):
+        """ Empties a client's queue and tells it to disconnect """
+        while True:
+            try:
+                client.get_nowait()
+            except queue.Empty:
+                break
+        client.put_nowait(None)
+
+    def stream(self, last_event_id=None, keepalive=15, max_seconds=300):
+        """ Generator of server-sent event text for one client, which runs until the client
+            disconnects, is dropped for falling behind, or has been connected for max_seconds
+            last_event_id = integer or None; the last change_id the client saw, if it's
+                            reconnecting. Anything it missed is sent first.
+            keepalive = integer; seconds without a change before sending a comment line, so
+                        proxies don't close the connection as idle
+            max_seconds = float; how long before the stream is closed, freeing up its thread
+        """
+        client = self.subscribe()
+        finish = time.monotonic() + max_seconds
+        last_sent = last_event_id
+        try:
+            # Tell the browser how long to wait before reconnecting (in ms)
+            yield 'retry: 5000\n\n'
+            if last_sent is None:
+                # An ID with no data sets the browser's Last-Event-ID without firing an event, so
+                # after the stream is closed it reconnects from here even if nothing has changed
+                last_sent = self.latest_change_id()
+                yield f'id: {last_sent}\n\n'
+            else:
+                for change in self.catch_up(last_sent):
+                    last_sent = change['change_id']
+                    yield format_event(change)
+            while True:
+                remaining = finish - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    change = client.get(timeout=min(keepalive, remaining))
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if change is None:
+                    return
+                if change['change_id'] <= last_sent:
+                    # Already sent during the catch up
+                    continue
+                if change['change_id'] > last_sent + 1:
+                    # Something may have been missed between the catch up and the broadcaster
+                    # starting - fill it in from the table (change_ids can also skip the rows
+                    # ingest.py deletes, in which case there's nothing to fill in)
+                    for missed in self.catch_up(last_sent):
+                        if missed['change_id'] >= change['change_id']:
+                            break
+                        yield format_event(missed)
+                last_sent = change['change_id']
+                yield format_event(change)
+        finally:
+            self.unsubscribe(client)
+
+    def latest_change_id(self):
+        """ Returns the newest change_id (0 if there are none), for a client connecting for the
+            first time
+        """
+        con = sqlite3.connect(self.path)
+        try:
+            return con.execute('SELECT COALESCE(MAX(change_id), 0) FROM change_log').fetchone()[0]
+        finally:
+            con.close()
+
+    def catch_up(self, after, limit=1000):
+        """ Returns the changes after a client's Last-Event-ID, from a short-lived connection
+            (only used when a client reconnects, not on every tick)
+        """
+        con = sqlite3.connect(self.path)
+        try:
+            return read_changes(con, after, limit)
+        finally:
+            con.close()
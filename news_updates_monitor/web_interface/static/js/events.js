@@ -0,0 +1,51 @@
+// Shows a notice on the homepage when the monitor stores new articles or versions, using the
+// /events server-sent events stream (so there's no need to keep reloading the page). The stream
+// is only opened once "Watch for changes" is clicked, as each one ties up a server thread.
+(function () {
+  'use strict';
+  const notice = document.getElementById('live-changes');
+  if (!notice || !window.EventSource) {
+    return;
+  }
+  const button = notice.querySelector('button');
+  const list = notice.querySelector('ul');
+  const summary = notice.querySelector('span');
+  const counts = {new: 0, changed: 0};
+  let source = null;
+
+  function show(event) {
+    const change = JSON.parse(event.data);
+    counts[change.kind] += 1;
+    summary.textContent = 'Since you started watching: ' + counts.new + ' new article(s) and ' +
+      counts.changed + ' updated article(s). Reload to see them in the list.';
+    const item = document.createElement('li');
+    const link = document.createElement('a');
+    link.href = notice.dataset.articleUrl + '?url=' + encodeURIComponent(change.url);
+    link.textContent = (change.kind === 'new' ? 'New: ' : 'Changed: ') +
+      (change.headline || change.url);
+    item.appendChild(link);
+    list.insertBefore(item, list.firstChild);
+    // Only the latest few are listed
+    while (list.children.length > 10) {
+      list.removeChild(list.lastChild);
+    }
+  }
+
+  button.addEventListener('click', function () {
+    if (source === null) {
+      // The server closes the stream every few minutes and the browser reconnects by itself,
+      // sending the last event ID it saw so nothing is missed
+      source = new EventSource(notice.dataset.eventsUrl);
+      source.addEventListener('new', show);
+      source.addEventListener('changed', show);
+      button.textContent = 'Stop watching';
+      if (!summary.textContent) {
+        summary.textContent = 'Watching for new and updated articles...';
+      }
+    } else {
+      source.close();
+      source = null;
+      button.textContent = 'Watch for changes';
+    }
+  });
+}());
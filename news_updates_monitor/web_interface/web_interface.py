@@ -3,6 +3,12 @@
     ***Web Interface***
     This is the web-based GUI for the database that monitor.py maintains
 
+    For development, run this file directly to use Flask's debug server. In production, serve
+    wsgi.py with a WSGI server instead (see the README), e.g.
+        gunicorn -w 4 --threads 4 -b 0.0.0.0:8000 wsgi:app
+    Settings can be overridden from an ini file (see config.ini.sample) or environment variables
+    starting with WEB_INTERFACE_, see configure_app().
+
 """
 
 import logging
@@ -10,199 +16,551 @@ from logging.handlers import TimedRotatingFileHandler
 import sqlite3
 import difflib
 import sys
-import math
-from datetime import datetime
+import os
+import gzip
+import hashlib
+import configparser
+from functools import lru_cache
+from datetime import datetime, timezone, timedelta
+
+from flask import Flask, render_template, stream_template, request, abort, jsonify, make_response
+from markupsafe import escape
 
-from flask import Flask, render_template, request
+# Paths in the config are relative to this folder, wherever the server is started from
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Disabling Pylint here as it's a false positive from the system path hack
 # pylint: disable-next=wrong-import-position
-sys.path.append('..')
+sys.path.append(os.path.join(BASE_DIR, '..'))
 # Disabling Pylint as it cannot detect the system path hacked local module
 # pylint: disable-next=import-error
-from article import table_row_to_article, dict_factory
+from article import Article, dict_factory
+# pylint: disable-next=import-error
+from counters import get_totals, get_url_counts
+# pylint: disable-next=import-error
+from diff_cache import DiffCache
+# pylint: disable-next=import-error
+from api import api
+# pylint: disable-next=import-error
+from db import get_db
+# pylint: disable-next=import-error
+from events import ChangeBroadcaster
+# pylint: disable-next=import-error
+import article_diff
+# pylint: disable-next=import-error
+from search import search as search_articles, SEARCH_MODES, strip_html
+# pylint: disable-next=import-error
+from validity import parse_timestamp, version_as_of, articles_as_of
+# pylint: disable-next=import-error
+from profiling import Profiler, ProfiledApp
+# pylint: disable-next=import-error
+from minhash import also_published_as
 
 
 app = Flask(__name__)
+app.register_blueprint(api)
+# The monitor's database, and seconds to wait for the monitor to finish writing before giving up
+app.config['DATABASE'] = '../monitor/test_db/news_updates_monitor.sqlite3'
+app.config['DATABASE_TIMEOUT'] = 5.0
+# Folder for the daily debug and info logs
+app.config['LOG_DIR'] = 'log'
+# Opt-in profiling (see profiling.py): requests taking longer than PROFILE_THRESHOLD seconds have
+# their profile and top PROFILE_TOP functions saved in PROFILE_DIR, keeping the newest PROFILE_KEEP
+app.config['PROFILE_REQUESTS'] = False
+app.config['PROFILE_THRESHOLD'] = 1.0
+app.config['PROFILE_DIR'] = 'log/profiles'
+app.config['PROFILE_TOP'] = 30
+app.config['PROFILE_KEEP'] = 50
+# Default number of rows on paginated pages, can be overridden with ?per_page= up to the maximum
+app.config['ROWS_PER_PAGE'] = 100
+app.config['MAX_ROWS_PER_PAGE'] = 1000
+# Fetch history rows are small, so /fetch_history shows more of them per page
+app.config['FETCH_HISTORY_ROWS_PER_PAGE'] = 500
+# Rendered /compare diffs: entries kept in memory, and the on-disk cache file and its size limit
+app.config['DIFF_CACHE_ENTRIES'] = 256
+app.config['DIFF_CACHE_PATH'] = 'cache/diff_cache.sqlite3'
+app.config['DIFF_CACHE_BYTES'] = 200 * 1024 * 1024
+# Default diff engine for /compare: 'words' (article_diff, word-level) or 'difflib' (line-level)
+app.config['DIFF_ENGINE'] = 'words'
+DIFF_ENGINES = ('words', 'difflib')
+# Settings holding file paths, which configure_app() resolves relative to BASE_DIR
+PATH_SETTINGS = ('DATABASE', 'DIFF_CACHE_PATH', 'LOG_DIR', 'PROFILE_DIR')
+
+# Results per page on /search (ranked by relevance, so pages are numbered rather than keyset)
+app.config['SEARCH_RESULTS_PER_PAGE'] = 20
+
+# Sort options for /most_edited: query string value -> column in the query
+MOST_EDITED_SORTS = {
+    'edits': 'edits',
+    'headlines': 'headline_edits',
+    'chars': 'chars_changed',
+    'paragraphs': 'paragraphs_changed',
+    'latest': 'last_changed',
+    }
+
+# /events: off unless switched on, as every open stream ties up a server thread. Then seconds
+# between checks for new changes, between keepalive comments when idle, and before a stream is
+# closed to free its thread (the browser reconnects and carries on where it left off)
+app.config['EVENTS_ENABLED'] = False
+app.config['EVENTS_POLL_INTERVAL'] = 1.0
+app.config['EVENTS_KEEPALIVE'] = 15
+app.config['EVENTS_MAX_SECONDS'] = 300
+
+# Bump to invalidate every ETag handed out so far (e.g. after changing a template)
+app.config['ETAG_VERSION'] = '1'
+# Responses smaller than this aren't worth gzipping
+app.config['GZIP_MIN_SIZE'] = 1024
+app.config['GZIP_LEVEL'] = 6
+# Static files have a version number in their URL (see static_version()), so they can be cached
+# by the browser for a year - any change to the file changes the URL
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 365 * 24 * 60 * 60
+# A /compare page for two article IDs never changes, so browsers can keep it for a day
+COMPARE_MAX_AGE = 24 * 60 * 60
+COMPRESSIBLE_MIMETYPES = (
+    'text/html', 'text/css', 'text/javascript', 'text/plain', 'application/json'
+    )
+
+# Placeholders for the version numbers in cached diff tables (see compare())
+VERSION_A = '\x00version_a\x00'
+VERSION_B = '\x00version_b\x00'
 
 
 def convert_datetime(val):
     """ Sqlite3 Converter function - ISO 8601 datetime to datetime.datetime object."""
     return datetime.fromisoformat(val.decode())
 
+def get_int_arg(name):
+    """ Returns the named query string argument as an int, or None if missing/not a number """
+    value = request.args.get(name)
+    if value and value.isdigit():
+        return int(value)
+    return None
+
+def keyset_page(con, sql, params, key, descending=True, default_per_page=None):
+    """ Runs one page of a keyset (cursor) paginated query, using the 'after', 'before', 'last'
+        and 'per_page' query string arguments. Unlike LIMIT/OFFSET, SQLite can jump straight to
+        the start of the page using the index on the key, so every page costs the same no matter
+        how deep it is.
+        sql = string; the query must select the key as its first column and contain a {where}
+              placeholder (an SQL condition) and an {order} placeholder (ASC or DESC), followed
+              by a final LIMIT ? which is bound automatically
+        params = tuple; any other bind parameters used by the query
+        key = string; the column the list is ordered by, e.g. 'tracking.rowid'
+        descending = boolean; the order the list is displayed in (True = highest key first)
+        default_per_page = integer; page size when ?per_page= isn't given (default ROWS_PER_PAGE)
+        Returns (rows, pagination) where pagination is a dict for _pagination.html:
+            'after' = key to pass as ?after= for the next page (None if this is the last page)
+            'before' = key to pass as ?before= for the previous page (None if the first page)
+            'per_page' = int; the page size actually used
+    """
+    per_page = get_int_arg('per_page') or default_per_page or app.config['ROWS_PER_PAGE']
+    per_page = max(min(per_page, app.config['MAX_ROWS_PER_PAGE']), 1)
+    after = get_int_arg('after')
+    before = get_int_arg('before')
+    last = request.args.get('last') is not None
+
+    # 'Forwards' is the direction the list is displayed in, 'backwards' is the opposite
+    forwards = ('<', 'DESC') if descending else ('>', 'ASC')
+    backwards = ('>', 'ASC') if descending else ('<', 'DESC')
+
+    # Going backwards (previous page or last page) we query in reverse and flip the results
+    going_backwards = last or (before is not None and after is None)
+    if going_backwards:
+        op, order = backwards
+        cursor_value = None if last else before
+    else:
+        op, order = forwards
+        cursor_value = after
+    if cursor_value is None:
+        where = '1'
+        bind = params + (per_page + 1,)
+    else:
+        where = f'{key} {op} ?'
+        bind = params + (cursor_value, per_page + 1)
+
+    # One extra row tells us whether there's anything beyond this page without a COUNT(*)
+    rows = con.execute(sql.format(where=where, order=order), bind).fetchall()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if going_backwards:
+        rows.reverse()
+        pagination = {
+            'before': rows[0][0] if rows and more else None,
+            'after': rows[-1][0] if rows and not last else None,
+            }
+    else:
+        pagination = {
+            'before': rows[0][0] if rows and after is not None else None,
+            'after': rows[-1][0] if rows and more else None,
+            }
+    pagination['per_page'] = per_page
+    return rows, pagination
+
+def make_etag(*parts):
+    """ Builds a strong ETag from the data the page depends on (e.g. article IDs or counters)
+        plus the query string, so any change to either gives a different ETag
+    """
+    query = sorted(request.args.items(multi=True))
+    key = repr((app.config['ETAG_VERSION'], request.endpoint, query, parts))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def not_modified(etag):
+    """ Returns a 304 Not Modified response if the browser already has this ETag (in either
+        the plain or gzipped form, see compress_response()), otherwise returns None
+    """
+    if request.if_none_match.contains(etag) or request.if_none_match.contains(etag + '-gzip'):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+def cacheable(body, etag, max_age=None):
+    """ Turns a rendered page into a response with its ETag set. Without max_age the browser
+        must check back each time (and will usually get a 304 from not_modified())
+    """
+    response = make_response(body)
+    response.set_etag(etag)
+    if max_age is None:
+        response.cache_control.no_cache = True
+    else:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    return response
+
+@app.after_request
+def compress_response(response):
+    """ Gzips text responses for browsers that accept it (the /compare diff tables in
+        particular compress very well). Streamed and file responses are left alone.
+    """
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    if 'gzip' not in request.accept_encodings:
+        return response
+    data = response.get_data()
+    if len(data) < app.config['GZIP_MIN_SIZE']:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=app.config['GZIP_LEVEL']))
+    response.headers['Content-Encoding'] = 'gzip'
+    # A strong ETag has to be different for each encoding of the same page
+    etag, weak = response.get_etag()
+    if etag is not None:
+        response.set_etag(etag + '-gzip', weak)
+    return response
+
+@lru_cache(maxsize=None)
+def static_version(filename):
+    """ Returns a short version string for a static file, based on its modification time """
+    try:
+        mtime = os.path.getmtime(os.path.join(app.static_folder, filename))
+    except OSError:
+        return '0'
+    return format(int(mtime), 'x')
+
+@app.url_defaults
+def add_static_version(endpoint, values):
+    """ Adds ?v=<version> to every url_for('static', ...) link, so the long cache lifetime on
+        static files never serves an out of date file
+    """
+    if endpoint == 'static' and 'filename' in values:
+        values.setdefault('v', static_version(values['filename']))
+
+def pagination_args(pagination, **kwargs):
+    """ Adds the endpoint and any extra query string arguments (e.g. url) to the pagination dict
+        so _pagination.html can build the links with url_for(). per_page is only carried over if
+        it was set explicitly in the request.
+    """
+    args = dict(kwargs)
+    if request.args.get('per_page') is not None:
+        args['per_page'] = pagination['per_page']
+    pagination['endpoint'] = request.endpoint
+    pagination['args'] = args
+    return pagination
+
 
 @app.route('/')
 def home():
     """ Flask homepage """
     # Contains a list of all unique articles
-    # Basic version will show X per page with a pagination component, latest articles first
-
-    # Count the number of rows in the Tracking table (unique articles)
-    con = sqlite3.connect('../monitor/test_db/news_updates_monitor.sqlite3')
-    con.execute('PRAGMA foreign_keys = ON')
-    cursor = con.execute('SELECT COUNT(*) FROM tracking')
-    total, = cursor.fetchone()
-
-    # hard-coded an arbitrary 100 for now
-    rows_per_page = 100
-    # page requested via the query string
-    page = request.args.get('page')
-    # Validate query string - nothing entered at all defaults to page 1
-    if page and page.isdigit():
-        page = max(int(page), 1)
-    else:
-        page = 1
-
-    # For handling pagination buttons
-    page_prev, page_next = max(page - 1, 1), page + 1
-    # math.ceil because any remainder left must be on its own page, even if only one row
-    total_pages = int(math.ceil(total / rows_per_page))
-    # Ensure requested page isn't too high, return the highest possible if it is
-    page = max(min(page, total_pages), 1)
-    # How many rows to exclude from the beginning of the query, depending on what page we're on
-    offset = (page - 1) * rows_per_page
-    # Make sure page_next can't exceed the total number of pages
-    page_next = min(page + 1, total_pages)
-    # The row number of the first row on the page
-    page_start = offset + 1
-    # The row number of the last row on the page (may have less than the previous full pages)
-    page_end = min(total, page_start + rows_per_page - 1)
-
-    bind = (rows_per_page, offset)
+    # Shows X per page with a pagination component, latest articles first
+
+    # Totals for the Tracking (unique articles), Article and Fetch tables
+    # These are maintained by triggers (see counters.py) so this is a single row lookup
+    con = get_db()
+    total, total_snapshot, total_fetch = get_totals(con)
+
+    # The page only changes when the monitor adds a URL/snapshot/fetch, so the totals double up
+    # as its version
+    etag = make_etag(total, total_snapshot, total_fetch, app.config['EVENTS_ENABLED'])
+    response = not_modified(etag)
+    if response is not None:
+        return response
+
     # All tracking table URLs as well as the number of article snapshots per URL
-    cursor = con.execute(
+    # (URLs with no snapshots yet are left out, as they have nothing to show)
+    rows, pagination = keyset_page(
+        con,
         """
-        SELECT tracking.url, COUNT(*)
-        FROM tracking JOIN article ON (article.url = tracking.url)
-        GROUP BY tracking.url
-        ORDER BY tracking.rowid DESC
+        SELECT tracking.rowid, tracking.url, url_summary.snapshots
+        FROM tracking JOIN url_summary ON (url_summary.url = tracking.url)
+        WHERE url_summary.snapshots > 0 AND {where}
+        ORDER BY tracking.rowid {order}
         LIMIT ?
-        OFFSET ?
-        """
-        , bind
+        """,
+        (),
+        'tracking.rowid'
         )
-    article_urls = cursor.fetchall()
-
-    cursor = con.execute('SELECT COUNT(*) FROM article')
-    total_snapshot, = cursor.fetchone()
-
-    cursor = con.execute('SELECT COUNT(*) FROM fetch')
-    total_fetch, = cursor.fetchone()
-
+    # Drop the rowid now it's been used for the pagination cursors
+    article_urls = [row[1:] for row in rows]
 
     # TODO: add logic for if the database is empty (i.e the first run)
 
-    con.close()
 
-    return render_template(
+    return cacheable(render_template(
         'index.html',
         total=total,
-        page=page,
-        total_pages=total_pages,
-        offset=offset, # debug only
-        page_prev=page_prev,
-        page_next=page_next,
-        page_start=page_start,
-        page_end=page_end,
+        pagination=pagination_args(pagination),
         article_urls=article_urls,
         total_snapshot=total_snapshot,
-        total_fetch=total_fetch
-        )
+        total_fetch=total_fetch,
+        events_enabled=app.config['EVENTS_ENABLED']
+        ), etag)
 
 @app.route('/article')
 def article():
     """ Article page - one per unique article URL """
-    con = sqlite3.connect('../monitor/test_db/news_updates_monitor.sqlite3')
-    con.execute('PRAGMA foreign_keys = ON')
-    con.row_factory = dict_factory
     url = request.args.get('url')
+    con = get_db()
+    details = get_article_details(con, url)
 
-    cursor = con.execute(
-            'SELECT * FROM article WHERE url = ? ORDER BY article_id DESC LIMIT 1', (url,)
-            )
-    row = cursor.fetchone()
-
-    if row is None:
+    if details is None:
         return render_template('article.html')
 
-    latest_article = table_row_to_article(row)
-    con.close()
+    # Everything on the page changes with the URL's counters or its schedule_level, apart from
+    # the other URLs it was published as, which can only change when a version is stored (new
+    # signatures, or new headlines for them). Both are rowid lookups, so a 304 stays cheap.
+    latest_versions = con.execute(
+        """
+        SELECT (SELECT MAX(article_id) FROM article), (SELECT MAX(article_id) FROM article_minhash)
+        """
+        ).fetchone()
+    etag = make_etag(
+        details['snapshots'], details['fetches'], details['schedule_level'], tuple(latest_versions)
+        )
+    response = not_modified(etag)
+    if response is not None:
+        return response
+
+    # Other URLs the same story was published under (see minhash.py)
+    also_published = also_published_as(con, url)
+    return cacheable(
+        render_template('article.html', also_published=also_published, **details), etag
+        )
 
-    # Open a new connection without dict_factory
-    con = sqlite3.connect('../monitor/test_db/news_updates_monitor.sqlite3')
-    con.execute('PRAGMA foreign_keys = ON')
-    cursor = con.execute(
-            'SELECT COUNT(*) FROM article WHERE url = ?', (url,)
-            )
-    snapshots, = cursor.fetchone()
-    cursor = con.execute(
-            'SELECT COUNT(*) FROM fetch WHERE url = ?', (url,)
-            )
-    fetches, = cursor.fetchone()
-    cursor = con.execute(
-            'SELECT article_id FROM article WHERE url = ?', (url,)
-            )
-    article_ids = []
-    for row in cursor:
-        article_ids += row
+def get_article_details(con, url):
+    """ Fetches everything the article page needs in a single query: the latest snapshot's
+        parsed fields (but not its body or raw_html, which the page doesn't show), the snapshot
+        and fetch counters, the schedule_level, and every article_id for the URL in order
+        Returns a dict of template variables, or None if there are no snapshots for the URL
+        con = sqlite3.Connection object
+        url = string
+    """
+    row = con.execute(
+        """
+        SELECT latest.fetched_timestamp, latest.headline, latest.byline, latest._timestamp,
+               latest.parse_errors, url_summary.snapshots, url_summary.fetches,
+               tracking.schedule_level,
+               (SELECT group_concat(article_id) FROM (
+                   SELECT article_id FROM article WHERE url = tracking.url ORDER BY article_id
+                   )) AS article_ids
+        FROM tracking
+        LEFT JOIN url_summary ON (url_summary.url = tracking.url)
+        JOIN article AS latest ON (latest.article_id = (
+            SELECT MAX(article_id) FROM article WHERE url = tracking.url
+            ))
+        WHERE tracking.url = ?
+        """, (url,)
+        ).fetchone()
+    if row is None:
+        return None
+    (fetched_timestamp, headline, byline, _timestamp, parse_errors, snapshots, fetches,
+     schedule_level, article_ids) = row
 
+    latest_article = Article(
+        url=url,
+        fetched_timestamp=fetched_timestamp,
+        parsed={
+            'headline': headline,
+            'body': None,
+            'byline': byline,
+            '_timestamp': _timestamp,
+            'parse_errors': bool(parse_errors)
+            }
+        )
+    article_ids = [int(article_id) for article_id in article_ids.split(',')]
     # Tuple giving version info and article_ids for different comparision versions
     # Format: ( (version_a, version_b), id_a, id_b )
-    compare_ids = []
-    for i in range(len(article_ids) - 1):
-        versions = (i + 1, i + 2)
-        compare_ids.append((versions, article_ids[i], article_ids[i+1]))
-
-    cursor = con.execute(
-            'SELECT schedule_level FROM tracking WHERE url = ?', (url,)
-            )
-    schedule_level, = cursor.fetchone()
-
-    con.close()
-
-    return render_template(
-        'article.html',
-        latest_article=latest_article,
-        snapshots=snapshots,
-        fetches=fetches,
-        schedule_level=schedule_level,
-        article_ids=article_ids,
-        compare_ids=compare_ids
+    compare_ids = [
+        ((i + 1, i + 2), id_a, id_b)
+        for i, (id_a, id_b) in enumerate(zip(article_ids, article_ids[1:]))
+        ]
+    return {
+        'latest_article': latest_article,
+        'snapshots': snapshots,
+        'fetches': fetches,
+        'schedule_level': schedule_level,
+        'article_ids': article_ids,
+        'compare_ids': compare_ids
+        }
+
+@app.route('/article/as_of')
+def article_as_of():
+    """ Shows the version of an article that was live at a given time (?url=&at=, where at is an
+        ISO 8601 date/time, UTC unless it has a timezone)
+    """
+    url = request.args.get('url')
+    at = parse_timestamp(request.args.get('at'))
+    if url is None or at is None:
+        abort(404)
+    con = get_db()
+    validity = version_as_of(con, url, at)
+    if validity is None:
+        return render_template('article_as_of.html', url=url, at=at)
+    # The answer only changes while the version is still the latest (valid_to and last_seen)
+    etag = make_etag(*validity.values())
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    headline, byline, _timestamp, body = con.execute(
+        'SELECT headline, byline, _timestamp, body FROM article WHERE article_id = ?',
+        (validity['article_id'],)
+        ).fetchone()
+
+    return cacheable(
+        render_template(
+            'article_as_of.html',
+            url=url,
+            at=at,
+            validity=validity,
+            headline=headline,
+            byline=byline,
+            _timestamp=_timestamp,
+            # Shown as plain text, one paragraph per line
+            paragraphs=strip_html(body).splitlines()
+            ),
+        etag
         )
 
+@app.route('/as_of')
+def as_of():
+    """ Lists the headline of every article as it was at a given time (?at=), streamed to the
+        browser straight from the article_validity index
+    """
+    at = parse_timestamp(request.args.get('at'))
+    if at is None:
+        return render_template('as_of.html', at=None, articles=[])
+    con = get_db()
+    # A new version can only change the list if it was found before the requested time
+    _, total_snapshots, _ = get_totals(con)
+    etag = make_etag(total_snapshots)
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    articles = close_after(articles_as_of(con, at))
+    return cacheable(stream_template('as_of.html', at=at, articles=articles), etag)
+
+def close_after(cursor):
+    """ Yields the rows of a cursor for a streamed template, then closes the cursor
+        The connection is reused by the next request, so the cursor must not be left part way
+        through its query (which would keep SQLite's read transaction open)
+    """
+    try:
+        yield from cursor
+    finally:
+        cursor.close()
+
 @app.route('/compare')
 def compare():
     """ Compare page - compares one article version to another version
         Recieves query string with 2 article IDs that can be used for comparison
+        Snapshots never change once stored, so the diff tables are cached by article ID pair
+        Optional ?engine= chooses the diff engine (see DIFF_ENGINES)
     """
-    # pylint: disable=too-many-locals
-    #         16/15 is good enough
-    id_a = request.args.get('id_a')
-    id_b = request.args.get('id_b')
+    id_a = get_int_arg('id_a')
+    id_b = get_int_arg('id_b')
     version_a = request.args.get('version_a')
     version_b = request.args.get('version_b')
     url = request.args.get('url')
+    engine = request.args.get('engine', app.config['DIFF_ENGINE'])
+    if id_a is None or id_b is None or engine not in DIFF_ENGINES:
+        abort(404)
+
+    # Snapshots are immutable, so the IDs and query string are all the page depends on
+    etag = make_etag(id_a, id_b, engine)
+    response = not_modified(etag)
+    if response is not None:
+        return response
+
+    diff_cache = get_diff_cache()
+    diff_tables = diff_cache.get((id_a, id_b, engine))
+    if diff_tables is None:
+        diff_tables = build_diff_tables(id_a, id_b, engine)
+        if diff_tables is None:
+            abort(404)
+        diff_cache.put((id_a, id_b, engine), diff_tables)
+
+    # The version numbers only come from the query string so they are swapped in after caching
+    diff_tables = [
+        table.replace(VERSION_A, escape(version_a)).replace(VERSION_B, escape(version_b))
+        for table in diff_tables
+        ]
+
+    return cacheable(render_template(
+        'compare.html',
+        id_a=id_a,
+        id_b=id_b,
+        version_a=version_a,
+        version_b=version_b,
+        url=url,
+        engine=engine,
+        diff_tables=diff_tables,
+        ), etag, max_age=COMPARE_MAX_AGE)
 
-    con = sqlite3.connect('../monitor/test_db/news_updates_monitor.sqlite3')
-    con.execute('PRAGMA foreign_keys = ON')
-    con.row_factory = dict_factory
-    cursor = con.execute("SELECT * FROM article WHERE article_id=?", (id_a,))
-    article_a = table_row_to_article(cursor.fetchone())
-    cursor = con.execute("SELECT * FROM article WHERE article_id=?", (id_b,))
-    article_b = table_row_to_article(cursor.fetchone())
-    con.close()
-
-    parsed_parts = list(article_a.parsed.keys())
-    parsed_parts.remove('parse_errors')
-    diff_tables = []
+def build_diff_tables(id_a, id_b, engine):
+    """ Loads two article snapshots and builds an HTML diff table for each parsed part
+        The descriptions contain the VERSION_A/VERSION_B placeholders rather than version numbers
+        engine = string; 'words' for article_diff or 'difflib' for difflib.HtmlDiff
+        Returns a list of HTML strings, or None if either article ID doesn't exist
+    """
+    # The connection is shared, so only this cursor gets dict rows
+    cursor = get_db().cursor()
+    cursor.row_factory = dict_factory
+    # Only the parsed columns are needed (raw_html in particular can be large)
+    query = """
+        SELECT headline, body, byline, _timestamp
+        FROM article WHERE article_id = ?
+        """
+    row_a = cursor.execute(query, (id_a,)).fetchone()
+    row_b = cursor.execute(query, (id_b,)).fetchone()
+    if row_a is None or row_b is None:
+        return None
 
-    for part in parsed_parts:
-        snapshot_a = article_a.parsed[part]
+    diff_tables = []
+    for part in row_a:
+        fromdesc = f'{part.strip('_').title()} Version {VERSION_A}'
+        todesc = f'{part.strip('_').title()} Version {VERSION_B}'
+        if engine == 'words':
+            diff_tables.append(article_diff.make_table(row_a[part], row_b[part], fromdesc, todesc))
+            continue
+        snapshot_a = row_a[part]
         if snapshot_a is not None:
             snapshot_a = snapshot_a.splitlines()
         else:
             snapshot_a = ['']
-        snapshot_b = article_b.parsed[part]
+        snapshot_b = row_b[part]
         if snapshot_b is not None:
             snapshot_b = snapshot_b.splitlines()
         else:
@@ -211,83 +569,319 @@ def compare():
         diff_table = d.make_table(
             snapshot_a,
             snapshot_b,
-            fromdesc=f'{part.strip('_').title()} Version {version_a}',
-            todesc=f'{part.strip('_').title()} Version {version_b}'
+            fromdesc=fromdesc,
+            todesc=todesc
             )
         diff_tables.append(diff_table)
+    return diff_tables
+
+def get_diff_cache():
+    """ Returns the app's DiffCache, creating it from the app config on first use """
+    if 'diff_cache' not in app.extensions:
+        app.extensions['diff_cache'] = DiffCache(
+            app.config['DIFF_CACHE_PATH'],
+            max_entries=app.config['DIFF_CACHE_ENTRIES'],
+            max_bytes=app.config['DIFF_CACHE_BYTES']
+            )
+    return app.extensions['diff_cache']
+
+@app.route('/events')
+def events():
+    """ Server-sent events stream of new articles ('new' events) and new versions of existing
+        articles ('changed' events) as the monitor stores them. Each event's data is the JSON
+        change_log row. Browsers reconnecting with a Last-Event-ID header are sent anything they
+        missed first. Each stream is closed after EVENTS_MAX_SECONDS, and the browser reconnects.
+    """
+    if not app.config['EVENTS_ENABLED']:
+        abort(404)
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        last_event_id = None
+    response = app.response_class(
+        get_broadcaster().stream(
+            last_event_id, app.config['EVENTS_KEEPALIVE'], app.config['EVENTS_MAX_SECONDS']
+            ),
+        mimetype='text/event-stream'
+        )
+    response.cache_control.no_cache = True
+    # Stops nginx (if used as a reverse proxy) from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def get_broadcaster():
+    """ Returns the app's ChangeBroadcaster, creating it from the app config on first use """
+    if 'broadcaster' not in app.extensions:
+        app.extensions['broadcaster'] = ChangeBroadcaster(
+            app.config['DATABASE'], poll_interval=app.config['EVENTS_POLL_INTERVAL']
+            )
+    return app.extensions['broadcaster']
+
+@app.route('/stats/diff_cache')
+def diff_cache_stats():
+    """ JSON hit/miss counters and sizes for the /compare diff cache """
+    return jsonify(get_diff_cache().get_stats())
+
+@app.route('/most_edited')
+def most_edited():
+    """ Lists the articles with the most changes over the last X days (?days=, 0 = all time)
+        Sortable via ?sort= (see MOST_EDITED_SORTS). Only reads the article_change table.
+    """
+    days = get_int_arg('days')
+    if days is None:
+        days = 7
+    sort = request.args.get('sort')
+    if sort not in MOST_EDITED_SORTS:
+        sort = 'edits'
+    since = ''
+    if days:
+        since = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+
+    con = get_db()
+    # The ORDER BY column comes from MOST_EDITED_SORTS, never straight from the query string
+    cursor = con.execute(
+        f"""
+        SELECT url, COUNT(*) AS edits, SUM(headline_changed) AS headline_edits,
+               SUM(chars_added + chars_removed) AS chars_changed,
+               SUM(paragraphs_added + paragraphs_removed + paragraphs_edited)
+                   AS paragraphs_changed,
+               MAX(changed_timestamp) AS last_changed
+        FROM article_change
+        WHERE changed_timestamp >= ?
+        GROUP BY url
+        ORDER BY {MOST_EDITED_SORTS[sort]} DESC
+        LIMIT ?
+        """, (since, app.config['ROWS_PER_PAGE'])
+        )
+    articles = cursor.fetchall()
 
     return render_template(
-        'compare.html',
-        id_a=id_a,
-        id_b=id_b,
-        version_a=version_a,
-        version_b=version_b,
-        url=url,
-        diff_tables=diff_tables,
+        'most_edited.html', articles=articles, days=days, sort=sort, sorts=MOST_EDITED_SORTS
         )
 
-@app.route('/fetch_history')
-def fetch_history():
-    """ Shows all the fetch timestamps for the given article URL """
-    url = request.args.get('url')
-    con = sqlite3.connect(
-        '../monitor/test_db/news_updates_monitor.sqlite3', detect_types=sqlite3.PARSE_COLNAMES
+@app.route('/headline_changes')
+def headline_changes():
+    """ Lists every recorded headline change, newest first (or oldest first with ?order=oldest)
+        Only reads the article_change table
+    """
+    order = request.args.get('order')
+    if order != 'oldest':
+        order = 'newest'
+    con = get_db()
+    changes, pagination = keyset_page(
+        con,
+        """
+        SELECT article_id, previous_article_id, url, version, changed_timestamp,
+               previous_headline, headline
+        FROM article_change
+        WHERE headline_changed = 1 AND {where}
+        ORDER BY article_id {order}
+        LIMIT ?
+        """,
+        (),
+        'article_id',
+        descending=order == 'newest'
         )
-    con.execute('PRAGMA foreign_keys = ON')
-    cursor = con.execute(
-            """
-            SELECT fetched_timestamp as "fetched_timestamp [datetime]", status, schedule_level
-            FROM fetch
-            WHERE url = ?
-            """, (url,)
-            )
-    fetches = cursor.fetchall()
 
-    # Format the timestamp string
-    fetches_strftime = []
-    for fetch in fetches:
-        new_fetch = []
-        for col in fetch:
-            if isinstance(col, datetime):
-                col = col.strftime('%d %b %Y, %H:%M:%S')
-            new_fetch.append(col)
-        fetches_strftime.append(tuple(new_fetch))
-    fetches = fetches_strftime
+    return render_template(
+        'headline_changes.html',
+        changes=changes,
+        order=order,
+        pagination=pagination_args(pagination, order=order)
+        )
 
-    return render_template('fetch_history.html', url=url, fetches=fetches)
+@app.route('/search')
+def search():
+    """ Full-text search of headlines and bodies (?q=), best match first
+        ?mode= chooses which versions are searched (see search.SEARCH_MODES): only the current
+        version of each article (default), any version, or only superseded versions
+    """
+    text = request.args.get('q', '').strip()
+    mode = request.args.get('mode')
+    if mode not in SEARCH_MODES:
+        mode = 'current'
+    page = max(get_int_arg('page') or 1, 1)
+    per_page = app.config['SEARCH_RESULTS_PER_PAGE']
+
+    con = get_db()
+    # The index only changes when a new version is stored
+    _, total_snapshots, _ = get_totals(con)
+    etag = make_etag(total_snapshots)
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    # One extra result tells us whether there's a next page
+    results = search_articles(con, text, mode, per_page + 1, (page - 1) * per_page)
+    more = len(results) > per_page
+
+    return cacheable(
+        render_template(
+            'search.html',
+            q=text,
+            mode=mode,
+            modes=SEARCH_MODES,
+            results=results[:per_page],
+            page=page,
+            more=more
+            ),
+        etag
+        )
 
+@app.route('/fetch_history')
+def fetch_history():
+    """ Shows the fetch timestamps for the given article URL, oldest first, a page at a time
+        A level 1 article can have thousands of fetches, so the page is streamed to the browser as
+        the rows are read rather than being built up in memory first
+    """
+    url = request.args.get('url')
+    con = get_db()
+    # Fetch rows are never edited once shown, so the page only changes when there's a new fetch
+    etag = make_etag(get_url_counts(con, url))
+    response = not_modified(etag)
+    if response is not None:
+        return response
+
+    # Only the fetch IDs of the page are looked up first (straight from the fetch_url index), so
+    # the pagination links are known before any of the rows are rendered
+    fetch_ids, pagination = keyset_page(
+        con,
+        """
+        SELECT fetch_id
+        FROM fetch
+        WHERE url = ? AND {where}
+        ORDER BY fetch_id {order}
+        LIMIT ?
+        """,
+        (url,),
+        'fetch_id',
+        descending=False,
+        default_per_page=app.config['FETCH_HISTORY_ROWS_PER_PAGE']
+        )
+    if not fetch_ids:
+        fetches = []
+    else:
+        fetches = stream_fetches(con, url, fetch_ids[0][0], fetch_ids[-1][0])
+
+    return cacheable(
+        stream_template(
+            'fetch_history.html',
+            url=url,
+            fetches=fetches,
+            pagination=pagination_args(pagination, url=url)
+            ),
+        etag
+        )
 
-if __name__ == '__main__':
+def stream_fetches(con, url, first_id, last_id):
+    """ Returns a generator of the fetch rows between two fetch IDs (inclusive), straight from
+        the cursor. The timestamp is formatted by SQLite (e.g. 01 Jan 2024, 12:00:00) so there's
+        no datetime parsing per row.
+    """
+    cursor = con.execute(
+        """
+        SELECT strftime('%d ', fetched_timestamp) ||
+               substr('JanFebMarAprMayJunJulAugSepOctNovDec',
+                      strftime('%m', fetched_timestamp) * 3 - 2, 3) ||
+               strftime(' %Y, %H:%M:%S', fetched_timestamp),
+               status, schedule_level
+        FROM fetch
+        WHERE url = ? AND fetch_id BETWEEN ? AND ?
+        ORDER BY fetch_id
+        """, (url, first_id, last_id)
+        )
+    return close_after(cursor)
+
+
+def configure_app(config_file=None):
+    """ Configures the module's app for serving and returns it (see wsgi.py). It's meant to be
+        called once per process: the routes belong to the one module-level app, so calling it
+        again changes that same app rather than making a new one, and only overrides the
+        settings it's given. Paths that have already been resolved are left as they are.
+        Settings are taken from, in order of priority:
+            environment variables starting with WEB_INTERFACE_, e.g. WEB_INTERFACE_DATABASE
+            the [web_interface] section of config_file, or of the file named in the
+                WEB_INTERFACE_CONFIG environment variable
+            the defaults at the top of this file
+        config_file = string; path to an ini file (optional)
+        Returns the configured Flask app
+    """
+    config_file = config_file or os.environ.get('WEB_INTERFACE_CONFIG')
+    if config_file:
+        config = configparser.ConfigParser()
+        if not config.read(config_file, encoding='utf-8'):
+            raise FileNotFoundError(f'Config file not found: {config_file}')
+        if config.has_section('web_interface'):
+            for key, value in config.items('web_interface'):
+                app.config[key.upper()] = convert_setting(app.config.get(key.upper()), value)
+    # Environment variables are parsed as JSON where possible, so numbers come out as numbers
+    app.config.from_prefixed_env('WEB_INTERFACE')
+    app.config.pop('CONFIG', None)
+    for key in PATH_SETTINGS:
+        if not os.path.isabs(app.config[key]):
+            app.config[key] = os.path.join(BASE_DIR, app.config[key])
+
+    # Compile every template now, once per worker, rather than on each worker's first requests
+    # for them, and stop checking the files for changes on every render
+    app.config['TEMPLATES_AUTO_RELOAD'] = False
+    app.jinja_env.auto_reload = False
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+    if app.config['PROFILE_REQUESTS'] and not isinstance(app.wsgi_app, ProfiledApp):
+        app.wsgi_app = ProfiledApp(app.wsgi_app, Profiler(
+            app.config['PROFILE_DIR'], app.config['PROFILE_THRESHOLD'],
+            top=app.config['PROFILE_TOP'], keep=app.config['PROFILE_KEEP']
+            ))
 
-    # Create a logger
+    sqlite3.register_converter("datetime", convert_datetime)
+    return app
+
+def convert_setting(default, value):
+    """ Converts a setting read from the ini file to the same type as its default """
+    if isinstance(default, bool):
+        return value.strip().lower() in ('1', 'yes', 'true', 'on')
+    if isinstance(default, (int, float)):
+        return type(default)(value)
+    return value
+
+def setup_logging(log_dir, console=True):
+    """ Logs to separate INFO and DEBUG files in log_dir - 1 each per day with a 30 day rotating
+        backup - and optionally to the console
+    """
     logger = logging.getLogger()
     logger.setLevel(logging.DEBUG)
 
     formatter = logging.Formatter('%(asctime)s - %(levelname)s: %(message)s')
 
-    # Create separate INFO and DEBUG file logs - 1 each per day with a 30 day rotating backup
+    os.makedirs(os.path.join(log_dir, 'debug'), exist_ok=True)
+    os.makedirs(os.path.join(log_dir, 'info'), exist_ok=True)
     file_handler_debug = TimedRotatingFileHandler(
-        'log/debug/debug.log', encoding='utf-8', when='midnight', backupCount=30, utc=True
+        os.path.join(log_dir, 'debug', 'debug.log'),
+        encoding='utf-8', when='midnight', backupCount=30, utc=True
         )
     file_handler_debug.setLevel(logging.DEBUG)
     file_handler_debug.setFormatter(formatter)
 
     file_handler_info = TimedRotatingFileHandler(
-        'log/info/info.log', encoding='utf-8', when='midnight', backupCount=30, utc=True
+        os.path.join(log_dir, 'info', 'info.log'),
+        encoding='utf-8', when='midnight', backupCount=30, utc=True
         )
     file_handler_info.setLevel(logging.INFO)
     file_handler_info.setFormatter(formatter)
 
-    # Create a stream handler to print logs to the console
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.DEBUG)
-    console_handler.setFormatter(formatter)
-
-    # Add the handlers to the logger
     logger.addHandler(file_handler_debug)
     logger.addHandler(file_handler_info)
-    logger.addHandler(console_handler)
 
-    sqlite3.register_converter("datetime", convert_datetime)
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(logging.DEBUG)
+        console_handler.setFormatter(formatter)
+        logger.addHandler(console_handler)
+
+
+if __name__ == '__main__':
 
+    # Development server only - it's single process, with the reloader and debugger enabled
+    configure_app()
+    setup_logging(app.config['LOG_DIR'])
     app.run(debug=True, host='0.0.0.0')
@@ -0,0 +1,20 @@
+"""
+
+    ***WSGI entry point***
+    The production entry point for the web interface, for use with a multi-worker WSGI server,
+    e.g. from this folder:
+        gunicorn -w 4 --threads 4 -b 0.0.0.0:8000 wsgi:app
+
+    Each worker process imports this once, so the config is read and the templates compiled once
+    per worker. Database connections are opened per thread on first use and then reused (see
+    db.py). Settings come from the file named in WEB_INTERFACE_CONFIG and WEB_INTERFACE_*
+    environment variables, see configure_app() in web_interface.py.
+
+"""
+
+from web_interface import configure_app, setup_logging
+
+
+app = configure_app()
+# Only to the log files - the WSGI server has its own console and access logs
+setup_logging(app.config['LOG_DIR'], console=False)
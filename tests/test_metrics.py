@@ -0,0 +1,55 @@
+"""
+
+    ***Metrics tests***
+    Checks the one line run summary copes with metrics that have nothing recorded yet, as happens
+    on the first run after the monitor starts
+
+    Usage (from the top folder):
+        python -m unittest discover tests
+
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'news_updates_monitor')
+    )
+# Disabling Pylint as it cannot detect the system path hacked local module
+# pylint: disable-next=import-error,wrong-import-position
+import metrics
+
+
+class SummariseCycleTest(unittest.TestCase):
+    """ summarise_cycle() on a run where only the stages were timed, e.g. every request failed or
+        every page was skipped
+    """
+
+    def setUp(self):
+        # Start from a registry with nothing recorded, putting the values back afterwards
+        self.saved = {metric: metric.values for metric in metrics.REGISTRY.metrics}
+        for metric in self.saved:
+            metric.values = {}
+
+    def tearDown(self):
+        for metric, values in self.saved.items():
+            metric.values = values
+
+    def test_only_stages_observed(self):
+        before = metrics.REGISTRY.snapshot()
+        for stage in metrics.STAGES:
+            metrics.STAGE_SECONDS.observe(0.5, stage=stage)
+        summary = metrics.summarise_cycle(before)
+        self.assertIn('discovery 0.5s', summary)
+        self.assertIn('0 responses (none), 0 ms avg', summary)
+        self.assertIn('0 parsed (0 ms avg)', summary)
+
+    def test_nothing_observed(self):
+        before = metrics.REGISTRY.snapshot()
+        summary = metrics.summarise_cycle(before, metrics.REGISTRY.snapshot())
+        self.assertIn('no stages timed', summary)
+
+
+if __name__ == '__main__':
+    unittest.main()